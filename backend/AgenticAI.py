@@ -18,16 +18,31 @@ from jinja2 import Template
 import requests
 from typing import Dict, List, Tuple, Optional, Any
 import logging
+import queue
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import imap_fetch
+import booking_regex
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# en_core_web_sm components extract_booking_details never reads: only the NER DATE
+# entities are used, so the tagger, parser, lemmatizer (and the attribute ruler that
+# feeds it) are not loaded at all
+SPACY_UNUSED_COMPONENTS = ("tagger", "parser", "attribute_ruler", "lemmatizer", "senter")
+
 class EmailParser:
     """
     Parses incoming emails to extract booking request details using NLP techniques.
     """
-    def __init__(self):
+    def __init__(self, checkpoint_path: str = "imap_checkpoint.json", fetch_batch_size: int = 50):
+        self.fetcher = imap_fetch.ImapFetcher(imap_fetch.ImapCheckpoint(checkpoint_path), fetch_batch_size)
+        
         # Download necessary NLTK resources
         try:
             nltk.data.find('tokenizers/punkt')
@@ -38,57 +53,44 @@ class EmailParser:
         except LookupError:
             nltk.download('stopwords')
             
-        # Load spaCy model for NER and other NLP tasks
-        self.nlp = spacy.load("en_core_web_sm")
+        # Load spaCy model for NER, without the components we don't use
+        self.nlp = spacy.load("en_core_web_sm", exclude=list(SPACY_UNUSED_COMPONENTS))
+        # In the small English model NER has its own embedding layer; skip the shared
+        # tok2vec too unless NER listens to it
+        if "tok2vec" in self.nlp.pipe_names and "ner" not in self.nlp.get_pipe("tok2vec").listening_components:
+            self.nlp.disable_pipe("tok2vec")
         
-    def connect_to_email_server(self, email_address: str, password: str, imap_server: str = "imap.gmail.com") -> imaplib.IMAP4_SSL:
+    def connect_to_email_server(self, email_address: str, password: str, imap_server: str = "imap.gmail.com",
+                                port: Optional[int] = None, use_ssl: bool = True) -> imaplib.IMAP4:
         """Connect to the email server and return the connection object."""
-        mail = imaplib.IMAP4_SSL(imap_server)
-        mail.login(email_address, password)
-        return mail
+        return imap_fetch.connect(email_address, password, imap_server, port, use_ssl)
     
-    def fetch_unread_emails(self, mail_connection: imaplib.IMAP4_SSL) -> List[Dict]:
-        """Fetch unread emails from the inbox."""
-        mail_connection.select('inbox')
-        status, data = mail_connection.search(None, 'UNSEEN')
-        email_ids = data[0].split()
-        
-        emails = []
-        for e_id in email_ids:
-            status, data = mail_connection.fetch(e_id, '(RFC822)')
-            raw_email = data[0][1]
-            msg = email.message_from_bytes(raw_email)
-            
-            body = ""
-            if msg.is_multipart():
-                for part in msg.walk():
-                    content_type = part.get_content_type()
-                    if content_type == "text/plain" or content_type == "text/html":
-                        try:
-                            body += part.get_payload(decode=True).decode()
-                        except:
-                            pass
-            else:
-                body = msg.get_payload(decode=True).decode()
-            
-            emails.append({
-                'id': e_id,
-                'from': msg['from'],
-                'to': msg['to'],
-                'subject': msg['subject'],
-                'date': msg['date'],
-                'body': body
-            })
-        
-        return emails
+    def fetch_unread_emails(self, mail_connection: imaplib.IMAP4, mailbox: str = 'inbox') -> List[Dict]:
+        """
+        Fetch the emails that arrived since the last poll (the unread ones on the first run).
+        Only headers and text parts are downloaded, in UID batches; see imap_fetch.ImapFetcher.
+        """
+        return self.fetcher.fetch_new(mail_connection, mailbox)
     
     def extract_booking_details(self, email_body: str) -> Dict[str, Any]:
         """
         Extract booking details from email body using NLP.
         Returns a dictionary with extracted information.
         """
-        doc = self.nlp(email_body)
-        
+        return self._booking_details_from_doc(self.nlp(email_body), email_body)
+    
+    def extract_booking_details_batch(self, email_bodies: List[str], batch_size: int = 64, n_process: int = 1) -> List[Dict[str, Any]]:
+        """
+        Extract booking details from many email bodies at once, in the same order.
+        spaCy processes the bodies in batches of `batch_size` (nlp.pipe), which is much
+        faster than one call per email; n_process > 1 spreads the batches over worker
+        processes (each loads its own copy of the model, so it only pays off for large
+        batches of emails).
+        """
+        docs = self.nlp.pipe(email_bodies, batch_size=batch_size, n_process=n_process)
+        return [self._booking_details_from_doc(doc, email_body) for email_body, doc in zip(email_bodies, docs)]
+    
+    def _booking_details_from_doc(self, doc, email_body: str) -> Dict[str, Any]:
         # Initialize booking details
         booking_details = {
             'event_date': None,
@@ -121,56 +123,9 @@ class EmailParser:
                 except:
                     continue
         
-        # Extract number of attendees
-        attendees_pattern = re.compile(r'(\d+)\s*(people|persons|attendees|guests)', re.IGNORECASE)
-        attendees_match = attendees_pattern.search(email_body)
-        if attendees_match:
-            booking_details['num_attendees'] = int(attendees_match.group(1))
-        
-        # Extract event type
-        event_types = ['wedding', 'conference', 'meeting', 'party', 'workshop', 'seminar', 'retreat']
-        for event_type in event_types:
-            if re.search(r'\b' + event_type + r'\b', email_body, re.IGNORECASE):
-                booking_details['event_type'] = event_type
-                break
-        
-        # Extract contact information
-        email_pattern = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
-        email_matches = email_pattern.findall(email_body)
-        if email_matches:
-            # Exclude the recipient's email
-            for email_match in email_matches:
-                if not email_match.endswith(('gmail.com', 'yahoo.com', 'hotmail.com')):  # Simplified check
-                    booking_details['contact_email'] = email_match
-                    break
-            
-            if not booking_details['contact_email'] and email_matches:
-                booking_details['contact_email'] = email_matches[0]
-        
-        # Extract organization name (simplified approach)
-        org_indicators = ['company', 'organization', 'behalf of', 'representing']
-        for indicator in org_indicators:
-            pattern = re.compile(r'' + indicator + r'\s+([A-Z][A-Za-z0-9\s&]+)', re.IGNORECASE)
-            match = pattern.search(email_body)
-            if match:
-                booking_details['organization'] = match.group(1).strip()
-                break
-        
-        # Extract time information
-        time_pattern = re.compile(r'(\d{1,2}(?::\d{2})?\s*(?:am|pm))\s*(?:to|until|-)\s*(\d{1,2}(?::\d{2})?\s*(?:am|pm))', re.IGNORECASE)
-        time_match = time_pattern.search(email_body)
-        if time_match:
-            booking_details['start_time'] = time_match.group(1)
-            booking_details['end_time'] = time_match.group(2)
-        
-        # Extract special requests
-        special_request_indicators = ['special request', 'would like', 'need', 'require', 'arrangement']
-        for indicator in special_request_indicators:
-            pattern = re.compile(r'' + indicator + r'[s]?[\s:]+([^.!?]+)[.!?]', re.IGNORECASE)
-            match = pattern.search(email_body)
-            if match:
-                booking_details['special_requests'] = match.group(1).strip()
-                break
+        # Extract attendees, event type, contact email, organization, times and special
+        # requests with the precompiled patterns
+        booking_details.update(booking_regex.extract_rule_fields(email_body))
         
         return booking_details
     
@@ -369,6 +324,7 @@ class InvoiceGenerator:
     """
     def __init__(self, templates_dir: str = "invoice_templates"):
         self.templates_dir = templates_dir
+        self._template_lock = threading.Lock()
         
         # Create templates directory if it doesn't exist
         os.makedirs(self.templates_dir, exist_ok=True)
@@ -400,9 +356,10 @@ class InvoiceGenerator:
         if not os.path.exists(template_path):
             template_path = os.path.join(self.templates_dir, "default_template.html")
             
-            # If default template doesn't exist, create it
-            if not os.path.exists(template_path):
-                self._create_default_template()
+            # If default template doesn't exist, create it (once, even with several pipeline threads)
+            with self._template_lock:
+                if not os.path.exists(template_path):
+                    self._create_default_template()
         
         # Load the template
         with open(template_path, 'r') as f:
@@ -729,11 +686,156 @@ class EmailSender:
             return False
 
 
+# EmailParser of a parse worker process, see BookingManager._parse_stage
+_process_email_parser = None
+
+
+def _init_parse_process() -> None:
+    global _process_email_parser
+    _process_email_parser = EmailParser()
+
+
+def _parse_batch_in_process(email_bodies: List[str]) -> List[Dict[str, Any]]:
+    return _process_email_parser.extract_booking_details_batch(email_bodies)
+
+
+class _LocalParseChunk:
+    """A chunk of email bodies parsed in this process by the first job that needs it."""
+    def __init__(self, email_parser: 'EmailParser', email_bodies: List[str]):
+        self.email_parser = email_parser
+        self.email_bodies = email_bodies
+        self._details = None
+        self._lock = threading.Lock()
+    
+    def result(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._details is None:
+                self._details = self.email_parser.extract_booking_details_batch(self.email_bodies)
+            return self._details
+
+
+class PipelineStage:
+    """
+    One step of a StagedPipeline: `func(job)` runs on `workers` threads, fed from a
+    queue holding at most `queue_size` jobs. Jobs that failed in an earlier stage
+    skip `func` unless `run_on_error` is set.
+    """
+    def __init__(self, name: str, func, workers: int = 4, queue_size: int = 32, run_on_error: bool = False):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+        self.run_on_error = run_on_error
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self) -> None:
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.first_started = None
+        self.last_finished = None
+        self.max_queue_depth = 0
+    
+    def note_queue_depth(self, depth: int) -> None:
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+    
+    def run_job(self, job: Dict[str, Any]) -> None:
+        if job.get('error') is not None and not self.run_on_error:
+            return
+        started = time.perf_counter()
+        try:
+            self.func(job)
+            failed = False
+        except Exception as e:
+            job['error'] = e
+            failed = True
+        finished = time.perf_counter()
+        with self._lock:
+            self.processed += 1
+            self.errors += failed
+            self.busy_seconds += finished - started
+            self.first_started = started if self.first_started is None else min(self.first_started, started)
+            self.last_finished = finished if self.last_finished is None else max(self.last_finished, finished)
+    
+    def metrics(self) -> Dict[str, Any]:
+        elapsed = (self.last_finished - self.first_started) if self.processed else 0
+        return {
+            'processed': self.processed,
+            'errors': self.errors,
+            'workers': self.workers,
+            'jobs_per_second': round(self.processed / elapsed, 1) if elapsed > 0 else None,
+            'avg_ms': round(self.busy_seconds / self.processed * 1000, 1) if self.processed else None,
+            'max_queue_depth': self.max_queue_depth
+        }
+
+
+class StagedPipeline:
+    """
+    Runs jobs through a chain of PipelineStages connected by bounded queues, so every
+    stage works on a different job at the same time and a slow stage holds back its
+    producers instead of piling up jobs in memory.
+    """
+    _DONE = object()
+    
+    def __init__(self, stages: List[PipelineStage]):
+        self.stages = stages
+    
+    def _worker(self, index: int, queues: List[queue.Queue], remaining: List[int], lock: threading.Lock) -> None:
+        stage = self.stages[index]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            job = inbox.get()
+            if job is self._DONE:
+                break
+            stage.run_job(job)
+            if outbox is not None:
+                outbox.put(job)
+                self.stages[index + 1].note_queue_depth(outbox.qsize())
+        # The last worker out tells the next stage there is nothing more to come
+        with lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        if last and outbox is not None:
+            for _ in range(self.stages[index + 1].workers):
+                outbox.put(self._DONE)
+    
+    def run(self, jobs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Process `jobs` (dicts, updated in place) and return the per-stage metrics."""
+        for stage in self.stages:
+            stage.reset()
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=self._worker, args=(index, queues, remaining, lock),
+                             name=f"{stage.name}-{n}", daemon=True)
+            for index, stage in enumerate(self.stages) for n in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        
+        first = self.stages[0]
+        for job in jobs:
+            queues[0].put(job)
+            first.note_queue_depth(queues[0].qsize())
+        for _ in range(first.workers):
+            queues[0].put(self._DONE)
+        for thread in threads:
+            thread.join()
+        
+        return {stage.name: stage.metrics() for stage in self.stages}
+
+
 class BookingManager:
     """
     Main class that orchestrates the booking process.
     """
-    def __init__(self, email_address: str, email_password: str, calendar_type: str = "google", calendar_credentials_path: str = None):
+    def __init__(self, email_address: str, email_password: str, calendar_type: str = "google", calendar_credentials_path: str = None,
+                 imap_server: str = "imap.gmail.com", imap_port: Optional[int] = None, imap_ssl: bool = True,
+                 parse_processes: Optional[int] = None, io_workers: int = 16, parse_batch_size: int = 32):
         self.email_parser = EmailParser()
         self.calendar = CalendarIntegration(calendar_type, calendar_credentials_path)
         self.invoice_generator = InvoiceGenerator()
@@ -741,7 +843,31 @@ class BookingManager:
         self.email_sender = EmailSender(email_address, email_password)
         self.email_address = email_address
         self.email_password = email_password
+        self.imap_server = imap_server
+        self.imap_port = imap_port
+        self.imap_ssl = imap_ssl
+        self.watcher = None
         self.next_invoice_number = self._load_invoice_counter()
+        self._invoice_counter_lock = threading.Lock()
+        # Checking a slot and booking it must happen together, or two emails for the same
+        # slot handled at once could both be accepted; lock striped by event date
+        self._booking_date_locks = [threading.Lock() for _ in range(64)]
+        
+        # Parsing (spaCy) is CPU-bound, so it runs on a process pool, started on first use;
+        # parse_processes=0 parses in this process instead. The other stages wait on the
+        # calendar API, disk and SMTP, so threads are enough for them.
+        self.parse_processes = (os.cpu_count() or 1) if parse_processes is None else parse_processes
+        # Emails are parsed in chunks of up to parse_batch_size bodies (one nlp.pipe call each)
+        self.parse_batch_size = parse_batch_size
+        self._parse_pool = None
+        self._parse_pool_lock = threading.Lock()
+        self.pipeline = StagedPipeline([
+            PipelineStage("parse", self._parse_stage, workers=max(1, self.parse_processes) * 2),
+            PipelineStage("availability", self._availability_stage, workers=io_workers),
+            PipelineStage("render", self._render_stage, workers=max(1, io_workers // 2)),
+            PipelineStage("send", self._send_stage, workers=io_workers, run_on_error=True),
+        ])
+        self.last_pipeline_metrics = {}
         
         # Company settings - in a real system, this would be loaded from a database
         self.company_settings = {}
@@ -762,64 +888,180 @@ class BookingManager:
         with open(counter_file, 'w') as f:
             f.write(str(self.next_invoice_number))
     
+    def _allocate_invoice_number(self) -> str:
+        """Take the next invoice number (safe to call from several pipeline threads)."""
+        with self._invoice_counter_lock:
+            invoice_number = f"{self.next_invoice_number}"
+            self.next_invoice_number += 1
+            self._save_invoice_counter()
+        return invoice_number
+    
+    def _connect(self) -> imaplib.IMAP4:
+        return self.email_parser.connect_to_email_server(
+            self.email_address, self.email_password, self.imap_server, self.imap_port, self.imap_ssl
+        )
+    
+    def _process_emails(self, emails: List[Dict[str, Any]]) -> None:
+        """Run a batch of emails through the parse -> availability -> render -> send pipeline."""
+        logger.info(f"Found {len(emails)} new emails to process.")
+        started = time.perf_counter()
+        jobs = [self._new_job(email_data) for email_data in emails]
+        self._submit_parse_chunks(jobs)
+        self.last_pipeline_metrics = self.pipeline.run(jobs)
+        logger.info(f"Processed {len(emails)} emails in {time.perf_counter() - started:.2f} seconds")
+        for name, metrics in self.last_pipeline_metrics.items():
+            logger.info(f"  {name}: {metrics['processed']} jobs, {metrics['errors']} errors, "
+                        f"{metrics['jobs_per_second']} jobs/s, avg {metrics['avg_ms']} ms, "
+                        f"{metrics['workers']} workers, max queue {metrics['max_queue_depth']}")
+    
     def process_booking_requests(self) -> None:
         """
-        Main method to process booking requests from emails.
-        This method should be called periodically to check for new booking requests.
+        Check for new booking requests once: connect, process the new emails and log out.
+        See watch_booking_requests to keep processing them as they arrive.
         """
+        mail_connection = None
         try:
             # Connect to email server
-            mail_connection = self.email_parser.connect_to_email_server(
-                self.email_address, self.email_password
-            )
+            mail_connection = self._connect()
             
-            # Fetch unread emails
+            # Fetch the emails that arrived since the last check
             emails = self.email_parser.fetch_unread_emails(mail_connection)
             
             if not emails:
                 logger.info("No new booking requests found.")
                 return
             
-            logger.info(f"Found {len(emails)} new emails to process.")
-            
-            # Process each email
-            for email_data in emails:
-                self._process_single_email(email_data)
-                
-            # Close the connection
-            mail_connection.logout()
+            self._process_emails(emails)
             
         except Exception as e:
             logger.error(f"Error processing booking requests: {str(e)}")
+        finally:
+            # Close the connection
+            if mail_connection is not None:
+                try:
+                    mail_connection.logout()
+                except Exception:
+                    pass
+    
+    def watch_booking_requests(self, poll_interval: int = 300, use_idle: bool = True) -> None:
+        """
+        Process booking requests as they arrive, over one long-lived IMAP connection.
+        Uses IMAP IDLE when the server supports it and polls every `poll_interval`
+        seconds otherwise; reconnects with backoff. Blocks until self.watcher.stop()
+        is called from another thread (or KeyboardInterrupt).
+        """
+        self.watcher = imap_fetch.MailboxWatcher(
+            self._connect,
+            self.email_parser.fetch_unread_emails,
+            self._process_emails,
+            poll_interval=poll_interval,
+            use_idle=use_idle
+        )
+        self.watcher.run()
     
     def _process_single_email(self, email_data: Dict[str, Any]) -> None:
-        """Process a single email booking request."""
+        """Process a single email booking request, running the pipeline stages in turn."""
+        job = self._new_job(email_data)
+        for stage in self.pipeline.stages:
+            stage.run_job(job)
+    
+    def _new_job(self, email_data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'email': email_data,
+            'from_email': None,
+            'booking_details': None,
+            'outcome': None,  # incomplete, accepted or rejected
+            'alternative_slots': [],
+            'subject': None,
+            'body': None,
+            'attachment_path': None,
+            'parse_chunk': None,  # (chunk, index, pool): the job's booking details are chunk.result()[index]
+            'error': None
+        }
+    
+    def _submit_parse_chunks(self, jobs: List[Dict[str, Any]]) -> None:
+        """
+        Start parsing the jobs' email bodies in chunks, so spaCy batches them with nlp.pipe
+        instead of one call per email. Chunks are small enough to keep every parse process
+        busy; the parse stage of each job waits only for its own chunk.
+        """
+        if not jobs:
+            return
+        chunk_size = max(1, min(self.parse_batch_size, -(-len(jobs) // max(1, self.parse_processes))))
+        for start in range(0, len(jobs), chunk_size):
+            chunk_jobs = jobs[start:start + chunk_size]
+            email_bodies = [job['email']['body'] for job in chunk_jobs]
+            if self.parse_processes > 0:
+                pool = self._get_parse_pool()
+                chunk = pool.submit(_parse_batch_in_process, email_bodies)
+            else:
+                pool, chunk = None, _LocalParseChunk(self.email_parser, email_bodies)
+            for index, job in enumerate(chunk_jobs):
+                job['parse_chunk'] = (chunk, index, pool)
+    
+    def _get_parse_pool(self) -> ProcessPoolExecutor:
+        with self._parse_pool_lock:
+            if self._parse_pool is None:
+                # spawn rather than fork: the parent has pipeline threads running
+                self._parse_pool = ProcessPoolExecutor(
+                    max_workers=self.parse_processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_parse_process
+                )
+            return self._parse_pool
+    
+    def close(self) -> None:
+        """Stop the parse worker processes."""
+        with self._parse_pool_lock:
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown()
+                self._parse_pool = None
+    
+    def _parse_stage(self, job: Dict[str, Any]) -> None:
+        """Extract the booking details and check the required fields are there."""
+        email_data = job['email']
+        # Extract sender information
+        job['from_email'] = from_email = self._extract_email_address(email_data['from'])
+        logger.info(f"Processing email from {from_email} with subject: {email_data['subject']}")
+        
+        # Extract booking details from email body (parsed with the rest of its chunk)
+        if job['parse_chunk'] is None:
+            self._submit_parse_chunks([job])
+        chunk, index, pool = job['parse_chunk']
         try:
-            # Extract sender information
-            from_email = self._extract_email_address(email_data['from'])
-            subject = email_data['subject']
-            
-            logger.info(f"Processing email from {from_email} with subject: {subject}")
-            
-            # Extract booking details from email body
-            booking_details = self.email_parser.extract_booking_details(email_data['body'])
-            
-            # Add contact email from the sender if not extracted from body
-            if not booking_details['contact_email']:
-                booking_details['contact_email'] = from_email
-            
-            # Extract contact name from email if not found in body
-            if not booking_details['contact_name']:
-                booking_details['contact_name'] = self._extract_name(email_data['from'])
-            
-            # Check if we have the minimum required information
-            if not self._validate_booking_details(booking_details):
-                self._send_incomplete_request_response(from_email)
-                return
-            
+            booking_details = chunk.result()[index]
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool for the next jobs
+            with self._parse_pool_lock:
+                if self._parse_pool is pool:
+                    self._parse_pool = None
+            raise
+        
+        # Add contact email from the sender if not extracted from body
+        if not booking_details['contact_email']:
+            booking_details['contact_email'] = from_email
+        
+        # Extract contact name from email if not found in body
+        if not booking_details['contact_name']:
+            booking_details['contact_name'] = self._extract_name(email_data['from'])
+        
+        job['booking_details'] = booking_details
+        
+        # Check if we have the minimum required information
+        if not self._validate_booking_details(booking_details):
+            job['outcome'] = 'incomplete'
+    
+    def _availability_stage(self, job: Dict[str, Any]) -> None:
+        """Book the slot if it's free, otherwise look for alternatives."""
+        if job['outcome'] is not None:
+            return
+        booking_details = job['booking_details']
+        event_date = booking_details['event_date']
+        
+        with self._booking_date_locks[hash(event_date.date()) % len(self._booking_date_locks)]:
             # Check calendar availability
             is_available = self.calendar.check_availability(
-                booking_details['event_date'],
+                event_date,
                 booking_details['start_time'],
                 booking_details['end_time']
             )
@@ -827,60 +1069,61 @@ class BookingManager:
             if is_available:
                 # Schedule the event in the calendar
                 self.calendar.schedule_event(booking_details)
-                
-                # Generate invoice
-                company_id = "default"  # In a real system, you would determine the company ID
-                invoice_number = f"{self.next_invoice_number}"
-                invoice_path = self.invoice_generator.generate_invoice(
-                    booking_details, company_id, invoice_number
-                )
-                
-                # Increment invoice number for next time
-                self.next_invoice_number += 1
-                self._save_invoice_counter()
-                
-                # Generate acceptance response
-                response_body = self.ai_response.generate_acceptance_response(booking_details)
-                
-                # Send acceptance email with invoice
-                self.email_sender.send_email(
-                    from_email,
-                    f"Booking Confirmation - {booking_details['event_type']} on {booking_details['event_date'].strftime('%Y-%m-%d')}",
-                    response_body,
-                    invoice_path
-                )
-                
-                logger.info(f"Booking accepted and confirmed for {from_email}")
-                
-            else:
-                # Find alternative slots
-                event_duration = self._calculate_event_duration(booking_details['start_time'], booking_details['end_time'])
-                alternative_slots = self.calendar.find_alternative_slots(
-                    booking_details['event_date'],
-                    event_duration
-                )
-                
-                # Generate rejection response with alternatives
-                response_body = self.ai_response.generate_rejection_response(
-                    booking_details, alternative_slots
-                )
-                
-                # Send rejection email
-                self.email_sender.send_email(
-                    from_email,
-                    f"Regarding Your Booking Request - {booking_details['event_type']} on {booking_details['event_date'].strftime('%Y-%m-%d')}",
-                    response_body
-                )
-                
-                logger.info(f"Booking rejected (unavailable) for {from_email}, alternatives provided")
+                job['outcome'] = 'accepted'
         
-        except Exception as e:
-            logger.error(f"Error processing email: {str(e)}")
+        if not is_available:
+            # Find alternative slots
+            event_duration = self._calculate_event_duration(booking_details['start_time'], booking_details['end_time'])
+            job['alternative_slots'] = self.calendar.find_alternative_slots(
+                booking_details['event_date'],
+                event_duration
+            )
+            job['outcome'] = 'rejected'
+    
+    def _render_stage(self, job: Dict[str, Any]) -> None:
+        """Write the reply, and the invoice for accepted bookings."""
+        booking_details = job['booking_details']
+        if job['outcome'] == 'accepted':
+            # Generate invoice
+            company_id = "default"  # In a real system, you would determine the company ID
+            job['attachment_path'] = self.invoice_generator.generate_invoice(
+                booking_details, company_id, self._allocate_invoice_number()
+            )
+            
+            # Generate acceptance response
+            job['subject'] = f"Booking Confirmation - {booking_details['event_type']} on {booking_details['event_date'].strftime('%Y-%m-%d')}"
+            job['body'] = self.ai_response.generate_acceptance_response(booking_details)
+        
+        elif job['outcome'] == 'rejected':
+            # Generate rejection response with alternatives
+            job['subject'] = f"Regarding Your Booking Request - {booking_details['event_type']} on {booking_details['event_date'].strftime('%Y-%m-%d')}"
+            job['body'] = self.ai_response.generate_rejection_response(
+                booking_details, job['alternative_slots']
+            )
+    
+    def _send_stage(self, job: Dict[str, Any]) -> None:
+        """Send the reply; a job that failed in an earlier stage gets the error response."""
+        from_email = job['from_email']
+        if job['error'] is not None:
+            logger.error(f"Error processing email: {str(job['error'])}")
             # Send error response to the sender
             try:
-                self._send_error_response(self._extract_email_address(email_data['from']))
+                self._send_error_response(self._extract_email_address(job['email']['from']))
             except:
                 logger.error("Could not send error response")
+        
+        elif job['outcome'] == 'incomplete':
+            self._send_incomplete_request_response(from_email)
+        
+        elif job['outcome'] == 'accepted':
+            # Send acceptance email with invoice
+            self.email_sender.send_email(from_email, job['subject'], job['body'], job['attachment_path'])
+            logger.info(f"Booking accepted and confirmed for {from_email}")
+        
+        else:
+            # Send rejection email
+            self.email_sender.send_email(from_email, job['subject'], job['body'])
+            logger.info(f"Booking rejected (unavailable) for {from_email}, alternatives provided")
     
     def _extract_email_address(self, from_string: str) -> str:
         """Extract email address from the 'From' header."""
@@ -1017,8 +1260,14 @@ def main():
     parser.add_argument('--password', required=True, help='Password for the email account')
     parser.add_argument('--calendar', default='google', choices=['google', 'outlook'], help='Calendar type to use')
     parser.add_argument('--credentials', help='Path to calendar API credentials file')
-    parser.add_argument('--interval', type=int, default=300, help='Check interval in seconds (default: 300)')
+    parser.add_argument('--imap-server', default='imap.gmail.com', help='IMAP server (default: imap.gmail.com)')
+    parser.add_argument('--imap-port', type=int, help='IMAP port (default: 993, or 143 with --no-imap-ssl)')
+    parser.add_argument('--no-imap-ssl', action='store_true', help='Connect to the IMAP server without SSL, e.g. a local test server')
+    parser.add_argument('--interval', type=int, default=300, help='Check interval in seconds when the server has no IMAP IDLE (default: 300)')
+    parser.add_argument('--no-idle', action='store_true', help='Poll every --interval seconds instead of using IMAP IDLE')
     parser.add_argument('--once', action='store_true', help='Run once and exit')
+    parser.add_argument('--parse-processes', type=int, help='Processes for parsing emails (default: CPU count, 0 parses in the main process)')
+    parser.add_argument('--io-workers', type=int, default=16, help='Threads per calendar/SMTP pipeline stage (default: 16)')
     
     args = parser.parse_args()
     
@@ -1027,7 +1276,12 @@ def main():
         args.email,
         args.password,
         args.calendar,
-        args.credentials
+        args.credentials,
+        args.imap_server,
+        args.imap_port,
+        not args.no_imap_ssl,
+        parse_processes=args.parse_processes,
+        io_workers=args.io_workers
     )
     
     if args.once:
@@ -1035,19 +1289,20 @@ def main():
         logger.info("Running booking process once")
         booking_manager.process_booking_requests()
     else:
-        # Run continuously
-        import time
-        logger.info(f"Starting booking system, checking every {args.interval} seconds")
+        # Run continuously, picking up new emails as the server announces them
+        if args.no_idle:
+            logger.info(f"Starting booking system, checking every {args.interval} seconds")
+        else:
+            logger.info("Starting booking system, waiting for new emails")
         
         try:
-            while True:
-                booking_manager.process_booking_requests()
-                logger.info(f"Sleeping for {args.interval} seconds")
-                time.sleep(args.interval)
+            booking_manager.watch_booking_requests(args.interval, use_idle=not args.no_idle)
         except KeyboardInterrupt:
             logger.info("Booking system stopped by user")
         except Exception as e:
             logger.error(f"Booking system error: {str(e)}")
+    
+    booking_manager.close()
 
 
 if __name__ == "__main__":
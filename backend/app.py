@@ -9,16 +9,17 @@ def handle_exit(signum, frame):
     import sys
     sys.exit(0)
 
-signal.signal(signal.SIGINT, handle_exit)
-signal.signal(signal.SIGTERM, handle_exit)
-
-from flask import Flask, jsonify, send_file, request
+from flask import Flask, Response, jsonify, send_file, request, stream_with_context
 from flask_cors import CORS
 # Import engine early so it's available throughout the file
-from forecast import engine, generate_sample_data, run_etl_and_forecast, latest_forecast, get_forecast_plot
-from revenue import calculate_weekly_revenue, generate_revenue_insights
+from forecast import engine, revenue_index, setup_schema, generate_sample_data, get_latest_forecast, get_forecast_plot, get_forecast_chart_data, sync_shared_state, data_generation
+from revenue import calculate_weekly_revenue, generate_revenue_insights, stream_revenue_insights, revenue_window, query_weekly_revenue
+from plot_cache import PLOT_MIMETYPES, cached_plot_response
+from revenue_index import GRANULARITIES
+from response_compression import init_compression
 import matplotlib.pyplot as plt
 import io
+import json
 from datetime import timedelta
 import pandas as pd
 from sqlalchemy import text
@@ -27,23 +28,38 @@ import numpy as np
 app = Flask(__name__)
 # Simplify CORS setting to allow all requests from your frontend
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+init_compression(app)
 
-# Initialize data
-generate_sample_data()
+@app.before_request
+def catch_up_with_other_workers():
+    # Under several worker processes, drop caches made stale by another worker's inserts
+    sync_shared_state()
 
 @app.route('/api/forecast', methods=['GET'])
 def get_forecast():
-    global latest_forecast
-    if latest_forecast is None:
-        latest_forecast = run_etl_and_forecast()
-    result = latest_forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].to_dict(orient='records')
+    forecast = get_latest_forecast()
+    result = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].to_dict(orient='records')
     return jsonify(result)
 
+def get_plot_options(default_figsize):
+    """
+    Read the optional width/height (inches), dpi and format query parameters of a plot request.
+    Values are clamped so a client can't ask for arbitrarily large renders.
+    """
+    width = min(max(request.args.get('width', default_figsize[0], type=float), 2.0), 24.0)
+    height = min(max(request.args.get('height', default_figsize[1], type=float), 2.0), 24.0)
+    dpi = min(max(request.args.get('dpi', 300, type=int), 50), 300)
+    fmt = request.args.get('format', 'png').lower()
+    if fmt not in PLOT_MIMETYPES:
+        fmt = 'png'
+    return (width, height), dpi, fmt
+
 @app.route('/api/forecast-plot', methods=['GET'])
 def forecast_plot():
     try:
         # Get the forecast plot
-        return get_forecast_plot()
+        figsize, dpi, fmt = get_plot_options((12, 6))
+        return get_forecast_plot(figsize, dpi, fmt)
     except Exception as e:
         print(f"Forecast plot error: {str(e)}")
         # Create a simple error image
@@ -57,6 +73,73 @@ def forecast_plot():
         buf.seek(0)
         return send_file(buf, mimetype='image/png')
 
+@app.route('/api/forecast-chart-data', methods=['GET'])
+def forecast_chart_data():
+    """
+    Columnar series behind the forecast plot, for charts drawn on the client.
+    Optional ?points=N downsamples each series to at most N points (LTTB).
+    """
+    try:
+        max_points = request.args.get('points', type=int)
+        return jsonify(get_forecast_chart_data(max_points))
+    except Exception as e:
+        print(f"Forecast chart data error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/revenue-chart-data', methods=['GET'])
+def revenue_chart_data():
+    """
+    Columnar weekly revenue bars behind the revenue plot, for charts drawn on the client.
+    """
+    try:
+        if not check_data_exists():
+            print("No data found, regenerating sample data...")
+            generate_sample_data()
+            
+        weekly_revenue = query_weekly_revenue(engine)
+        start_date, end_date = revenue_window()
+        return jsonify({
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': end_date.strftime('%Y-%m-%d'),
+            'week': weekly_revenue['week'].astype(int).tolist(),
+            'revenue': weekly_revenue['cost'].round(2).tolist()
+        })
+    except Exception as e:
+        print(f"Revenue chart data error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/revenue', methods=['GET'])
+def get_revenue():
+    """
+    Revenue and purchase totals for a window ending on an as-of date, split into periods.
+    Query parameters: as_of (YYYY-MM-DD, default AS_OF_DATE), window (days, default 30)
+    and granularity (day, week, month or quarter; default week).
+    Served from prefix sums, so any window costs one lookup per period.
+    """
+    try:
+        as_of = pd.Timestamp(request.args.get('as_of')) if request.args.get('as_of') else None
+    except ValueError:
+        return jsonify({'error': 'as_of must be a date (YYYY-MM-DD)'}), 400
+    window_days = request.args.get('window', 30, type=int)
+    if not 1 <= window_days <= 3660:
+        return jsonify({'error': 'window must be between 1 and 3660 days'}), 400
+    granularity = request.args.get('granularity', 'week')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
+
+    try:
+        periods = revenue_index.aggregate(as_of, window_days, granularity)
+        return jsonify({
+            'granularity': granularity,
+            'window': window_days,
+            'periods': periods,
+            'total_revenue': round(sum(p['revenue'] for p in periods), 2),
+            'total_purchases': sum(p['purchases'] for p in periods)
+        })
+    except Exception as e:
+        print(f"Revenue error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/weekly-revenue', methods=['GET'])
 def get_weekly_revenue():
     try:
@@ -84,6 +167,50 @@ def get_weekly_revenue():
             'insights': 'Unable to generate insights at this time.'
         }), 500
 
+@app.route('/api/revenue-data', methods=['GET'])
+def get_revenue_data():
+    """
+    The weekly revenue numbers alone, without waiting for the AI insights.
+    """
+    try:
+        if not check_data_exists():
+            print("No data found, regenerating sample data...")
+            generate_sample_data()
+            
+        weekly_revenue = query_weekly_revenue(engine)
+        revenue_data = weekly_revenue.replace({np.nan: None}).to_dict(orient='records')
+        return jsonify({'revenue_data': revenue_data})
+    except Exception as e:
+        print(f"Revenue data error: {str(e)}")
+        return jsonify({'error': str(e), 'revenue_data': []}), 500
+
+@app.route('/api/revenue-insights/stream', methods=['GET'])
+def stream_insights():
+    """
+    Streams the AI revenue insights as Server-Sent Events while the model writes them.
+    Each text chunk is sent as a JSON-encoded `data:` event, followed by a final `done` event.
+    """
+    try:
+        if not check_data_exists():
+            print("No data found, regenerating sample data...")
+            generate_sample_data()
+
+        weekly_revenue = query_weekly_revenue(engine)
+    except Exception as e:
+        print(f"Revenue insights error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+    def events():
+        for chunk in stream_revenue_insights(weekly_revenue):
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/revenue-plot', methods=['GET'])
 def get_revenue_plot():
     try:
@@ -92,8 +219,12 @@ def get_revenue_plot():
             print("No data found, regenerating sample data...")
             generate_sample_data()
             
-        _, plot_buffer = calculate_weekly_revenue(engine)
-        return send_file(plot_buffer, mimetype='image/png')
+        figsize, dpi, fmt = get_plot_options((10, 6))
+        start_date, end_date = revenue_window()
+        # The generation changes with every purchase insert, in this worker or another
+        key = ('revenue', data_generation(), start_date, end_date, figsize, dpi, fmt)
+        return cached_plot_response(
+            key, lambda: calculate_weekly_revenue(engine, figsize, dpi, fmt)[1].getvalue(), fmt)
     except Exception as e:
         print(f"Revenue plot error: {str(e)}")
         # Create a simple error image
@@ -118,7 +249,16 @@ def check_data_exists():
         print(f"Error checking if data exists: {str(e)}")
         return False
 
+# Initialize data, keeping existing purchases so the persisted forecast cache stays valid
+setup_schema()
+if not check_data_exists():
+    generate_sample_data()
+
 if __name__ == '__main__':
+    # Only when run directly: under uvicorn (asgi.py imports this module) these
+    # would replace the server's own handlers and skip its graceful shutdown
+    signal.signal(signal.SIGINT, handle_exit)
+    signal.signal(signal.SIGTERM, handle_exit)
     try:
         app.run(debug=True, port=5001, use_reloader=False)  # Disable reloader
     except KeyboardInterrupt:
@@ -0,0 +1,206 @@
+"""
+One ASGI service for both backends: the email/invoice API (main.py) and the
+forecast/revenue API (app.py).
+
+The LLM-bound email routes are native async handlers on GeminiEmailProcessor's
+async API, so a worker keeps serving while model calls are in flight. Every other
+route is served by the existing Flask apps through a WSGI adapter, which runs them
+on a thread pool off the event loop. Models are loaded once per worker in the
+lifespan hook.
+
+Each worker process keeps its own forecast, plot cache and revenue index. They
+share the SQLite database and forecast_cache/: only one worker fits a given data
+fingerprint (under a file lock) and the rest load its result, and every worker
+notices another's inserts within SHARED_STATE_CHECK_INTERVAL seconds (see
+forecast.sync_shared_state). Forecast versions are data fingerprints, so ETags
+and chart-data versions agree across workers.
+
+Run with:
+    python asgi.py                        # WEB_CONCURRENCY workers, PORT (default 8000)
+    uvicorn asgi:app --workers 4 --port 8000
+"""
+import os
+import uuid
+import logging
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.exceptions import NotFound
+
+import main
+from app import app as forecast_app
+from forecast import get_latest_forecast, revenue_index
+from revenue_index import DEFAULT_AS_OF_DATE
+
+logger = logging.getLogger(__name__)
+
+
+async def _json_body(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def analyze_email(request: Request):
+    """Async /api/analyze-email, see main.analyze_email."""
+    data = await _json_body(request)
+    email_body = (data or {}).get('email_body', '')
+    if not email_body:
+        return JSONResponse({'error': 'Email body is required'}, status_code=400)
+    try:
+        booking_details = await main.booking_extractor.extract_async(email_body)
+        return JSONResponse({'booking_details': booking_details})
+    except Exception as e:
+        logger.error(f"Error analyzing email: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def analyze_emails(request: Request):
+    """Async /api/analyze-emails, see main.analyze_emails."""
+    try:
+        emails = main.parse_bulk_emails((await request.body()).decode('utf-8'))
+    except ValueError as e:
+        return JSONResponse({'error': f"Invalid upload: {str(e)}"}, status_code=400)
+    if not emails:
+        return JSONResponse({'error': 'At least one email is required'}, status_code=400)
+    if len(emails) > main.MAX_BULK_EMAILS:
+        return JSONResponse({'error': f"At most {main.MAX_BULK_EMAILS} emails per request"}, status_code=400)
+
+    async def lines():
+        # A client disconnect cancels this generator, which cancels the extraction workers
+        completed = failed = 0
+        async for index, booking_details in main.booking_extractor.extract_many(
+                [email_body for _, email_body in emails]):
+            completed += 1
+            if 'error' in booking_details:
+                failed += 1
+            yield main.bulk_result_line(emails, index, booking_details)
+        yield main.bulk_summary_line(len(emails), completed, failed)
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+async def generate_confirmation(request: Request):
+    """Async /api/generate-confirmation, see main.generate_confirmation."""
+    data = await _json_body(request) or {}
+    booking_details = data.get('booking_details', {})
+    if not booking_details:
+        return JSONResponse({'error': 'Booking details are required'}, status_code=400)
+    try:
+        email_body = await main.gemini_processor.generate_booking_confirmation_async(
+            booking_details, data.get('company_id'))
+        return JSONResponse({'email_body': email_body})
+    except Exception as e:
+        logger.error(f"Error generating confirmation: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def generate_rejection(request: Request):
+    """Async /api/generate-rejection, see main.generate_rejection."""
+    data = await _json_body(request) or {}
+    booking_details = data.get('booking_details', {})
+    if not booking_details:
+        return JSONResponse({'error': 'Booking details are required'}, status_code=400)
+    try:
+        email_body = await main.gemini_processor.generate_booking_rejection_async(
+            booking_details, data.get('alternative_slots', []), data.get('company_id'))
+        return JSONResponse({'email_body': email_body})
+    except Exception as e:
+        logger.error(f"Error generating rejection: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def generate_invoice(request: Request):
+    """Async /api/generate-invoice, see main.generate_invoice."""
+    data = await _json_body(request) or {}
+    booking_details = data.get('booking_details', {})
+    if not booking_details:
+        return JSONResponse({'error': 'Booking details are required'}, status_code=400)
+    missing_fields = main.missing_invoice_fields(booking_details)
+    if missing_fields:
+        return JSONResponse(
+            {'error': f"Missing required fields in booking details: {', '.join(missing_fields)}"},
+            status_code=400)
+    try:
+        invoice = await main.gemini_processor.generate_invoice_async(
+            booking_details, data.get('pricing_info'), data.get('company_id'))
+        invoice_id = invoice.get('invoice_data', {}).get('invoice_number', str(uuid.uuid4()))
+        await run_in_threadpool(main.invoice_store.save, invoice_id, invoice)
+        return JSONResponse({'invoice_id': invoice_id, 'invoice': invoice})
+    except Exception as e:
+        logger.error(f"Error generating invoice: {str(e)}", exc_info=True)
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+email_api = Starlette(
+    routes=[
+        Route('/api/analyze-email', analyze_email, methods=['POST']),
+        Route('/api/analyze-emails', analyze_emails, methods=['POST']),
+        Route('/api/generate-confirmation', generate_confirmation, methods=['POST']),
+        Route('/api/generate-rejection', generate_rejection, methods=['POST']),
+        Route('/api/generate-invoice', generate_invoice, methods=['POST']),
+    ],
+    middleware=[Middleware(
+        CORSMiddleware,
+        allow_origins=main.API_CORS_SETTINGS['origins'],
+        allow_methods=main.API_CORS_SETTINGS['methods'],
+        allow_headers=main.API_CORS_SETTINGS['allow_headers'],
+        allow_credentials=main.API_CORS_SETTINGS['supports_credentials'],
+    )],
+)
+ASYNC_PATHS = frozenset(route.path for route in email_api.routes)
+
+
+def flask_apps(environ, start_response):
+    """Send a request to whichever Flask app has a route for it (email API first)."""
+    try:
+        main.app.url_map.bind_to_environ(environ).match()
+        target = main.app
+    except NotFound:
+        target = forecast_app
+    except Exception:
+        # Wrong method or a redirect: let the email app answer it
+        target = main.app
+    return target(environ, start_response)
+
+
+flask_asgi = WSGIMiddleware(flask_apps, workers=int(os.getenv('WSGI_THREADS', '32')))
+
+
+async def dispatch(scope, receive, send):
+    target = email_api if scope.get('path') in ASYNC_PATHS else flask_asgi
+    await target(scope, receive, send)
+
+
+def warm_up():
+    """Load the forecast, the revenue index and the spaCy model before taking traffic."""
+    get_latest_forecast()
+    revenue_index.total(DEFAULT_AS_OF_DATE, DEFAULT_AS_OF_DATE)
+    main.booking_extractor.warm_up()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    logger.info(f"Worker {os.getpid()} loading models")
+    await run_in_threadpool(warm_up)
+    yield
+
+
+app = Starlette(routes=[Mount('/', app=dispatch)], lifespan=lifespan)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    # Importing this module above already created the schema and sample data, so the
+    # workers (which import it again) find the data in place instead of racing to create it
+    uvicorn.run('asgi:app', host='0.0.0.0', port=int(os.getenv('PORT', '8000')),
+                workers=int(os.getenv('WEB_CONCURRENCY', '4')))
@@ -0,0 +1,81 @@
+"""
+Measure booking-email extraction throughput, before and after batching.
+
+"before" is the old path: the full en_core_web_sm pipeline, one nlp() call per email.
+"after" is EmailParser.extract_booking_details_batch: the trimmed pipeline (NER only)
+over nlp.pipe. Both run the same regex extraction on a synthetic corpus, e.g.:
+    python bench_nlp.py --emails 2000 --batch-size 64
+    python bench_nlp.py --emails 2000 --batch-size 128 --n-process 4
+"""
+import argparse
+import random
+import time
+
+import spacy
+
+from AgenticAI import EmailParser
+
+EVENT_TYPES = ['wedding', 'conference', 'meeting', 'party', 'workshop', 'seminar', 'retreat']
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+
+
+def synthetic_email(rng: random.Random) -> str:
+    """A booking request with a date, times, attendees, organisation and a special request."""
+    event_type = rng.choice(EVENT_TYPES)
+    start = rng.randint(8, 15)
+    return (
+        f"Hi there,\n\n"
+        f"I'm writing on behalf of {rng.choice(['Acme Corp', 'Globex', 'Initech', 'Umbrella Labs'])} "
+        f"to ask about hosting a {event_type} at your venue. We are planning it for "
+        f"{rng.choice(MONTHS)} {rng.randint(1, 28)}, {rng.randint(2030, 2032)} from "
+        f"{start % 12 or 12}:00 {'am' if start < 12 else 'pm'} to {(start + 3) % 12 or 12}:00 pm, "
+        f"for about {rng.randint(10, 300)} people.\n\n"
+        f"We would like a projector and catering for everyone. Please let me know if the date "
+        f"works and what the cost would be. You can reach me at "
+        f"planner{rng.randint(1, 999)}@{rng.choice(['acme.com', 'globex.io', 'initech.org'])}.\n\n"
+        f"Thanks,\n{rng.choice(['Jordan', 'Sam', 'Alex', 'Taylor'])}\n"
+    )
+
+
+def emails_per_second(func, email_bodies) -> float:
+    started = time.perf_counter()
+    func(email_bodies)
+    return len(email_bodies) / (time.perf_counter() - started)
+
+
+def run(emails: int = 1000, batch_size: int = 64, n_process: int = 1, seed: int = 0):
+    rng = random.Random(seed)
+    email_bodies = [synthetic_email(rng) for _ in range(emails)]
+
+    parser = EmailParser()
+    full_nlp = spacy.load("en_core_web_sm")
+    print(f"full pipeline:    {', '.join(full_nlp.pipe_names)}")
+    print(f"trimmed pipeline: {', '.join(name for name in parser.nlp.pipe_names if name not in parser.nlp.disabled)}")
+
+    def before(bodies):
+        return [parser._booking_details_from_doc(full_nlp(body), body) for body in bodies]
+
+    def after(bodies):
+        return parser.extract_booking_details_batch(bodies, batch_size=batch_size, n_process=n_process)
+
+    # Warm up both pipelines, and check they find the same details
+    sample = email_bodies[:20]
+    if before(sample) != after(sample):
+        print("warning: the trimmed pipeline extracted different details on the warm-up sample")
+
+    before_rate = emails_per_second(before, email_bodies)
+    after_rate = emails_per_second(after, email_bodies)
+    print(f"{emails} emails, batch_size {batch_size}, n_process {n_process}")
+    print(f"  before (full pipeline, one call per email): {before_rate:.1f} emails/s")
+    print(f"  after (trimmed pipeline, nlp.pipe):         {after_rate:.1f} emails/s ({after_rate / before_rate:.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Booking email extraction benchmark')
+    parser.add_argument('--emails', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--n-process', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.emails, args.batch_size, args.n_process, args.seed)
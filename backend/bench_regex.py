@@ -0,0 +1,151 @@
+"""
+Microbenchmark of the regex booking-field extraction on long emails.
+
+Compares booking_regex.extract_rule_fields (patterns compiled once and only tried where
+their literals occur) with the previous EmailParser code, kept below as legacy_extract,
+which built its patterns on every call and ran a full search per event type and
+indicator. Two corpora: long booking requests, and long emails that aren't booking
+requests (no event type or indicator, so the old code ran every search to the end).
+Both must return the same fields on every email, e.g.:
+    python bench_regex.py --emails 200 --size 20000
+"""
+import argparse
+import random
+import re
+import time
+
+from booking_regex import extract_rule_fields
+
+
+def legacy_extract(email_body: str) -> dict:
+    """The regex part of extract_booking_details before booking_regex (for comparison)."""
+    fields = {
+        'num_attendees': None,
+        'event_type': None,
+        'contact_email': None,
+        'organization': None,
+        'start_time': None,
+        'end_time': None,
+        'special_requests': None
+    }
+    
+    # Extract number of attendees
+    attendees_pattern = re.compile(r'(\d+)\s*(people|persons|attendees|guests)', re.IGNORECASE)
+    attendees_match = attendees_pattern.search(email_body)
+    if attendees_match:
+        fields['num_attendees'] = int(attendees_match.group(1))
+    
+    # Extract event type
+    event_types = ['wedding', 'conference', 'meeting', 'party', 'workshop', 'seminar', 'retreat']
+    for event_type in event_types:
+        if re.search(r'\b' + event_type + r'\b', email_body, re.IGNORECASE):
+            fields['event_type'] = event_type
+            break
+    
+    # Extract contact information
+    email_pattern = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+    email_matches = email_pattern.findall(email_body)
+    if email_matches:
+        # Exclude the recipient's email
+        for email_match in email_matches:
+            if not email_match.endswith(('gmail.com', 'yahoo.com', 'hotmail.com')):  # Simplified check
+                fields['contact_email'] = email_match
+                break
+        
+        if not fields['contact_email'] and email_matches:
+            fields['contact_email'] = email_matches[0]
+    
+    # Extract organization name (simplified approach)
+    org_indicators = ['company', 'organization', 'behalf of', 'representing']
+    for indicator in org_indicators:
+        pattern = re.compile(r'' + indicator + r'\s+([A-Z][A-Za-z0-9\s&]+)', re.IGNORECASE)
+        match = pattern.search(email_body)
+        if match:
+            fields['organization'] = match.group(1).strip()
+            break
+    
+    # Extract time information
+    time_pattern = re.compile(r'(\d{1,2}(?::\d{2})?\s*(?:am|pm))\s*(?:to|until|-)\s*(\d{1,2}(?::\d{2})?\s*(?:am|pm))', re.IGNORECASE)
+    time_match = time_pattern.search(email_body)
+    if time_match:
+        fields['start_time'] = time_match.group(1)
+        fields['end_time'] = time_match.group(2)
+    
+    # Extract special requests
+    special_request_indicators = ['special request', 'would like', 'need', 'require', 'arrangement']
+    for indicator in special_request_indicators:
+        pattern = re.compile(r'' + indicator + r'[s]?[\s:]+([^.!?]+)[.!?]', re.IGNORECASE)
+        match = pattern.search(email_body)
+        if match:
+            fields['special_requests'] = match.group(1).strip()
+            break
+    
+    return fields
+
+
+FILLER = [
+    "Thanks again for the quick reply last week, the team really appreciated it.",
+    "Please find the updated agenda below; the rooms on the second floor are fine for us.",
+    "> On Tuesday, the events desk wrote: we have updated our catering menu for the season",
+    "This message and any attachments are confidential and intended only for the addressee",
+    "Parking for our guests should be close to the main entrance if at all possible",
+    "Our previous event with you went smoothly and the feedback from the team was great",
+]
+
+
+def long_email(rng: random.Random, size: int, booking: bool = True) -> str:
+    """A booking request (or just filler) buried in quoted thread and signature text, about `size` characters long."""
+    request = (
+        f"We would like to book the hall for a {rng.choice(['team meeting', 'conference', 'party', 'retreat'])} "
+        f"on behalf of {rng.choice(['Acme Corp', 'Globex', 'Initech'])} from {rng.randint(8, 11)}:00 am to "
+        f"{rng.randint(1, 5)}:00 pm for {rng.randint(10, 300)} guests. "
+        f"Contact: planner{rng.randint(1, 99)}@{rng.choice(['gmail.com', 'acme.com'])}."
+    )
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append(rng.choice(FILLER))
+    if not booking:
+        return "\n".join(lines)
+    # Put the request near the end, where it sits in a reply on top of a long quoted thread
+    lines.insert(len(lines) - rng.randint(0, min(3, len(lines))), request)
+    return "\n".join(lines)
+
+
+def per_email_us(func, email_bodies, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for email_body in email_bodies:
+            func(email_body)
+        best = min(best, time.perf_counter() - started)
+    return best / len(email_bodies) * 1e6
+
+
+def run(emails: int = 200, size: int = 20000, repeat: int = 3, seed: int = 0):
+    rng = random.Random(seed)
+    print(f"{emails} emails of ~{size} characters, best of {repeat}")
+    for label, booking in (('booking requests', True), ('other emails', False)):
+        email_bodies = [long_email(rng, size, booking) for _ in range(emails)]
+
+        mismatches = sum(legacy_extract(body) != extract_rule_fields(body) for body in email_bodies)
+        if mismatches:
+            print(f"warning: {mismatches} emails extracted differently")
+
+        before = per_email_us(legacy_extract, email_bodies, repeat)
+        after = per_email_us(extract_rule_fields, email_bodies, repeat)
+        megabytes = sum(len(body) for body in email_bodies) / emails / 1e6
+        print(f"  {label}:")
+        print(f"    before (patterns built per call, full search per phrase): {before:.0f} us/email, "
+              f"{megabytes / before * 1e6:.1f} MB/s")
+        print(f"    after (precompiled, tried only where literals occur):     {after:.0f} us/email, "
+              f"{megabytes / after * 1e6:.1f} MB/s ({before / after:.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Regex booking-field extraction benchmark')
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--size', type=int, default=20000, help='Approximate email length in characters')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.emails, args.size, args.repeat, args.seed)
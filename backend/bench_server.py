@@ -0,0 +1,68 @@
+"""
+Measure request throughput and latency of a running backend.
+
+Compare the Flask dev servers with the combined ASGI service, e.g.:
+    python main.py & python app.py &
+    python bench_server.py http://localhost:8080 --path /api/analyze-email --body '{"email_body": "... #{i}"}'
+    python bench_server.py http://localhost:5001 --path /api/revenue
+
+    python asgi.py &
+    python bench_server.py http://localhost:8000 --path /api/analyze-email --body '{"email_body": "... #{i}"}'
+    python bench_server.py http://localhost:8000 --path /api/revenue
+
+"{i}" in the body is replaced by the request number, so every request misses the response caches.
+"""
+import argparse
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def timed_request(url: str, body: bytes = None) -> float:
+    """Send one request and return its latency in seconds (raises on HTTP errors)."""
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'} if body else {})
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=120) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def run(base_url: str, path: str, body: str = None, requests: int = 200, concurrency: int = 16):
+    url = base_url.rstrip('/') + path
+
+    def payload(i):
+        return body.replace('{i}', str(i)).encode('utf-8') if body else None
+
+    timed_request(url, payload('warm-up'))
+
+    errors = 0
+    latencies = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(timed_request, url, payload(i)) for i in range(requests)]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array(latencies) * 1000
+    print(f"{url}: {requests} requests, concurrency {concurrency}, {errors} errors")
+    print(f"  throughput: {len(latencies) / elapsed:.1f} req/s")
+    if len(latencies):
+        print(f"  latency ms: p50 {np.percentile(latencies, 50):.1f}, "
+              f"p95 {np.percentile(latencies, 95):.1f}, max {latencies.max():.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Request throughput benchmark')
+    parser.add_argument('base_url', help='e.g. http://localhost:8000')
+    parser.add_argument('--path', default='/api/forecast')
+    parser.add_argument('--body', help='JSON body; the request is a POST when given')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+    run(args.base_url, args.path, args.body, args.requests, args.concurrency)
@@ -0,0 +1,219 @@
+import re
+import asyncio
+import threading
+import logging
+from typing import Dict, Any, AsyncIterator, Callable, Iterable, Optional, Tuple
+
+from booking_schema import REQUIRED_FIELDS, validate_booking
+
+logger = logging.getLogger(__name__)
+
+# The rule-based parser needs spaCy and NLTK, which only the email agent installs.
+# Without them the local tier still reads labelled form fields.
+try:
+    from AgenticAI import EmailParser
+except Exception as e:
+    EmailParser = None
+    logger.warning(f"AgenticAI.EmailParser unavailable ({str(e)}), local extraction will only read form fields")
+
+# "Label: value" lines of templated booking form submissions
+FORM_FIELD_PATTERNS = {
+    'client_name': re.compile(r'^\s*(?:full\s+|contact\s+|client\s+)?name\s*[:\-]\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE),
+    'client_email': re.compile(r'^\s*(?:contact\s+)?e-?mail(?:\s+address)?\s*[:\-]\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE),
+    'requested_date': re.compile(r'^\s*(?:event\s+|booking\s+|requested\s+)?date\s*[:\-]\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE),
+    'start_time': re.compile(r'^\s*start(?:\s+time)?\s*[:\-]\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE),
+    'end_time': re.compile(r'^\s*end(?:\s+time)?\s*[:\-]\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE),
+    'attendees': re.compile(r'^\s*(?:number\s+of\s+)?(?:attendees|guests|people|participants|headcount)\s*[:\-]\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE),
+    'purpose': re.compile(r'^\s*(?:purpose|event(?:\s+type)?|occasion)\s*[:\-]\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE),
+    'special_requests': re.compile(r'^\s*(?:special\s+requests?|notes|requirements)\s*[:\-]\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE),
+}
+# "Time: 2pm - 5pm" gives both ends at once
+FORM_TIME_RANGE_PATTERN = re.compile(
+    r'^\s*time\s*[:\-]\s*(.+?)\s*(?:to|until|-|–)\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE)
+
+
+class TieredBookingExtractor:
+    """
+    Extracts booking details locally first and only calls Gemini when the local
+    result isn't good enough. The local tier reads labelled form fields and runs
+    the regex/spaCy rules of AgenticAI.EmailParser.extract_booking_details. Its
+    confidence is the share of REQUIRED_FIELDS that are present, valid and not
+    contradicted by another rule. Below `confidence_threshold` the email is
+    escalated to GeminiEmailProcessor.analyze_booking_request.
+    """
+    def __init__(self, gemini_processor, email_parser=None, confidence_threshold: float = 1.0):
+        self.gemini_processor = gemini_processor
+        self.confidence_threshold = confidence_threshold
+        self._email_parser = email_parser
+        self._parser_failed = False
+        self._parser_lock = threading.Lock()
+        self._stats = {'total': 0, 'local': 0, 'gemini': 0}
+        self._stats_lock = threading.Lock()
+
+    def _get_email_parser(self):
+        """
+        Load the spaCy-backed parser on first use (model loading takes a while).
+        If loading fails (e.g. the spaCy model isn't downloaded), that is remembered
+        and the local tier keeps running on form fields alone.
+        """
+        if self._email_parser is None and EmailParser is not None and not self._parser_failed:
+            with self._parser_lock:
+                if self._email_parser is None and not self._parser_failed:
+                    try:
+                        self._email_parser = EmailParser()
+                    except Exception as e:
+                        self._parser_failed = True
+                        logger.warning(f"EmailParser failed to load ({str(e)}), local extraction will only read form fields")
+        return self._email_parser
+
+    def warm_up(self) -> None:
+        """Load the spaCy model now instead of on the first email."""
+        self._get_email_parser()
+
+    @staticmethod
+    def _form_fields(email_body: str) -> Dict[str, Any]:
+        fields = {}
+        for field, pattern in FORM_FIELD_PATTERNS.items():
+            match = pattern.search(email_body)
+            if match:
+                fields[field] = match.group(1)
+        match = FORM_TIME_RANGE_PATTERN.search(email_body)
+        if match:
+            fields.setdefault('start_time', match.group(1))
+            fields.setdefault('end_time', match.group(2))
+        return fields
+
+    def _rule_fields(self, email_body: str) -> Dict[str, Any]:
+        """Run EmailParser's rules and map them onto the booking field names."""
+        parser = self._get_email_parser()
+        if parser is None:
+            return {}
+        details = parser.extract_booking_details(email_body)
+        event_date = details.get('event_date')
+        return {
+            'client_name': details.get('contact_name'),
+            'client_email': details.get('contact_email'),
+            'requested_date': event_date.strftime('%Y-%m-%d') if event_date else None,
+            'start_time': details.get('start_time'),
+            'end_time': details.get('end_time'),
+            'attendees': details.get('num_attendees'),
+            'purpose': details.get('event_type'),
+            'special_requests': details.get('special_requests'),
+        }
+
+    def extract_locally(self, email_body: str) -> Tuple[Dict[str, Any], float]:
+        """
+        Return (booking_details, confidence) from the local tier alone.
+        Form fields win over the free-text rules; a field where both give
+        different valid values counts as ambiguous.
+        """
+        form, form_errors = validate_booking(self._form_fields(email_body))
+        rules, rule_errors = validate_booking(self._rule_fields(email_body))
+        form, rules = form.to_dict(), rules.to_dict()
+
+        booking_details = {}
+        ambiguous = set()
+        for field in form:
+            booking_details[field] = form[field] if form[field] is not None else rules[field]
+            if form[field] is not None and rules[field] is not None and form[field] != rules[field]:
+                ambiguous.add(field)
+        field_errors = {**rule_errors, **form_errors}
+
+        trusted = [field for field in REQUIRED_FIELDS
+                   if booking_details[field] is not None and field not in ambiguous and field not in field_errors]
+        confidence = len(trusted) / len(REQUIRED_FIELDS)
+        if field_errors:
+            booking_details['field_errors'] = field_errors
+        return booking_details, confidence
+
+    def _record(self, source: str) -> None:
+        with self._stats_lock:
+            self._stats['total'] += 1
+            self._stats[source] += 1
+
+    def _merge(self, gemini_details: Dict[str, Any], local_details: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill fields Gemini left empty with what the local tier found."""
+        for field, value in local_details.items():
+            if field != 'field_errors' and gemini_details.get(field) is None and value is not None:
+                gemini_details[field] = value
+        return gemini_details
+
+    def _try_local(self, email_body: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any], float]:
+        try:
+            local_details, confidence = self.extract_locally(email_body)
+        except Exception as e:
+            logger.warning(f"Local booking extraction failed: {str(e)}")
+            return None, {}, 0.0
+        if confidence >= self.confidence_threshold:
+            self._record('local')
+            return {**local_details, 'source': 'local', 'confidence': confidence}, local_details, confidence
+        return None, local_details, confidence
+
+    def extract(self, email_body: str) -> Dict[str, Any]:
+        """
+        Extract booking details, escalating to Gemini only when the local tier isn't confident.
+        The result carries "source" ("local" or "gemini") and the local "confidence".
+        """
+        result, local_details, confidence = self._try_local(email_body)
+        if result is not None:
+            return result
+        logger.info(f"Local extraction confidence {confidence:.2f}, escalating to Gemini")
+        self._record('gemini')
+        gemini_details = self.gemini_processor.analyze_booking_request(email_body)
+        return {**self._merge(gemini_details, local_details), 'source': 'gemini', 'confidence': confidence}
+
+    async def extract_async(self, email_body: str) -> Dict[str, Any]:
+        """Async version of extract. The local tier runs in a worker thread so spaCy doesn't block the loop."""
+        result, local_details, confidence = await asyncio.to_thread(self._try_local, email_body)
+        if result is not None:
+            return result
+        logger.info(f"Local extraction confidence {confidence:.2f}, escalating to Gemini")
+        self._record('gemini')
+        gemini_details = await self.gemini_processor.analyze_booking_request_async(email_body)
+        return {**self._merge(gemini_details, local_details), 'source': 'gemini', 'confidence': confidence}
+
+    async def extract_many(self, email_bodies: Iterable[str], max_in_flight: Optional[int] = None,
+                           should_stop: Optional[Callable[[], bool]] = None) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Extract many emails with at most `max_in_flight` in progress (default: the
+        processor's max_concurrency), yielding (index, booking_details) as each one
+        completes rather than in input order. Stops picking up new emails once
+        `should_stop()` returns True.
+        """
+        max_in_flight = max_in_flight or self.gemini_processor.max_concurrency
+        # Bounded, so workers stop taking new emails while the caller isn't reading
+        results = asyncio.Queue(maxsize=max_in_flight)
+        pending = iter(enumerate(email_bodies))
+
+        async def worker():
+            # Workers share one iterator, so each email is taken exactly once
+            for index, email_body in pending:
+                if should_stop is not None and should_stop():
+                    break
+                try:
+                    booking_details = await self.extract_async(email_body)
+                except Exception as e:
+                    logger.error(f"Error extracting booking #{index}: {str(e)}")
+                    booking_details = {'error': str(e)}
+                await results.put((index, booking_details))
+            await results.put(None)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(max_in_flight)]
+        running = len(workers)
+        try:
+            while running:
+                item = await results.get()
+                if item is None:
+                    running -= 1
+                    continue
+                yield item
+        finally:
+            for w in workers:
+                w.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counts of emails served locally and by Gemini, and the local fraction."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['local_fraction'] = stats['local'] / stats['total'] if stats['total'] else 0.0
+        return stats
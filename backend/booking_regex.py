@@ -0,0 +1,157 @@
+"""
+The regex half of EmailParser.extract_booking_details, compiled once at import.
+
+Running a pattern over a long email costs the regex engine a step per character, and
+the old code did that once per event type and indicator phrase. Every pattern here
+contains a literal that any match must include (the phrase itself, "am"/"pm", "@", an
+attendee word), so the body is lower-cased once, those literals are located with
+str.find (a fast substring search), and the compiled pattern is only tried, anchored,
+just before each occurrence. Matches are exactly those of pattern.search on the body.
+"""
+import re
+import string
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# In priority order: when several are mentioned, the earliest in the list wins
+EVENT_TYPES = ('wedding', 'conference', 'meeting', 'party', 'workshop', 'seminar', 'retreat')
+ORG_INDICATORS = ('company', 'organization', 'behalf of', 'representing')
+SPECIAL_REQUEST_INDICATORS = ('special request', 'would like', 'need', 'require', 'arrangement')
+ATTENDEE_WORDS = ('people', 'persons', 'attendees', 'guests')
+
+# Senders on these domains are usually individuals, so another address is preferred as contact
+FREE_EMAIL_DOMAINS = ('gmail.com', 'yahoo.com', 'hotmail.com')
+
+ATTENDEES_PATTERN = re.compile(r'(\d+)\s*(' + '|'.join(ATTENDEE_WORDS) + r')', re.IGNORECASE)
+EVENT_TYPE_PATTERNS = {
+    event_type: re.compile(r'\b' + re.escape(event_type) + r'\b', re.IGNORECASE)
+    for event_type in EVENT_TYPES
+}
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+TIME_RANGE_PATTERN = re.compile(
+    r'(\d{1,2}(?::\d{2})?\s*(?:am|pm))\s*(?:to|until|-)\s*(\d{1,2}(?::\d{2})?\s*(?:am|pm))', re.IGNORECASE)
+ORG_PATTERNS = {
+    indicator: re.compile(re.escape(indicator) + r'\s+([A-Z][A-Za-z0-9\s&]+)', re.IGNORECASE)
+    for indicator in ORG_INDICATORS
+}
+SPECIAL_REQUEST_PATTERNS = {
+    indicator: re.compile(re.escape(indicator) + r'[s]?[\s:]+([^.!?]+)[.!?]', re.IGNORECASE)
+    for indicator in SPECIAL_REQUEST_INDICATORS
+}
+
+# Characters that can come between the start of a match and its literal
+_EMAIL_LOCAL_CHARS = frozenset(string.ascii_letters + string.digits + '._%+-')
+
+
+def _digit_or_space(char: str) -> bool:
+    return char.isdecimal() or char.isspace()
+
+
+def _time_char(char: str) -> bool:
+    return char.isdecimal() or char.isspace() or char == ':'
+
+
+# Non-ASCII letters that IGNORECASE matches to ASCII ones (dotted/dotless i, long s,
+# Kelvin sign) but str.lower() doesn't turn into them
+_CASE_FOLD_EXCEPTIONS = re.compile('[\u0130\u0131\u017f\u212a]')
+
+
+def _lowered(email_body: str) -> Optional[str]:
+    """The lower-cased body to find literals in, or None when its positions can't be trusted."""
+    lowered = email_body.lower()
+    if len(lowered) != len(email_body):
+        return None
+    if not email_body.isascii() and _CASE_FOLD_EXCEPTIONS.search(email_body):
+        return None
+    return lowered
+
+
+def _occurrences(lowered: str, literals: Sequence[str], start: int) -> List[int]:
+    positions = []
+    for literal in literals:
+        position = lowered.find(literal, start)
+        while position >= 0:
+            positions.append(position)
+            position = lowered.find(literal, position + 1)
+    positions.sort()
+    return positions
+
+
+def _search(pattern: re.Pattern, email_body: str, lowered: Optional[str], literals: Sequence[str],
+            lead: Optional[Callable[[str], bool]] = None, start: int = 0) -> Optional[re.Match]:
+    """
+    Same result as pattern.search(email_body, start) for a pattern whose every match
+    contains one of `literals`, with only `lead` characters between the start of the
+    match and the first such literal in it.
+    """
+    if lowered is None:
+        return pattern.search(email_body, start)
+    tried = start
+    for position in _occurrences(lowered, literals, start):
+        first = position
+        if lead is not None:
+            while first > tried and lead(email_body[first - 1]):
+                first -= 1
+        for candidate in range(max(first, tried), position + 1):
+            match = pattern.match(email_body, candidate)
+            if match:
+                return match
+        tried = position + 1
+    return None
+
+
+def extract_rule_fields(email_body: str) -> Dict[str, Any]:
+    """
+    Extract the regex-based booking fields: num_attendees, event_type, contact_email,
+    organization, start_time, end_time and special_requests (None when not found).
+    """
+    lowered = _lowered(email_body)
+    fields = {
+        'num_attendees': None,
+        'event_type': None,
+        'contact_email': None,
+        'organization': None,
+        'start_time': None,
+        'end_time': None,
+        'special_requests': None
+    }
+
+    attendees_match = _search(ATTENDEES_PATTERN, email_body, lowered, ATTENDEE_WORDS, _digit_or_space)
+    if attendees_match:
+        fields['num_attendees'] = int(attendees_match.group(1))
+
+    for event_type in EVENT_TYPES:
+        if _search(EVENT_TYPE_PATTERNS[event_type], email_body, lowered, (event_type,)):
+            fields['event_type'] = event_type
+            break
+
+    # The first address not on a free mail domain, else the first address
+    start = 0
+    while True:
+        email_match = _search(EMAIL_PATTERN, email_body, lowered, ('@',), _EMAIL_LOCAL_CHARS.__contains__, start)
+        if not email_match:
+            break
+        if fields['contact_email'] is None:
+            fields['contact_email'] = email_match.group(0)
+        if not email_match.group(0).endswith(FREE_EMAIL_DOMAINS):
+            fields['contact_email'] = email_match.group(0)
+            break
+        start = email_match.end()
+
+    for indicator in ORG_INDICATORS:
+        match = _search(ORG_PATTERNS[indicator], email_body, lowered, (indicator,))
+        if match:
+            fields['organization'] = match.group(1).strip()
+            break
+
+    time_match = _search(TIME_RANGE_PATTERN, email_body, lowered, ('am', 'pm'), _time_char)
+    if time_match:
+        fields['start_time'] = time_match.group(1)
+        fields['end_time'] = time_match.group(2)
+
+    for indicator in SPECIAL_REQUEST_INDICATORS:
+        match = _search(SPECIAL_REQUEST_PATTERNS[indicator], email_body, lowered, (indicator,))
+        if match:
+            fields['special_requests'] = match.group(1).strip()
+            break
+
+    return fields
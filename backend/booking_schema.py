@@ -0,0 +1,226 @@
+import re
+import json
+import datetime
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional, Tuple
+
+# Response schema sent to Gemini so it answers with a bare JSON object in this shape
+BOOKING_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "client_name": {"type": "string", "nullable": True},
+        "client_email": {"type": "string", "nullable": True},
+        "requested_date": {"type": "string", "nullable": True, "description": "YYYY-MM-DD"},
+        "start_time": {"type": "string", "nullable": True, "description": "HH:MM, 24-hour"},
+        "end_time": {"type": "string", "nullable": True, "description": "HH:MM, 24-hour"},
+        "purpose": {"type": "string", "nullable": True},
+        "attendees": {"type": "integer", "nullable": True},
+        "special_requests": {"type": "string", "nullable": True},
+    },
+}
+
+# Fields a booking can't be scheduled without. A failure in any other field is tolerated
+REQUIRED_FIELDS = ('client_name', 'requested_date', 'start_time', 'end_time', 'attendees')
+
+EMAIL_PATTERN = re.compile(r'^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$')
+TIME_PATTERN = re.compile(r'^(\d{1,2})(?::(\d{2}))?(?::\d{2})?\s*([AaPp]\.?[Mm]\.?)?$')
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%m/%d/%Y', '%B %d, %Y', '%b %d, %Y', '%d %B %Y']
+
+
+@dataclass
+class BookingRequest:
+    """
+    Booking details extracted from an email. Every field is optional,
+    since emails routinely leave some of them out.
+    """
+    client_name: Optional[str] = None
+    client_email: Optional[str] = None
+    requested_date: Optional[str] = None  # YYYY-MM-DD
+    start_time: Optional[str] = None  # HH:MM, 24-hour
+    end_time: Optional[str] = None  # HH:MM, 24-hour
+    purpose: Optional[str] = None
+    attendees: Optional[int] = None
+    special_requests: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _strip_code_fences(text: str) -> str:
+    if "```json" in text:
+        return text.split("```json")[1].split("```")[0].strip()
+    elif "```" in text:
+        return text.split("```")[1].strip()
+    return text.strip()
+
+
+PYTHON_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+
+def _repair_outside_strings(text: str) -> str:
+    # Trailing commas before a closing brace or bracket, and Python literals
+    text = re.sub(r',\s*([}\]])', r'\1', text)
+    return re.sub(r'\b(True|False|None)\b', lambda m: PYTHON_LITERALS[m.group(1)], text)
+
+
+def _normalize_literals(text: str) -> str:
+    """
+    Rewrite Python-style syntax into JSON one token at a time, so string values
+    pass through untouched: single-quoted strings become double-quoted ones, and
+    literals and trailing commas are only fixed between strings.
+    """
+    parts = []
+    outside_start = i = 0
+    while i < len(text):
+        quote = text[i]
+        if quote not in '"\'':
+            i += 1
+            continue
+        parts.append(_repair_outside_strings(text[outside_start:i]))
+        # Find the closing quote, skipping escaped characters
+        end = i + 1
+        while end < len(text) and text[end] != quote:
+            end += 2 if text[end] == '\\' else 1
+        body = text[i + 1:end]
+        if quote == "'":
+            # \' needs no escape in JSON, while a bare " does
+            body = re.sub(r'\\(.)|"', lambda m: ("'" if m.group(1) == "'" else m.group(0)) if m.group(1) else '\\"', body)
+        parts.append('"' + body + '"')
+        outside_start = i = end + 1
+    parts.append(_repair_outside_strings(text[outside_start:]))
+    return ''.join(parts)
+
+
+def repair_json(text: str) -> Dict[str, Any]:
+    """
+    Parse a JSON object out of a model response, repairing the usual malformations
+    without ever evaluating the text as code: markdown fences, prose around the
+    object, Python-style quotes and literals, and trailing commas.
+    Raises ValueError when no object can be recovered.
+    """
+    candidate = _strip_code_fences(text)
+    try:
+        data = json.loads(candidate)
+        if isinstance(data, dict):
+            return data
+    except json.JSONDecodeError:
+        pass
+
+    # Keep only the outermost {...}
+    start, end = candidate.find('{'), candidate.rfind('}')
+    if start == -1 or end <= start:
+        raise ValueError("No JSON object found in the response")
+    candidate = candidate[start:end + 1]
+
+    try:
+        data = json.loads(_normalize_literals(candidate))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Could not repair JSON response: {str(e)}")
+    if not isinstance(data, dict):
+        raise ValueError("Response is not a JSON object")
+    return data
+
+
+def _clean_text(value: Any) -> Optional[str]:
+    if isinstance(value, list):
+        value = "; ".join(str(v) for v in value if v)
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(f"expected text, got {type(value).__name__}")
+    value = str(value).strip()
+    return value or None
+
+
+def _clean_email(value: Any) -> Optional[str]:
+    value = _clean_text(value)
+    if value is None:
+        return None
+    # Accept "Name <address>" as well as a bare address
+    match = re.search(r'<([^>]+)>', value)
+    if match:
+        value = match.group(1).strip()
+    if not EMAIL_PATTERN.match(value):
+        raise ValueError(f"not an email address: {value!r}")
+    return value
+
+
+def _clean_date(value: Any) -> Optional[str]:
+    value = _clean_text(value)
+    if value is None:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ValueError(f"not a date: {value!r}")
+
+
+def _clean_time(value: Any) -> Optional[str]:
+    value = _clean_text(value)
+    if value is None:
+        return None
+    match = TIME_PATTERN.match(value)
+    if not match:
+        raise ValueError(f"not a time: {value!r}")
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    meridiem = (match.group(3) or '').replace('.', '').lower()
+    if meridiem == 'pm' and hour < 12:
+        hour += 12
+    elif meridiem == 'am' and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        raise ValueError(f"not a time: {value!r}")
+    return f"{hour:02d}:{minute:02d}"
+
+
+def _clean_attendees(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        raise ValueError("expected a number of attendees")
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = _clean_text(value)
+    if value is None:
+        return None
+    # "about 25 people" -> 25
+    match = re.search(r'\d+', value.replace(',', ''))
+    if not match:
+        raise ValueError(f"not a number of attendees: {value!r}")
+    return int(match.group(0))
+
+
+FIELD_CLEANERS = {
+    "client_name": _clean_text,
+    "client_email": _clean_email,
+    "requested_date": _clean_date,
+    "start_time": _clean_time,
+    "end_time": _clean_time,
+    "purpose": _clean_text,
+    "attendees": _clean_attendees,
+    "special_requests": _clean_text,
+}
+
+
+def validate_booking(data: Dict[str, Any]) -> Tuple[BookingRequest, Dict[str, str]]:
+    """
+    Validate and normalize each field of a raw booking dict independently.
+    Returns the BookingRequest and a {field: error} dict; a field that fails
+    validation is left as None instead of failing the whole extraction.
+    """
+    values = {}
+    field_errors = {}
+    for field, clean in FIELD_CLEANERS.items():
+        raw = data.get(field)
+        if raw is None:
+            values[field] = None
+            continue
+        try:
+            values[field] = clean(raw)
+        except ValueError as e:
+            values[field] = None
+            field_errors[field] = str(e)
+    return BookingRequest(**values), field_errors
+
+
+def parse_booking_response(text: str) -> Tuple[BookingRequest, Dict[str, str]]:
+    """Repair, parse and validate a model's booking extraction response."""
+    return validate_booking(repair_json(text))
@@ -0,0 +1,165 @@
+import os
+import threading
+from typing import Dict, Any, Optional
+from jinja2 import ChoiceLoader, DictLoader, Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+# Built-in templates. A company overrides any of them by placing a file with the
+# same name under <templates_dir>/<company_id>/, e.g. acme/invoice.html.
+DEFAULT_TEMPLATES = {
+    "confirmation.txt": """Dear {{ client_name }},
+
+Thank you for your booking request. We're pleased to confirm your booking for {{ purpose }} on {{ date }} at {{ time_slot }}.
+{% if personal_note %}
+{{ personal_note }}
+{% endif %}
+If you have any questions or need to make changes, please don't hesitate to contact us.
+
+Best regards,
+{{ signature }}
+""",
+    "rejection.txt": """Dear {{ client_name }},
+
+Thank you for your booking request for {{ purpose }} on {{ date }} at {{ time_slot }}.
+
+Unfortunately, we are unable to accommodate your request for this specific time.
+{% if alternative_slots %}
+However, we can offer the following alternative slots:
+{% for slot in alternative_slots %}- {{ slot.date }} from {{ slot.start_time }} to {{ slot.end_time }}
+{% endfor %}{% endif %}{% if personal_note %}
+{{ personal_note }}
+{% endif %}
+Please let us know if any of these alternatives would work for you, or if you'd like to suggest another time.
+
+Best regards,
+{{ signature }}
+""",
+    "invoice.html": """<div style="font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; border: 1px solid #ddd;">
+    <div style="display: flex; justify-content: space-between; margin-bottom: 20px;">
+        <div>
+            <h1 style="color: #2c3e50; margin: 0;">INVOICE</h1>
+            <p style="color: #7f8c8d; margin: 5px 0 0 0;">{{ company_name }}</p>
+        </div>
+        <div style="text-align: right;">
+            <h2 style="color: #2c3e50; margin: 0;">#{{ invoice_number }}</h2>
+            <p style="margin: 5px 0 0 0;">Date: {{ invoice_date }}</p>
+            <p style="margin: 5px 0 0 0;">Due: {{ due_date }}</p>
+        </div>
+    </div>
+
+    <div style="background-color: #f9f9f9; padding: 15px; margin-bottom: 20px;">
+        <h3 style="margin-top: 0; color: #2c3e50;">Bill To:</h3>
+        <p style="margin: 5px 0;">{{ client_name }}</p>
+        <p style="margin: 5px 0;">{{ client_email }}</p>
+    </div>
+
+    <table style="width: 100%; border-collapse: collapse; margin-bottom: 20px;">
+        <thead>
+            <tr style="background-color: #2c3e50; color: white;">
+                <th style="padding: 10px; text-align: left;">Description</th>
+                <th style="padding: 10px; text-align: right;">Amount</th>
+            </tr>
+        </thead>
+        <tbody>
+            <tr style="border-bottom: 1px solid #ddd;">
+                <td style="padding: 10px;">{{ purpose }} - Venue Rental ({{ '%.2f'|format(duration) }} hours at ${{ hourly_rate }}/hour)</td>
+                <td style="padding: 10px; text-align: right;">${{ '%.2f'|format(venue_cost) }}</td>
+            </tr>
+            <tr style="border-bottom: 1px solid #ddd;">
+                <td style="padding: 10px;">Attendee Fee ({{ attendees }} attendees at ${{ attendee_fee }}/person)</td>
+                <td style="padding: 10px; text-align: right;">${{ '%.2f'|format(attendee_cost) }}</td>
+            </tr>
+        </tbody>
+    </table>
+
+    <div style="display: flex; justify-content: flex-end;">
+        <div style="width: 250px;">
+            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                <span>Subtotal:</span>
+                <span>${{ '%.2f'|format(subtotal) }}</span>
+            </div>
+            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                <span>Tax ({{ '%.1f'|format(tax_rate * 100) }}%):</span>
+                <span>${{ '%.2f'|format(tax) }}</span>
+            </div>
+            <div style="display: flex; justify-content: space-between; font-weight: bold; font-size: 1.2em; margin-top: 10px; border-top: 2px solid #2c3e50; padding-top: 10px;">
+                <span>Total:</span>
+                <span>${{ '%.2f'|format(total) }}</span>
+            </div>
+        </div>
+    </div>
+
+    <div style="margin-top: 40px; text-align: center; color: #7f8c8d; border-top: 1px solid #ddd; padding-top: 20px;">
+        <p>Thank you for your business!</p>
+        <p>Payment due within 30 days. Please make checks payable to {{ company_name }}.</p>
+    </div>
+</div>
+""",
+}
+
+# Values every template can rely on unless the caller overrides them
+DEFAULT_CONTEXT = {
+    "company_name": "ProfitPilot",
+    "signature": "The ProfitPilot Team",
+    "personal_note": None,
+    "alternative_slots": [],
+}
+
+
+class DocumentTemplates:
+    """
+    Renders confirmation, rejection and invoice documents from Jinja2 templates.
+    Templates are compiled once per (company, name) override found on disk, or
+    once per built-in name, and kept in memory, so a render is a plain function
+    call. HTML templates are autoescaped, text ones aren't.
+    """
+    def __init__(self, templates_dir: Optional[str] = None):
+        self.templates_dir = templates_dir or os.getenv("DOCUMENT_TEMPLATES_DIR", "document_templates")
+        self.env = Environment(
+            loader=ChoiceLoader([FileSystemLoader(self.templates_dir), DictLoader(DEFAULT_TEMPLATES)]),
+            autoescape=select_autoescape(enabled_extensions=("html",), default_for_string=False),
+            undefined=StrictUndefined,
+            keep_trailing_newline=True,
+            auto_reload=False,
+        )
+        self._compiled = {}
+        self._lock = threading.Lock()
+        self._overrides = self._find_overrides()
+
+    def _find_overrides(self) -> set:
+        """The (company_id, name) pairs that have a template file under templates_dir."""
+        overrides = set()
+        if not os.path.isdir(self.templates_dir):
+            return overrides
+        for company_id in os.listdir(self.templates_dir):
+            company_dir = os.path.join(self.templates_dir, company_id)
+            if os.path.isdir(company_dir):
+                overrides.update((company_id, name) for name in os.listdir(company_dir)
+                                 if os.path.isfile(os.path.join(company_dir, name)))
+        return overrides
+
+    def get_template(self, name: str, company_id: Optional[str] = None):
+        """Return the compiled template for a company, falling back to the built-in one."""
+        # Companies without an override share the built-in entry, so request-supplied
+        # ids can't grow the cache beyond the templates on disk
+        key = (company_id, name) if (company_id, name) in self._overrides else (None, name)
+        template = self._compiled.get(key)
+        if template is None:
+            with self._lock:
+                template = self._compiled.get(key)
+                if template is None:
+                    template = self.env.get_template(f"{key[0]}/{name}" if key[0] else name)
+                    self._compiled[key] = template
+        return template
+
+    def render(self, name: str, context: Dict[str, Any], company_id: Optional[str] = None) -> str:
+        return self.get_template(name, company_id).render({**DEFAULT_CONTEXT, **context})
+
+    def invalidate(self, company_id: Optional[str] = None) -> None:
+        """Drop compiled templates (for one company, or all) after template files change."""
+        with self._lock:
+            self._overrides = self._find_overrides()
+            if company_id is None:
+                self._compiled.clear()
+            else:
+                self._compiled = {key: t for key, t in self._compiled.items() if key[0] != company_id}
+            self.env.cache.clear()
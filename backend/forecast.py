@@ -1,11 +1,24 @@
 import io
+import os
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows: fits aren't coordinated across processes
+    fcntl = None
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from prophet import Prophet
-from sqlalchemy import create_engine
+from prophet.serialize import model_to_json, model_from_json
+from sqlalchemy import create_engine, text
 from sqlalchemy.types import DateTime, Integer, Float
-from flask import jsonify, request, send_file
+from flask import jsonify, request
+from plot_cache import plot_cache, cached_plot_response
+from downsample import lttb_indices
+from revenue_index import CumulativeRevenueIndex, DEFAULT_AS_OF_DATE
 
 
 # ------------------------------
@@ -14,54 +27,235 @@ from flask import jsonify, request, send_file
 engine = create_engine('sqlite:///profit_pilot.db', echo=False)
 # engine = create_engine('sqlite:///my_database.db', echo=False)
 
+# Prefix sums over the daily revenue rollup for O(1) revenue windows
+revenue_index = CumulativeRevenueIndex(engine)
 
-def generate_sample_data():
+# Directory where fitted models and forecasts are persisted between restarts
+FORECAST_CACHE_DIR = os.getenv('FORECAST_CACHE_DIR', 'forecast_cache')
+# Lock file in FORECAST_CACHE_DIR that lets one worker process fit at a time
+FIT_LOCK_NAME = '.fit.lock'
+
+# How often, in seconds, a worker checks for purchases added through other worker processes
+SHARED_STATE_CHECK_INTERVAL = float(os.getenv('SHARED_STATE_CHECK_INTERVAL', '2'))
+
+
+PURCHASES_DTYPE = {'purchaseId': Integer(), 'timestamp': DateTime(), 'cost': Float(), 'sales': Float()}
+
+
+# ------------------------------
+# Daily Rollups: pre-aggregated purchase counts and revenue per day
+# ------------------------------
+def ensure_rollup_tables(connection):
+    """Create the daily rollup tables if they don't exist yet."""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS daily_purchase_counts (
+            date TEXT PRIMARY KEY,
+            purchase_count INTEGER NOT NULL
+        )
+    """))
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS daily_revenue (
+            date TEXT PRIMARY KEY,
+            revenue REAL NOT NULL
+        )
+    """))
+    # A single counter bumped in the same transaction as every change to purchases
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS data_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            generation INTEGER NOT NULL
+        )
+    """))
+    connection.execute(text("INSERT OR IGNORE INTO data_generation (id, generation) VALUES (0, 0)"))
+
+
+def bump_data_generation(connection):
+    """Record a change to purchases; call inside the transaction that makes it."""
+    connection.execute(text("UPDATE data_generation SET generation = generation + 1 WHERE id = 0"))
+
+
+def data_generation():
+    """The purchases generation counter: a primary-key lookup, cheap enough for every request."""
+    with engine.connect() as connection:
+        row = connection.execute(text("SELECT generation FROM data_generation WHERE id = 0")).fetchone()
+    return row[0] if row else 0
+
+
+def ensure_purchase_indexes(connection):
     """
-    Generate 100,000 sample purchase entries spanning across three years with a cyclical pattern in sales.
-    The sales pattern is:
-    - More sales from January to May
-    - A slowdown in the summer months (June to July)
-    - An uptick in sales from August to December
+    Create the covering (timestamp, cost) index on purchases, so date-range
+    revenue queries read a slice of the index instead of scanning the table.
     """
-    # Define the start and end dates
-    start_date = '2021-01-01'
-    end_date = '2023-12-31'
-    
-    # Generate a list of 100,000 random timestamps spanning 3 years
-    timestamps = pd.to_datetime(
-        np.random.uniform(
-            pd.Timestamp(start_date).value,
-            pd.Timestamp(end_date).value,
-            size=100000
-        )
-    ).sort_values()
-
-    # Generate cyclical sales pattern
-    sales_pattern = np.zeros(len(timestamps))
-
-    for i, timestamp in enumerate(timestamps):
-        month = timestamp.month
-        if month >= 1 and month <= 5:  # January to May: High sales
-            sales_pattern[i] = np.random.uniform(10, 50)
-        elif month >= 6 and month <= 7:  # June to July: Low sales
-            sales_pattern[i] = np.random.uniform(1, 10)
-        else:  # August to December: High sales again
-            sales_pattern[i] = np.random.uniform(15, 60)
-    
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_purchases_timestamp_cost ON purchases (timestamp, cost)"))
+
+
+def setup_schema():
+    """
+    Create the rollup tables and, once the purchases table exists, its indexes.
+    Safe to call on every start.
+    """
+    with engine.begin() as connection:
+        ensure_rollup_tables(connection)
+        has_purchases = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'purchases'")).fetchone()
+        if has_purchases:
+            ensure_purchase_indexes(connection)
+
+
+def rebuild_daily_rollups(connection):
+    """
+    Recompute both daily rollups from the full purchases table.
+    Only needed after the purchases table is replaced wholesale.
+    """
+    ensure_rollup_tables(connection)
+    connection.execute(text("DELETE FROM daily_purchase_counts"))
+    connection.execute(text("DELETE FROM daily_revenue"))
+    connection.execute(text("""
+        INSERT INTO daily_purchase_counts (date, purchase_count)
+        SELECT date(timestamp), COUNT(*) FROM purchases GROUP BY date(timestamp)
+    """))
+    connection.execute(text("""
+        INSERT INTO daily_revenue (date, revenue)
+        SELECT date(timestamp), SUM(cost) FROM purchases GROUP BY date(timestamp)
+    """))
+
+
+def update_daily_rollups(connection, new_df):
+    """
+    Fold a batch of new purchases into the daily rollups.
+    The batch is aggregated in pandas first, so each touched day costs one upsert.
+    """
+    ensure_rollup_tables(connection)
+    if new_df.empty:
+        return
+    dates = pd.to_datetime(new_df['timestamp']).dt.strftime('%Y-%m-%d')
+    costs = new_df['cost'] if 'cost' in new_df else pd.Series(0.0, index=new_df.index)
+    daily = pd.DataFrame({'date': dates, 'cost': costs.fillna(0.0)}).groupby('date')['cost'].agg(['size', 'sum'])
+
+    connection.execute(text("""
+        INSERT INTO daily_purchase_counts (date, purchase_count) VALUES (:date, :count)
+        ON CONFLICT(date) DO UPDATE SET purchase_count = purchase_count + excluded.purchase_count
+    """), [{'date': date, 'count': int(row['size'])} for date, row in daily.iterrows()])
+    connection.execute(text("""
+        INSERT INTO daily_revenue (date, revenue) VALUES (:date, :revenue)
+        ON CONFLICT(date) DO UPDATE SET revenue = revenue + excluded.revenue
+    """), [{'date': date, 'revenue': float(row['sum'])} for date, row in daily.iterrows()])
+
+
+def _on_purchases_changed():
+    """Drop everything derived from the purchases table."""
+    plot_cache.invalidate()
+    revenue_index.invalidate()
+
+
+def append_purchases(new_df):
+    """
+    Append purchases to the purchases table and update the daily rollups
+    in the same transaction, so the two never drift apart.
+    """
+    new_df = new_df.copy()
+    new_df['timestamp'] = pd.to_datetime(new_df['timestamp'])
+    with engine.begin() as connection:
+        new_df.to_sql('purchases', connection, if_exists='append', index=False)
+        update_daily_rollups(connection, new_df)
+        bump_data_generation(connection)
+        fingerprint = data_fingerprint(connection)
+    _on_purchases_changed()
+    # This worker reacts to its own insert, so sync_shared_state shouldn't pick it up again
+    _mark_fingerprint_seen(fingerprint)
+    return len(new_df)
+
+
+def load_daily_counts():
+    """
+    Return the daily purchase counts as a Prophet-ready DataFrame with 'ds' and 'y'.
+    Rebuilds the rollup once if it is missing but purchases exist (e.g. an older database).
+    """
+    with engine.begin() as connection:
+        ensure_rollup_tables(connection)
+        daily_counts = pd.read_sql(
+            text('SELECT date, purchase_count FROM daily_purchase_counts ORDER BY date'), connection)
+        if daily_counts.empty:
+            rebuild_daily_rollups(connection)
+            daily_counts = pd.read_sql(
+                text('SELECT date, purchase_count FROM daily_purchase_counts ORDER BY date'), connection)
+
+    daily_counts['ds'] = pd.to_datetime(daily_counts['date'])
+    daily_counts['y'] = daily_counts['purchase_count']
+    return daily_counts[['ds', 'y']]  # Prophet expects columns named 'ds' and 'y'
+
+
+# Seasonal sales bands as (first_month, last_month, low, high), inclusive.
+# The pattern is:
+# - More sales from January to May
+# - A slowdown in the summer months (June to July)
+# - An uptick in sales from August to December
+DEFAULT_SEASONAL_BANDS = (
+    (1, 5, 10, 50),   # January to May: High sales
+    (6, 7, 1, 10),    # June to July: Low sales
+    (8, 12, 15, 60),  # August to December: High sales again
+)
+
+
+def build_sample_data(n_rows=100000, start_date='2021-01-01', end_date='2023-12-31',
+                      seasonal_bands=DEFAULT_SEASONAL_BANDS, rng=None):
+    """
+    Build a DataFrame of random purchase entries with a cyclical pattern in sales.
+    Everything is vectorized: the month of every timestamp is looked up in a
+    per-month table of (low, high) bounds, so 10M rows take seconds, not minutes.
+    Pass a seeded numpy.random.Generator as `rng` for reproducible output.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    # Map every calendar month to its (low, high) sales bounds
+    low_by_month = np.full(13, np.nan)
+    high_by_month = np.full(13, np.nan)
+    for first_month, last_month, low, high in seasonal_bands:
+        low_by_month[first_month:last_month + 1] = low
+        high_by_month[first_month:last_month + 1] = high
+    if np.isnan(low_by_month[1:]).any():
+        raise ValueError("seasonal_bands must cover every month from 1 to 12")
+
+    # Generate sorted random timestamps spanning the date range
+    timestamps = pd.to_datetime(np.sort(
+        rng.uniform(pd.Timestamp(start_date).value, pd.Timestamp(end_date).value, size=n_rows)
+    ).astype('int64'))
+
+    # Derive the month of every row at once and draw its sales from the matching band
+    months = timestamps.month.to_numpy()
+    sales_pattern = rng.uniform(low_by_month[months], high_by_month[months])
+
     # Generate random costs
-    costs = np.random.uniform(5.0, 50.0, size=100000)
-    
-    # Create DataFrame
-    data = pd.DataFrame({
-        'purchaseId': np.arange(1, 100001),
+    costs = rng.uniform(5.0, 50.0, size=n_rows)
+
+    return pd.DataFrame({
+        'purchaseId': np.arange(1, n_rows + 1),
         'timestamp': timestamps,
         'cost': costs,
         'sales': sales_pattern
     })
-    
-    # Save to SQLite database
-    data.to_sql('purchases', engine, if_exists='replace', index=False,
-                dtype={'purchaseId': Integer(), 'timestamp': DateTime(), 'cost': Float(), 'sales': Float()})
+
+
+def generate_sample_data(n_rows=100000, start_date='2021-01-01', end_date='2023-12-31',
+                         seasonal_bands=DEFAULT_SEASONAL_BANDS, rng=None):
+    """
+    Generate sample purchase entries (100,000 spanning three years by default)
+    with a cyclical pattern in sales and save them to the purchases table.
+    See build_sample_data for the meaning of the arguments.
+    """
+    data = build_sample_data(n_rows, start_date, end_date, seasonal_bands, rng)
+
+    # Save to SQLite database and rebuild the daily rollups from scratch
+    with engine.begin() as connection:
+        data.to_sql('purchases', connection, if_exists='replace', index=False,
+                    dtype=PURCHASES_DTYPE)
+        # Replacing the table drops its indexes, so recreate them
+        ensure_purchase_indexes(connection)
+        rebuild_daily_rollups(connection)
+        bump_data_generation(connection)
+    _on_purchases_changed()
     
     print(f"Generated {len(data)} random purchase entries with cyclical sales pattern spanning {start_date} to {end_date}")
 
@@ -69,24 +263,8 @@ def generate_sample_data():
 # ------------------------------
 # ETL Pipeline & Prophet Forecasting
 # ------------------------------
-def run_etl_and_forecast():
-    """
-    Extract purchase data, group entries by day to count the number of purchases,
-    fit a Prophet model on the daily counts, and return a forecast DataFrame for the next year.
-    """
-    # Extract purchase data from SQL
-    df = pd.read_sql('SELECT timestamp, purchaseId FROM purchases', engine)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    
-    # Group by day to count purchases - using date only, not exact timestamp
-    df['date'] = df['timestamp'].dt.date
-    daily_counts = df.groupby('date').size().reset_index(name='y')
-    daily_counts['ds'] = pd.to_datetime(daily_counts['date'])
-    daily_counts = daily_counts[['ds', 'y']]  # Prophet expects columns named 'ds' and 'y'
-    
-    # Calculate the date range of our data
-    date_range = (daily_counts['ds'].max() - daily_counts['ds'].min()).days
-    
+def _build_model(date_range):
+    """Configure a fresh Prophet model for daily counts spanning `date_range` days."""
     # Configure Prophet based on data characteristics
     model = Prophet(
         # Enable yearly seasonality only if we have close to a year of data
@@ -113,8 +291,43 @@ def run_etl_and_forecast():
             fourier_order=5,
             prior_scale=10.0
         )
+    return model
+
+
+def _stan_init(model):
+    """Extract the fitted parameters of a Prophet model to warm-start Stan on the next fit."""
+    res = {}
+    for pname in ['k', 'm', 'sigma_obs']:
+        res[pname] = model.params[pname][0][0]
+    for pname in ['delta', 'beta']:
+        res[pname] = model.params[pname][0]
+    return res
+
+
+def fit_forecast(warm_start_model=None):
+    """
+    Load the daily purchase counts from the daily_purchase_counts rollup,
+    fit a Prophet model on the daily counts, and return (model, forecast) for the next year.
+    If `warm_start_model` is given, Stan starts from its parameters, which makes
+    refits on slightly grown data much faster. Falls back to a cold fit when the
+    parameter shapes no longer match (e.g. a seasonality was switched on).
+    """
+    # Read the pre-aggregated daily counts instead of every raw purchase
+    daily_counts = load_daily_counts()
+    
+    # Calculate the date range of our data
+    date_range = (daily_counts['ds'].max() - daily_counts['ds'].min()).days
     
-    model.fit(daily_counts)
+    model = _build_model(date_range)
+    if warm_start_model is not None:
+        try:
+            model.fit(daily_counts, init=_stan_init(warm_start_model))
+        except Exception as e:
+            print(f"Warm-started fit failed, refitting from scratch: {str(e)}")
+            model = _build_model(date_range)
+            model.fit(daily_counts)
+    else:
+        model.fit(daily_counts)
     
     # Create future DataFrame for the next 365 days (1-year horizon)
     future = model.make_future_dataframe(periods=365)
@@ -124,10 +337,263 @@ def run_etl_and_forecast():
     forecast['historical'] = np.nan
     forecast.loc[forecast['ds'].isin(daily_counts['ds']), 'historical'] = daily_counts['y'].values
     
+    return model, forecast
+
+
+def run_etl_and_forecast():
+    """
+    Fit a Prophet model on the daily purchase counts and return a forecast DataFrame for the next year.
+    """
+    _, forecast = fit_forecast()
     return forecast
 
-# Global variable to store the latest forecast
+# ------------------------------
+# Persisted Forecast Cache, keyed by a fingerprint of the purchases data
+# ------------------------------
+def data_fingerprint(connection=None):
+    """
+    Fingerprint the purchases data without touching the purchases table: the
+    generation counter (bumped by every insert or reload) plus the purchase count,
+    last day and revenue from the daily rollups, which tell apart databases that
+    were recreated and happen to reach the same generation.
+    """
+    if connection is None:
+        with engine.connect() as connection:
+            return data_fingerprint(connection)
+    generation, n_rows, last_day, revenue = connection.execute(text("""
+        SELECT (SELECT generation FROM data_generation WHERE id = 0),
+               (SELECT SUM(purchase_count) FROM daily_purchase_counts),
+               (SELECT MAX(date) FROM daily_purchase_counts),
+               (SELECT ROUND(SUM(revenue), 2) FROM daily_revenue)
+    """)).fetchone()
+    return hashlib.sha256(f"{generation}|{n_rows}|{last_day}|{revenue}".encode()).hexdigest()[:16]
+
+
+def _cache_paths(fingerprint):
+    """Return the (model, forecast) file paths for a fingerprint."""
+    return (os.path.join(FORECAST_CACHE_DIR, f"{fingerprint}.model.json"),
+            os.path.join(FORECAST_CACHE_DIR, f"{fingerprint}.forecast.parquet"))
+
+
+def save_forecast_cache(fingerprint, model, forecast):
+    """
+    Persist a fitted model (Prophet's JSON serialization) and its forecast (Parquet).
+    Files are written under a temporary name unique to this process and renamed into
+    place, and entries for older fingerprints are removed.
+    """
+    try:
+        os.makedirs(FORECAST_CACHE_DIR, exist_ok=True)
+        model_path, forecast_path = _cache_paths(fingerprint)
+        suffix = f".{os.getpid()}.tmp"
+        with open(model_path + suffix, 'w') as f:
+            f.write(model_to_json(model))
+        forecast.to_parquet(forecast_path + suffix, index=False)
+        os.replace(model_path + suffix, model_path)
+        os.replace(forecast_path + suffix, forecast_path)
+
+        for name in os.listdir(FORECAST_CACHE_DIR):
+            if not name.startswith(fingerprint + '.') and name != FIT_LOCK_NAME:
+                os.remove(os.path.join(FORECAST_CACHE_DIR, name))
+    except Exception as e:
+        print(f"Error saving forecast cache: {str(e)}")
+
+
+@contextmanager
+def fit_file_lock():
+    """
+    Hold an exclusive lock on FORECAST_CACHE_DIR across worker processes, so only
+    one of them fits and writes the cache while the others wait and then load it.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(FORECAST_CACHE_DIR, exist_ok=True)
+    with open(os.path.join(FORECAST_CACHE_DIR, FIT_LOCK_NAME), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_forecast_cache(fingerprint):
+    """Return the cached (model, forecast) for a fingerprint, or None on a miss."""
+    model_path, forecast_path = _cache_paths(fingerprint)
+    if not (os.path.exists(model_path) and os.path.exists(forecast_path)):
+        return None
+    try:
+        with open(model_path, 'r') as f:
+            model = model_from_json(f.read())
+        forecast = pd.read_parquet(forecast_path)
+        return model, forecast
+    except Exception as e:
+        print(f"Error loading forecast cache: {str(e)}")
+        return None
+
+
+def load_or_fit_forecast(warm_start_model=None):
+    """
+    Return (model, forecast, fingerprint) for the current purchases data, loading it
+    from the on-disk cache when the data fingerprint is unchanged and fitting otherwise.
+    """
+    fingerprint = data_fingerprint()
+    cached = load_forecast_cache(fingerprint)
+    if cached is None:
+        with fit_file_lock():
+            # Another worker may have fitted the same data while this one waited
+            cached = load_forecast_cache(fingerprint)
+            if cached is None:
+                model, forecast = fit_forecast(warm_start_model=warm_start_model)
+                save_forecast_cache(fingerprint, model, forecast)
+                return model, forecast, fingerprint
+    print(f"Loaded cached forecast for data fingerprint {fingerprint}")
+    return (*cached, fingerprint)
+
+# Global variables to store the latest model and forecast.
+# They are only ever replaced together through _publish_forecast, and readers
+# should take a single reference (or call get_latest_forecast) so a refit
+# swapping them mid-request can't mix two versions. The version is the fingerprint
+# of the data the forecast was fitted on, so every worker process agrees on it.
 latest_forecast = None
+latest_model = None
+forecast_version = None
+_publish_lock = threading.Lock()
+# Serializes Prophet fits so concurrent readers and the refit scheduler never fit twice
+_fit_lock = threading.Lock()
+
+
+def _publish_forecast(model, forecast, fingerprint):
+    """Atomically replace the served model and forecast."""
+    global latest_forecast, latest_model, forecast_version
+    with _publish_lock:
+        latest_model = model
+        latest_forecast = forecast
+        forecast_version = fingerprint
+    plot_cache.invalidate()
+
+
+def get_latest_forecast():
+    """
+    Return the last good forecast. If none exists yet, it is loaded from the
+    on-disk cache, or fitted when the data has changed since it was saved.
+    """
+    forecast = latest_forecast
+    if forecast is not None:
+        return forecast
+    with _fit_lock:
+        if latest_forecast is None:
+            _publish_forecast(*load_or_fit_forecast())
+        return latest_forecast
+
+
+def get_versioned_forecast():
+    """Return (forecast_version, forecast) for the last good forecast, read together."""
+    get_latest_forecast()
+    with _publish_lock:
+        return forecast_version, latest_forecast
+
+
+def refit_forecast():
+    """
+    Refit the forecast warm-started from the current model and swap it in.
+    Readers keep being served the previous forecast until the swap.
+    """
+    with _fit_lock:
+        _publish_forecast(*load_or_fit_forecast(warm_start_model=latest_model))
+
+
+class ForecastRefitScheduler:
+    """
+    Coalesces new purchases and refits the forecast in a background thread.
+    A refit runs once `min_interval` seconds have passed since the previous one,
+    or straight away when `max_pending_rows` new rows have piled up.
+    """
+    def __init__(self, min_interval=30.0, max_pending_rows=500):
+        self.min_interval = min_interval
+        self.max_pending_rows = max_pending_rows
+        self._pending_rows = 0
+        self._last_refit = time.monotonic()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def notify(self, n_rows=1):
+        """Record `n_rows` new purchases; the background thread decides when to refit."""
+        with self._condition:
+            self._pending_rows += n_rows
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='forecast-refit', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _wait_for_work(self):
+        """Block until a refit is due and return the number of rows it covers."""
+        with self._condition:
+            while True:
+                if self._pending_rows == 0:
+                    self._condition.wait()
+                    continue
+                remaining = self._last_refit + self.min_interval - time.monotonic()
+                if self._pending_rows >= self.max_pending_rows or remaining <= 0:
+                    pending = self._pending_rows
+                    self._pending_rows = 0
+                    return pending
+                self._condition.wait(timeout=remaining)
+
+    def _run(self):
+        while True:
+            pending = self._wait_for_work()
+            try:
+                refit_forecast()
+                print(f"Refitted forecast after {pending} new purchases")
+            except Exception as e:
+                print(f"Error refitting forecast: {str(e)}")
+                # Keep the rows pending so the next window retries them
+                with self._condition:
+                    self._pending_rows += pending
+            with self._condition:
+                self._last_refit = time.monotonic()
+
+
+refit_scheduler = ForecastRefitScheduler()
+
+# ------------------------------
+# Catching up with other worker processes
+# ------------------------------
+# Each worker process has its own plot cache, revenue index, forecast and refit
+# scheduler; only the database and FORECAST_CACHE_DIR are shared.
+_seen_fingerprint = None
+_next_state_check = 0.0
+_state_check_lock = threading.Lock()
+
+
+def _mark_fingerprint_seen(fingerprint):
+    global _seen_fingerprint
+    with _state_check_lock:
+        _seen_fingerprint = fingerprint
+
+
+def sync_shared_state():
+    """
+    Pick up purchases added through another worker process. At most every
+    SHARED_STATE_CHECK_INTERVAL seconds the data fingerprint is compared with the
+    last one seen; when it changed, this worker drops its derived state and
+    schedules a refit, which loads the other worker's fit from the shared cache.
+    """
+    global _seen_fingerprint, _next_state_check
+    if time.monotonic() < _next_state_check:
+        return
+    with _state_check_lock:
+        if time.monotonic() < _next_state_check:
+            return
+        _next_state_check = time.monotonic() + SHARED_STATE_CHECK_INTERVAL
+        fingerprint = data_fingerprint()
+        previous = _seen_fingerprint if _seen_fingerprint is not None else forecast_version
+        _seen_fingerprint = fingerprint
+    if previous is None or previous == fingerprint:
+        return
+    _on_purchases_changed()
+    if latest_forecast is not None and forecast_version != fingerprint:
+        refit_scheduler.notify()
 
 # ------------------------------
 # Flask API to Serve the Forecast, Plot & Accept New Transactions
@@ -138,51 +604,53 @@ def get_forecast():
     Returns the current forecast as JSON.
     The forecast includes predicted number of purchases per day with confidence intervals.
     """
-    global latest_forecast
-    if latest_forecast is None:
-        latest_forecast = run_etl_and_forecast()
-    result = latest_forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].to_dict(orient='records')
+    forecast = get_latest_forecast()
+    result = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].to_dict(orient='records')
     return jsonify(result)
 
-def get_forecast_plot():
+def forecast_plot_series(forecast, as_of=None):
     """
-    Creates an aesthetic plot of the forecast and sends it as a PNG image.
+    Select the series the forecast plot draws: the 7-day smoothed history of the
+    365 days up to `as_of` (DEFAULT_AS_OF_DATE by default), and the forecast
+    (yhat and its bounds) after the last historical date.
+    Returns (historical_data, forecast_data, forecast_start).
     """
-    global latest_forecast
-    if latest_forecast is None:
-        latest_forecast = run_etl_and_forecast()
-    # Get the current date and filter the historical data to the last 365 days for plotting   # today = pd.Timestamp('today') <-- for production
-    today = pd.Timestamp('2023-12-31')
+    # Filter the historical data to the last 365 days for plotting
+    today = pd.Timestamp(as_of if as_of is not None else DEFAULT_AS_OF_DATE)
     one_year_ago = today - pd.Timedelta(days=365)
+
+    historical_data = forecast[~forecast['historical'].isna()]
+    historical_data = historical_data[historical_data['ds'] >= one_year_ago].copy()
+    historical_data['smoothed'] = historical_data['historical'].rolling(window=7, min_periods=1).mean()
+
+    # The forecast starts from the last historical date
+    forecast_start = historical_data['ds'].max()
+    forecast_data = forecast[forecast['ds'] > forecast_start]
+    return historical_data, forecast_data, forecast_start
+
+def render_forecast_plot(forecast, figsize=(12, 6), dpi=300, fmt='png'):
+    """
+    Creates an aesthetic plot of the forecast and returns the encoded image bytes.
+    """
+    historical_data, forecast_data, forecast_start = forecast_plot_series(forecast)
     # Create an aesthetic plot using matplotlib
-    fig, ax = plt.subplots(figsize=(12, 6))
+    fig, ax = plt.subplots(figsize=figsize)
 
     # Plot historical data with a line to show trend
-    historical_data = latest_forecast[~latest_forecast['historical'].isna()]
-    historical_data = historical_data[historical_data['ds'] >= one_year_ago]
-
-    # Plot historical data
-    historical_data['smoothed'] = historical_data['historical'].rolling(window=7, min_periods=1).mean()
     ax.plot(historical_data['ds'], historical_data['smoothed'], 
             color='blue', alpha=0.6, linestyle='-', linewidth=2, 
             label='Smoothed Historical Data')
 
-
-    
-    # Plot forecast starting from the last historical date
-    forecast_start = historical_data['ds'].max()
-    forecast_mask = latest_forecast['ds'] > forecast_start
-
     # Plot the forecast line
-    ax.plot(latest_forecast.loc[forecast_mask, 'ds'], 
-            latest_forecast.loc[forecast_mask, 'yhat'], 
+    ax.plot(forecast_data['ds'], 
+            forecast_data['yhat'], 
             color='red', label='Forecast', linewidth=2)
 
     # Add confidence interval
     ax.fill_between(
-        latest_forecast.loc[forecast_mask, 'ds'],
-        latest_forecast.loc[forecast_mask, 'yhat_lower'],
-        latest_forecast.loc[forecast_mask, 'yhat_upper'],
+        forecast_data['ds'],
+        forecast_data['yhat_lower'],
+        forecast_data['yhat_upper'],
         color='red', alpha=0.2, label='95% Confidence Interval'
     )
 
@@ -196,31 +664,64 @@ def get_forecast_plot():
     ax.legend()
     plt.tight_layout()
 
-    # Save the plot to a BytesIO object and return it
+    # Save the plot to a BytesIO object and return its bytes
     buf = io.BytesIO()
-    fig.savefig(buf, format='png', bbox_inches='tight', dpi=300)
+    fig.savefig(buf, format=fmt, bbox_inches='tight', dpi=dpi)
     plt.close(fig)  # Close the figure to free memory
-    buf.seek(0)
-    return send_file(buf, mimetype='image/png')
+    return buf.getvalue()
+
+def get_forecast_plot(figsize=(12, 6), dpi=300, fmt='png'):
+    """
+    Sends the forecast plot as an image, rendered once per forecast version,
+    size, dpi and format and then served from the plot cache with an ETag.
+    """
+    version, forecast = get_versioned_forecast()
+    key = ('forecast', version, tuple(figsize), dpi, fmt)
+    return cached_plot_response(key, lambda: render_forecast_plot(forecast, figsize, dpi, fmt), fmt)
+
+def _columnar(df, columns, max_points=None, y_column=None):
+    """
+    Convert DataFrame columns to a compact {column: [values]} dict with ISO dates,
+    downsampled with LTTB on `y_column` when `max_points` is given.
+    """
+    if max_points and y_column:
+        df = df.iloc[lttb_indices(df['ds'].astype('int64'), df[y_column], max_points)]
+    result = {'ds': df['ds'].dt.strftime('%Y-%m-%d').tolist()}
+    for column in columns:
+        result[column] = df[column].round(3).tolist()
+    return result
+
+def get_forecast_chart_data(max_points=None):
+    """
+    Returns the series drawn by the forecast plot as columnar data, so clients can
+    draw the chart themselves. `max_points` caps each series via LTTB downsampling.
+    """
+    version, forecast = get_versioned_forecast()
+    historical_data, forecast_data, forecast_start = forecast_plot_series(forecast)
+    return {
+        'version': version,
+        'forecast_start': forecast_start.strftime('%Y-%m-%d'),
+        'history': _columnar(historical_data, ['smoothed'], max_points, 'smoothed'),
+        'forecast': _columnar(forecast_data, ['yhat', 'yhat_lower', 'yhat_upper'], max_points, 'yhat'),
+    }
 
 # @app.route('/new_transaction', methods=['POST'])
 def new_transaction():
     """
     Adds a new purchase transaction. Expects a JSON payload with 'purchaseId', 'timestamp', and 'cost'.
-    Inserting a new transaction triggers a refitting of the Prophet model.
+    Inserting a new transaction schedules a background refit of the Prophet model;
+    the previous forecast keeps being served until the refit finishes.
     """
-    global latest_forecast
     data = request.get_json()
     new_df = pd.DataFrame([data])
-    new_df['timestamp'] = pd.to_datetime(new_df['timestamp'])
     
-    # Append the new transaction to the 'purchases' table
-    new_df.to_sql('purchases', engine, if_exists='append', index=False)
+    # Append the new transaction to the 'purchases' table and the daily rollups
+    n_rows = append_purchases(new_df)
     
-    # Trigger refitting of the Prophet model
-    latest_forecast = run_etl_and_forecast()
+    # Let the scheduler coalesce this insert into the next refit of the Prophet model
+    refit_scheduler.notify(n_rows)
     
-    return jsonify({'message': 'New transaction added and Prophet model refitted.'}), 201
+    return jsonify({'message': 'New transaction added and Prophet model refit scheduled.'}), 201
 
 # ------------------------------
 # Temporary Testing Function to Display the Plot from the Backend
@@ -233,8 +734,7 @@ def display_plot_temporarily():
     forecast = run_etl_and_forecast()
 
     # Get the current date and filter the historical data to the last 365 days for plotting
-    # today = pd.Timestamp('today') <-- for production
-    today = pd.Timestamp('2023-12-31')
+    today = DEFAULT_AS_OF_DATE
     one_year_ago = today - pd.Timedelta(days=365)
     
     # Create plot
@@ -1,9 +1,20 @@
 import os
 import json
+import uuid
+import time
+import random
+import asyncio
+import weakref
+import datetime
+import threading
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 import logging
+from response_cache import MemoryLRUCache, SQLiteCache, TieredCache, make_cache_key
+from booking_schema import BOOKING_RESPONSE_SCHEMA, REQUIRED_FIELDS, parse_booking_response, repair_json
+from document_templates import DocumentTemplates
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -27,21 +38,370 @@ if not GEMINI_API_KEY:
 logger.info("Configuring Gemini API")
 genai.configure(api_key=GEMINI_API_KEY)
 
+# Output budget of the optional paragraph the model adds to templated emails
+PERSONALIZATION_MAX_TOKENS = int(os.getenv("PERSONALIZATION_MAX_TOKENS", "80"))
+
+# Generation settings per task: extraction asks for JSON mode with a response
+# schema, so the model returns a bare object we can validate; personalization
+# is capped at a small output budget.
+TASK_GENERATION_CONFIGS = {
+    "analysis": {
+        "response_mime_type": "application/json",
+        "response_schema": BOOKING_RESPONSE_SCHEMA,
+    },
+    "personalization": {
+        "max_output_tokens": PERSONALIZATION_MAX_TOKENS,
+    },
+}
+
+# How documents (emails and invoices) are produced: "llm" asks the model to write
+# the whole document, "template" renders the local Jinja2 templates.
+DOCUMENT_MODES = ("llm", "template")
+
+# Model per task. Extraction and short prose go to the cheaper flash model; tasks
+# not listed here, escalations and complex rejections use the processor's main model.
+DEFAULT_MODEL_ROUTES = {
+    "analysis": "gemini-1.5-flash",
+    "confirmation": "gemini-1.5-flash",
+    "rejection": "gemini-1.5-flash",
+    "personalization": "gemini-1.5-flash",
+}
+
+# List prices in USD per million (input, output) tokens, used to estimate per-route cost
+MODEL_PRICING = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+
+# How long cached responses stay valid per task, in seconds (0 disables caching for a task).
+# Extractions are deterministic for a given email, so they can live longer than prose.
+DEFAULT_CACHE_TTLS = {
+    "analysis": 24 * 60 * 60,
+    "confirmation": 60 * 60,
+    "rejection": 60 * 60,
+    "invoice": 60 * 60,
+    "personalization": 60 * 60,
+}
+
+
+def default_response_cache() -> TieredCache:
+    """
+    In-process LRU for Gemini responses, plus a SQLite tier shared across
+    workers and restarts when GEMINI_CACHE_PATH is set.
+    """
+    cache_path = os.getenv("GEMINI_CACHE_PATH")
+    return TieredCache(MemoryLRUCache(max_entries=512), SQLiteCache(cache_path) if cache_path else None)
+
+# Transient API errors that are worth retrying with backoff
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
+
 class GeminiEmailProcessor:
     """
-    Uses Gemini API to process booking request emails and generate responses
+    Uses Gemini API to process booking request emails and generate responses.
+    Every method has an async twin (e.g. analyze_booking_request_async) that shares
+    its prompt and parsing, but awaits the model call under a bounded semaphore.
+    In "template" document mode, confirmations, rejections and invoices are rendered
+    from local templates instead, optionally with one model-written paragraph.
+    Each task is routed to its model in `model_routes`; `model_name` is the main
+    model, used for unrouted tasks, complex rejections and escalations when a
+    routed model's extraction fails validation.
     """
-    def __init__(self, model_name="gemini-1.5-pro"):
-        self.model = genai.GenerativeModel(model_name)
-        logger.info(f"Initialized GeminiEmailProcessor with model: {model_name}")
-    
+    def __init__(self, model_name="gemini-1.5-pro", max_concurrency: int = 8,
+                 max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 20.0,
+                 cache=None, cache_ttls: Optional[Dict[str, float]] = None,
+                 document_mode: str = "llm", personalize: bool = False,
+                 templates: Optional[DocumentTemplates] = None,
+                 model_routes: Optional[Dict[str, str]] = None):
+        if document_mode not in DOCUMENT_MODES:
+            raise ValueError(f"Unsupported document mode: {document_mode}")
+        self.model_name = model_name
+        self.model_routes = {**DEFAULT_MODEL_ROUTES, **(model_routes or {})}
+        self._models = {}
+        self.model = self._get_model(model_name)
+        self._route_stats = {}
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # One semaphore per event loop, since asyncio primitives are bound to the loop using them
+        self._semaphores = weakref.WeakKeyDictionary()
+        # Responses are cached by model, task and normalized prompt. Any object with
+        # get(key), set(key, value, ttl) and delete(key) can be plugged in as the cache.
+        self.cache = cache if cache is not None else default_response_cache()
+        self.cache_ttls = {**DEFAULT_CACHE_TTLS, **(cache_ttls or {})}
+        self._cache_stats = {}
+        self._stats_lock = threading.Lock()
+        self.document_mode = document_mode
+        self.personalize = personalize
+        self.templates = templates if templates is not None else DocumentTemplates()
+        logger.info(f"Initialized GeminiEmailProcessor with model: {model_name}, document mode: {document_mode}")
+
+    # ------------------------------
+    # Model routing
+    # ------------------------------
+    def _get_model(self, model_name: str):
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models[model_name] = genai.GenerativeModel(model_name)
+        return model
+
+    def _route(self, task: str) -> str:
+        """Name of the model that handles a task."""
+        return self.model_routes.get(task, self.model_name)
+
+    def _model_chain(self, task: str) -> List[str]:
+        """The routed model, followed by the main model to escalate to if its output fails validation."""
+        routed = self._route(task)
+        return [routed] if routed == self.model_name else [routed, self.model_name]
+
+    def _route_stat(self, task: str, model_name: str) -> Dict[str, float]:
+        # Callers hold _stats_lock
+        return self._route_stats.setdefault((task, model_name), {
+            "calls": 0, "errors": 0, "escalations": 0,
+            "latency_s": 0.0, "prompt_tokens": 0, "output_tokens": 0,
+        })
+
+    def _record_call(self, task: str, model_name: str, started: float, response=None) -> None:
+        """Record latency and token usage of one model call (response is None if it failed)."""
+        usage = getattr(response, "usage_metadata", None)
+        with self._stats_lock:
+            stats = self._route_stat(task, model_name)
+            stats["calls"] += 1
+            stats["latency_s"] += time.perf_counter() - started
+            if response is None:
+                stats["errors"] += 1
+            elif usage is not None:
+                stats["prompt_tokens"] += getattr(usage, "prompt_token_count", 0) or 0
+                stats["output_tokens"] += getattr(usage, "candidates_token_count", 0) or 0
+
+    def _record_escalation(self, task: str, from_model: str, to_model: str) -> None:
+        logger.warning(f"Gemini {task} output from {from_model} failed validation, escalating to {to_model}")
+        with self._stats_lock:
+            self._route_stat(task, from_model)["escalations"] += 1
+
+    def get_route_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per task and model: calls, errors, escalations away from the model, average
+        latency, token counts and the estimated cost from MODEL_PRICING.
+        """
+        with self._stats_lock:
+            snapshot = {route: dict(stats) for route, stats in self._route_stats.items()}
+        result = {}
+        for (task, model_name), stats in snapshot.items():
+            input_price, output_price = MODEL_PRICING.get(model_name, (0.0, 0.0))
+            stats["avg_latency_ms"] = round(1000 * stats.pop("latency_s") / stats["calls"], 1) if stats["calls"] else 0.0
+            stats["cost_usd"] = round(
+                (stats["prompt_tokens"] * input_price + stats["output_tokens"] * output_price) / 1e6, 6)
+            result[f"{task}:{model_name}"] = stats
+        return result
+
+    # ------------------------------
+    # Model calls with retry
+    # ------------------------------
+    def _backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff: a random delay up to base_delay * 2^attempt, capped."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _call_model(self, prompt: str, task: str, model_name: str) -> str:
+        """Call the model and return the response text, retrying transient API errors."""
+        model = self._get_model(model_name)
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = model.generate_content(
+                    prompt, generation_config=TASK_GENERATION_CONFIGS.get(task))
+            except Exception as e:
+                self._record_call(task, model_name, started)
+                if not isinstance(e, RETRYABLE_ERRORS) or attempt == self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"Gemini {task} call failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self._record_call(task, model_name, started, response)
+            return response.text
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def _call_model_async(self, prompt: str, task: str, model_name: str) -> str:
+        """
+        Await the model and return the response text, retrying transient API errors.
+        At most max_concurrency calls are in flight per event loop; the semaphore is
+        released while backing off so other requests can use the slot.
+        """
+        semaphore = self._get_semaphore()
+        model = self._get_model(model_name)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        response = await model.generate_content_async(
+                            prompt, generation_config=TASK_GENERATION_CONFIGS.get(task))
+                    except Exception:
+                        self._record_call(task, model_name, started)
+                        raise
+                    self._record_call(task, model_name, started, response)
+                return response.text
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"Gemini {task} call failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    # ------------------------------
+    # Response cache
+    # ------------------------------
+    def _cache_key(self, prompt: str, task: str, volatile: Optional[Dict[str, str]] = None,
+                   model_name: Optional[str] = None) -> str:
+        """
+        Content address of a request: model name, task and the prompt with whitespace
+        collapsed and volatile values (like a fresh invoice number) replaced by placeholders.
+        """
+        for placeholder, value in (volatile or {}).items():
+            prompt = prompt.replace(value, placeholder)
+        return make_cache_key(model_name or self._route(task), task, " ".join(prompt.split()))
+
+    def _count(self, task: str, outcome: str) -> None:
+        with self._stats_lock:
+            stats = self._cache_stats.setdefault(task, {"hits": 0, "misses": 0})
+            stats[outcome] += 1
+
+    def _cache_get(self, key: str, task: str, volatile: Optional[Dict[str, str]] = None) -> Optional[str]:
+        if self.cache_ttls.get(task, 0) <= 0:
+            return None
+        value = self.cache.get(key)
+        if value is None:
+            self._count(task, "misses")
+            return None
+        self._count(task, "hits")
+        for placeholder, actual in (volatile or {}).items():
+            value = value.replace(placeholder, actual)
+        return value
+
+    def _cache_set(self, key: str, task: str, text: str, volatile: Optional[Dict[str, str]] = None) -> None:
+        ttl = self.cache_ttls.get(task, 0)
+        if ttl <= 0:
+            return
+        for placeholder, actual in (volatile or {}).items():
+            text = text.replace(actual, placeholder)
+        try:
+            self.cache.set(key, text, ttl)
+        except Exception as e:
+            logger.warning(f"Could not cache Gemini {task} response: {str(e)}")
+
+    def _forget(self, prompt: str, task: str, volatile: Optional[Dict[str, str]] = None,
+                model_name: Optional[str] = None) -> None:
+        """Drop a cached response that turned out to be unusable, so the next call asks the model again."""
+        try:
+            self.cache.delete(self._cache_key(prompt, task, volatile, model_name))
+        except Exception as e:
+            logger.warning(f"Could not drop cached Gemini {task} response: {str(e)}")
+
+    def get_cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Return cache hit/miss counters per task."""
+        with self._stats_lock:
+            return {task: dict(stats) for task, stats in self._cache_stats.items()}
+
+    def _generate(self, prompt: str, task: str, volatile: Optional[Dict[str, str]] = None,
+                  model_name: Optional[str] = None) -> str:
+        """
+        Return the model's response text for a prompt, from the cache when an
+        identical request was answered before. `volatile` maps placeholders to
+        per-request values that are excluded from the cache key and swapped back
+        into cached responses. The task's routed model is used unless `model_name` is given.
+        """
+        model_name = model_name or self._route(task)
+        key = self._cache_key(prompt, task, volatile, model_name)
+        cached = self._cache_get(key, task, volatile)
+        if cached is not None:
+            return cached
+        text = self._call_model(prompt, task, model_name)
+        self._cache_set(key, task, text, volatile)
+        return text
+
+    async def _generate_async(self, prompt: str, task: str, volatile: Optional[Dict[str, str]] = None,
+                              model_name: Optional[str] = None) -> str:
+        """Async version of _generate."""
+        model_name = model_name or self._route(task)
+        key = self._cache_key(prompt, task, volatile, model_name)
+        cached = self._cache_get(key, task, volatile)
+        if cached is not None:
+            return cached
+        text = await self._call_model_async(prompt, task, model_name)
+        self._cache_set(key, task, text, volatile)
+        return text
+
+    # ------------------------------
+    # Booking analysis
+    # ------------------------------
+    def _booking_analysis_prompt(self, email_body: str) -> str:
+        return f"""
+        Extract booking request details from the following email.
+        Return the information in a structured JSON format with the following fields:
+        - client_name: Name of the person making the request
+        - client_email: Email address of the requester
+        - requested_date: The date requested for booking (in YYYY-MM-DD format)
+        - start_time: The start time (in HH:MM format)
+        - end_time: The end time (in HH:MM format)
+        - purpose: The purpose of the booking
+        - attendees: Number of attendees (integer)
+        - special_requests: Any special requests mentioned
+
+        If any information is not provided in the email, use null for that field.
+
+        Email:
+        {email_body}
+        """
+
+    def _parse_booking_analysis(self, result_text: str) -> Dict[str, Any]:
+        """
+        Repair and validate the extraction without evaluating it as code.
+        Fields that fail validation come back as None and are listed under
+        "field_errors", instead of failing the whole extraction.
+        """
+        booking, field_errors = parse_booking_response(result_text)
+        booking_details = booking.to_dict()
+        if field_errors:
+            logger.warning(f"Booking fields failed validation: {field_errors}")
+            booking_details["field_errors"] = field_errors
+
+        logger.info(f"Successfully extracted booking details: {booking_details}")
+        return booking_details
+
+    @staticmethod
+    def _empty_booking_details(error: Exception) -> Dict[str, Any]:
+        return {
+            "client_name": None,
+            "client_email": None,
+            "requested_date": None,
+            "start_time": None,
+            "end_time": None,
+            "purpose": None,
+            "attendees": None,
+            "special_requests": None,
+            "error": str(error)
+        }
+
     def analyze_booking_request(self, email_body: str) -> Dict[str, Any]:
         """
         Analyzes an email to extract booking request details using Gemini AI
-        
+
         Args:
             email_body: The body text of the email
-            
+
         Returns:
             dict: Extracted booking details including:
                 - client_name: Name of the client
@@ -52,150 +412,225 @@ class GeminiEmailProcessor:
                 - purpose: Purpose of the booking
                 - attendees: Number of attendees
                 - special_requests: Any special requests
+
+        The routed (flash) model answers first; if its output can't be parsed or a
+        required field fails validation, the request is escalated to the main model.
+        Failures in optional fields (e.g. client_email) are kept under "field_errors".
         """
-        prompt = f"""
-        Extract booking request details from the following email. 
-        Return the information in a structured JSON format with the following fields:
-        - client_name: Name of the person making the request
-        - client_email: Email address of the requester
-        - requested_date: The date requested for booking (in YYYY-MM-DD format)
-        - start_time: The start time (in HH:MM format)
-        - end_time: The end time (in HH:MM format)
-        - purpose: The purpose of the booking
-        - attendees: Number of attendees (integer)
-        - special_requests: Any special requests mentioned
-        
-        If any information is not provided in the email, use null for that field.
-        
-        Email:
-        {email_body}
-        """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            
-            # Extract the JSON from the response
-            result_text = response.text
-            # Handle the case where the response might contain markdown code blocks
-            if "```json" in result_text:
-                json_str = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                json_str = result_text.split("```")[1].strip()
-            else:
-                json_str = result_text.strip()
-                
-            # Try to parse as JSON first
+        prompt = self._booking_analysis_prompt(email_body)
+        models = self._model_chain("analysis")
+        booking_details, error = None, None
+        for i, model_name in enumerate(models):
             try:
-                booking_details = json.loads(json_str)
-            except json.JSONDecodeError:
-                # Fall back to eval if JSON parsing fails
-                booking_details = eval(json_str)
-                
-            logger.info(f"Successfully extracted booking details: {booking_details}")
+                parsed = self._parse_booking_analysis(self._generate(prompt, "analysis", model_name=model_name))
+            except ValueError as e:
+                parsed, error = None, e
+            except Exception as e:
+                logger.error(f"Error analyzing booking request: {str(e)}")
+                return self._empty_booking_details(e)
+            if parsed is not None:
+                booking_details = parsed
+            if self._analysis_done(parsed, i, models, prompt):
+                return parsed
+        return self._analysis_result(booking_details, error)
+
+    async def analyze_booking_request_async(self, email_body: str) -> Dict[str, Any]:
+        """Async version of analyze_booking_request."""
+        prompt = self._booking_analysis_prompt(email_body)
+        models = self._model_chain("analysis")
+        booking_details, error = None, None
+        for i, model_name in enumerate(models):
+            try:
+                parsed = self._parse_booking_analysis(
+                    await self._generate_async(prompt, "analysis", model_name=model_name))
+            except ValueError as e:
+                parsed, error = None, e
+            except Exception as e:
+                logger.error(f"Error analyzing booking request: {str(e)}")
+                return self._empty_booking_details(e)
+            if parsed is not None:
+                booking_details = parsed
+            if self._analysis_done(parsed, i, models, prompt):
+                return parsed
+        return self._analysis_result(booking_details, error)
+
+    def _analysis_done(self, booking_details: Optional[Dict[str, Any]], i: int,
+                       models: List[str], prompt: str) -> bool:
+        """
+        Whether models[i]'s extraction is the answer. Otherwise the escalation is
+        recorded; the response stays cached, so a repeated request escalates
+        straight from the cache to the next model's cached answer. Only the last
+        model's unparseable response is dropped, so the next call asks it again.
+        """
+        if booking_details is not None:
+            failed_required = set(booking_details.get("field_errors", {})) & set(REQUIRED_FIELDS)
+            # The last model's partially valid output is still the best answer available
+            if not failed_required or i + 1 == len(models):
+                return True
+        if i + 1 < len(models):
+            self._record_escalation("analysis", models[i], models[i + 1])
+        else:
+            self._forget(prompt, "analysis", model_name=models[i])
+        return False
+
+    def _analysis_result(self, booking_details: Optional[Dict[str, Any]],
+                         error: Optional[Exception]) -> Dict[str, Any]:
+        """Outcome once no model gave a usable extraction."""
+        if booking_details is not None:
+            # Partially valid: keep it, with the failing fields listed under "field_errors"
             return booking_details
-            
-        except Exception as e:
-            logger.error(f"Error analyzing booking request: {str(e)}")
-            return {
-                "client_name": None,
-                "client_email": None,
-                "requested_date": None,
-                "start_time": None,
-                "end_time": None,
-                "purpose": None,
-                "attendees": None,
-                "special_requests": None,
-                "error": str(e)
-            }
-    
-    def generate_booking_confirmation(self, booking_details: Dict[str, Any]) -> str:
+        logger.error(f"Error analyzing booking request: {str(error)}")
+        return self._empty_booking_details(error)
+
+    async def analyze_booking_requests_batch(self, email_bodies: List[str]) -> List[Dict[str, Any]]:
         """
-        Generates a confirmation email response for a successful booking
-        
-        Args:
-            booking_details: Dictionary containing booking details
-            
-        Returns:
-            str: The generated email body text
+        Analyzes many emails concurrently (bounded by max_concurrency).
+        Returns the booking details in the same order as the emails; a failed
+        email yields the usual dict of nulls with an "error" key.
         """
-        client_name = booking_details.get("client_name", "Valued Client")
-        date = booking_details.get("requested_date", "the requested date")
-        start_time = booking_details.get("start_time", "the requested time")
-        end_time = booking_details.get("end_time", "")
-        purpose = booking_details.get("purpose", "your event")
-        
+        return await asyncio.gather(*(self.analyze_booking_request_async(body) for body in email_bodies))
+
+    # ------------------------------
+    # Confirmation and rejection emails
+    # ------------------------------
+    @staticmethod
+    def _booking_summary(booking_details: Dict[str, Any]):
+        """Return (client_name, date, time_slot, purpose) with friendly defaults."""
+        client_name = booking_details.get("client_name") or "Valued Client"
+        date = booking_details.get("requested_date") or "the requested date"
+        start_time = booking_details.get("start_time") or "the requested time"
+        end_time = booking_details.get("end_time") or ""
+        purpose = booking_details.get("purpose") or "your event"
+
         time_slot = start_time
         if end_time:
             time_slot = f"{start_time} to {end_time}"
-            
-        prompt = f"""
+        return client_name, date, time_slot, purpose
+
+    def _personalization_prompt(self, booking_details: Dict[str, Any], kind: str) -> str:
+        client_name, date, time_slot, purpose = self._booking_summary(booking_details)
+        # Only the special requests are free text; cap them so the prompt stays small too
+        special_requests = (booking_details.get("special_requests") or "none")[:300]
+        outcome = "has been confirmed" if kind == "confirmation" else "could not be accommodated"
+        return f"""
+        Write one short, warm paragraph (at most two sentences, no greeting or sign-off)
+        for an email telling {client_name} that their booking for {purpose} on {date} at {time_slot} {outcome}.
+        Acknowledge their special requests if there are any: {special_requests}
+        Return only the paragraph.
+        """
+
+    @staticmethod
+    def _trim_paragraph(text: str) -> Optional[str]:
+        """Keep the first paragraph, cut back to the last full sentence if the token budget truncated it."""
+        paragraph = text.strip().split("\n\n")[0].strip()
+        if paragraph and paragraph[-1] not in ".!?":
+            end = max(paragraph.rfind(". "), paragraph.rfind("! "), paragraph.rfind("? "))
+            paragraph = paragraph[:end + 1] if end != -1 else ""
+        return paragraph or None
+
+    def _personal_note(self, booking_details: Dict[str, Any], kind: str) -> Optional[str]:
+        """One model-written paragraph for a templated email, or None if disabled or it fails."""
+        if not self.personalize:
+            return None
+        try:
+            return self._trim_paragraph(
+                self._generate(self._personalization_prompt(booking_details, kind), "personalization"))
+        except Exception as e:
+            logger.warning(f"Skipping personalization: {str(e)}")
+            return None
+
+    async def _personal_note_async(self, booking_details: Dict[str, Any], kind: str) -> Optional[str]:
+        """Async version of _personal_note."""
+        if not self.personalize:
+            return None
+        try:
+            return self._trim_paragraph(
+                await self._generate_async(self._personalization_prompt(booking_details, kind), "personalization"))
+        except Exception as e:
+            logger.warning(f"Skipping personalization: {str(e)}")
+            return None
+
+    def _confirmation_prompt(self, booking_details: Dict[str, Any]) -> str:
+        client_name, date, time_slot, purpose = self._booking_summary(booking_details)
+        return f"""
         Generate a professional and friendly booking confirmation email to {client_name}.
         The booking is confirmed for {date} at {time_slot} for {purpose}.
-        
+
         The email should:
         1. Start with a personalized greeting
         2. Confirm the booking details (date, time, purpose)
         3. Include any special instructions or next steps
         4. End with a professional sign-off
         5. Be written in a friendly, professional tone
-        
+
         Do not use placeholder text - generate a complete, ready-to-send email.
         """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            logger.error(f"Error generating booking confirmation: {str(e)}")
-            # Fallback template if AI generation fails
-            return f"""
-            Dear {client_name},
-            
-            Thank you for your booking request. We're pleased to confirm your booking for {purpose} on {date} at {time_slot}.
-            
-            If you have any questions or need to make changes, please don't hesitate to contact us.
-            
-            Best regards,
-            The ProfitPilot Team
-            """
-    
-    def generate_booking_rejection(self, booking_details: Dict[str, Any], 
-                                  alternative_slots: List[Dict[str, Any]] = None) -> str:
+
+    def _render_confirmation(self, booking_details: Dict[str, Any], company_id: Optional[str] = None,
+                             personal_note: Optional[str] = None) -> str:
+        """Render the confirmation template (also the fallback if AI generation fails)"""
+        client_name, date, time_slot, purpose = self._booking_summary(booking_details)
+        return self.templates.render("confirmation.txt", {
+            "client_name": client_name, "date": date, "time_slot": time_slot,
+            "purpose": purpose, "personal_note": personal_note
+        }, company_id)
+
+    def generate_booking_confirmation(self, booking_details: Dict[str, Any],
+                                      company_id: Optional[str] = None) -> str:
         """
-        Generates a rejection email with alternative time slots
-        
+        Generates a confirmation email response for a successful booking
+
         Args:
             booking_details: Dictionary containing booking details
-            alternative_slots: List of alternative time slots
-            
+            company_id: Optional company whose templates are used in template mode
+
         Returns:
             str: The generated email body text
         """
-        client_name = booking_details.get("client_name", "Valued Client")
-        date = booking_details.get("requested_date", "the requested date")
-        start_time = booking_details.get("start_time", "the requested time")
-        end_time = booking_details.get("end_time", "")
-        purpose = booking_details.get("purpose", "your event")
-        
-        time_slot = start_time
-        if end_time:
-            time_slot = f"{start_time} to {end_time}"
-            
-        alternatives_text = ""
-        if alternative_slots and len(alternative_slots) > 0:
-            alternatives_text = "We can offer the following alternative slots:\n"
-            for i, slot in enumerate(alternative_slots[:3]):  # Limit to top 3 alternatives
-                slot_date = slot.get("date", "")
-                slot_start = slot.get("start_time", "")
-                slot_end = slot.get("end_time", "")
-                alternatives_text += f"- {slot_date} from {slot_start} to {slot_end}\n"
-                
-        prompt = f"""
+        if self.document_mode == "template":
+            return self._render_confirmation(
+                booking_details, company_id, self._personal_note(booking_details, "confirmation"))
+        try:
+            return self._generate(self._confirmation_prompt(booking_details), "confirmation")
+        except Exception as e:
+            logger.error(f"Error generating booking confirmation: {str(e)}")
+            return self._render_confirmation(booking_details, company_id)
+
+    async def generate_booking_confirmation_async(self, booking_details: Dict[str, Any],
+                                                  company_id: Optional[str] = None) -> str:
+        """Async version of generate_booking_confirmation."""
+        if self.document_mode == "template":
+            return self._render_confirmation(
+                booking_details, company_id, await self._personal_note_async(booking_details, "confirmation"))
+        try:
+            return await self._generate_async(self._confirmation_prompt(booking_details), "confirmation")
+        except Exception as e:
+            logger.error(f"Error generating booking confirmation: {str(e)}")
+            return self._render_confirmation(booking_details, company_id)
+
+    @staticmethod
+    def _alternatives_text(alternative_slots: Optional[List[Dict[str, Any]]], header: str) -> str:
+        if not alternative_slots:
+            return ""
+        text = header
+        for slot in alternative_slots[:3]:  # Limit to top 3 alternatives
+            slot_date = slot.get("date", "")
+            slot_start = slot.get("start_time", "")
+            slot_end = slot.get("end_time", "")
+            text += f"- {slot_date} from {slot_start} to {slot_end}\n"
+        return text
+
+    def _rejection_prompt(self, booking_details: Dict[str, Any],
+                          alternative_slots: List[Dict[str, Any]] = None) -> str:
+        client_name, date, time_slot, purpose = self._booking_summary(booking_details)
+        alternatives_text = self._alternatives_text(
+            alternative_slots, "We can offer the following alternative slots:\n")
+        return f"""
         Generate a professional and considerate rejection email to {client_name}.
         The booking for {date} at {time_slot} for {purpose} cannot be accommodated.
-        
+
         {alternatives_text}
-        
+
         The email should:
         1. Start with a personalized greeting
         2. Express regret that the requested slot is not available
@@ -203,68 +638,85 @@ class GeminiEmailProcessor:
         4. Invite the client to respond with their preference or request another time
         5. End with a professional sign-off
         6. Be written in a friendly, professional tone
-        
+
         Do not use placeholder text - generate a complete, ready-to-send email.
         """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            logger.error(f"Error generating booking rejection: {str(e)}")
-            # Fallback template if AI generation fails
-            alt_text = ""
-            if alternative_slots and len(alternative_slots) > 0:
-                alt_text = "However, we can offer the following alternative slots:\n"
-                for i, slot in enumerate(alternative_slots[:3]):
-                    slot_date = slot.get("date", "")
-                    slot_start = slot.get("start_time", "")
-                    slot_end = slot.get("end_time", "")
-                    alt_text += f"- {slot_date} from {slot_start} to {slot_end}\n"
-                    
-            return f"""
-            Dear {client_name},
-            
-            Thank you for your booking request for {purpose} on {date} at {time_slot}.
-            
-            Unfortunately, we are unable to accommodate your request for this specific time.
-            
-            {alt_text}
-            
-            Please let us know if any of these alternatives would work for you, or if you'd like to suggest another time.
-            
-            Best regards,
-            The ProfitPilot Team
-            """
-            
-    def generate_invoice(self, booking_details: Dict[str, Any], 
-                         pricing_info: Dict[str, Any] = None) -> Dict[str, Any]:
+
+    def _render_rejection(self, booking_details: Dict[str, Any],
+                          alternative_slots: List[Dict[str, Any]] = None, company_id: Optional[str] = None,
+                          personal_note: Optional[str] = None) -> str:
+        """Render the rejection template (also the fallback if AI generation fails)"""
+        client_name, date, time_slot, purpose = self._booking_summary(booking_details)
+        slots = [{
+            "date": slot.get("date", ""),
+            "start_time": slot.get("start_time", ""),
+            "end_time": slot.get("end_time", "")
+        } for slot in (alternative_slots or [])[:3]]  # Limit to top 3 alternatives
+        return self.templates.render("rejection.txt", {
+            "client_name": client_name, "date": date, "time_slot": time_slot,
+            "purpose": purpose, "alternative_slots": slots, "personal_note": personal_note
+        }, company_id)
+
+    def _rejection_model(self, booking_details: Dict[str, Any],
+                         alternative_slots: Optional[List[Dict[str, Any]]]) -> str:
+        """Several alternatives or special requests to address need the main model."""
+        if len(alternative_slots or []) > 1 or booking_details.get("special_requests"):
+            return self.model_name
+        return self._route("rejection")
+
+    def generate_booking_rejection(self, booking_details: Dict[str, Any],
+                                  alternative_slots: List[Dict[str, Any]] = None,
+                                  company_id: Optional[str] = None) -> str:
         """
-        Generates an invoice for a booking using Gemini AI
-        
+        Generates a rejection email with alternative time slots
+
         Args:
             booking_details: Dictionary containing booking details
-            pricing_info: Optional dictionary with pricing information
-            
+            alternative_slots: List of alternative time slots
+            company_id: Optional company whose templates are used in template mode
+
         Returns:
-            dict: Invoice details including:
-                - invoice_number: Unique invoice identifier
-                - invoice_date: Date of invoice generation
-                - due_date: Payment due date
-                - items: List of billable items
-                - subtotal: Sum before tax
-                - tax: Tax amount
-                - total: Total amount due
-                - html_content: Formatted HTML invoice that can be displayed
+            str: The generated email body text
         """
-        client_name = booking_details.get("client_name", "Valued Client")
-        client_email = booking_details.get("client_email", "client@example.com")
-        date = booking_details.get("requested_date", "")
-        start_time = booking_details.get("start_time", "")
-        end_time = booking_details.get("end_time", "")
-        purpose = booking_details.get("purpose", "Event")
-        attendees = booking_details.get("attendees", 1)
-        
+        if self.document_mode == "template":
+            return self._render_rejection(booking_details, alternative_slots, company_id,
+                                          self._personal_note(booking_details, "rejection"))
+        try:
+            return self._generate(self._rejection_prompt(booking_details, alternative_slots), "rejection",
+                                  model_name=self._rejection_model(booking_details, alternative_slots))
+        except Exception as e:
+            logger.error(f"Error generating booking rejection: {str(e)}")
+            return self._render_rejection(booking_details, alternative_slots, company_id)
+
+    async def generate_booking_rejection_async(self, booking_details: Dict[str, Any],
+                                               alternative_slots: List[Dict[str, Any]] = None,
+                                               company_id: Optional[str] = None) -> str:
+        """Async version of generate_booking_rejection."""
+        if self.document_mode == "template":
+            return self._render_rejection(booking_details, alternative_slots, company_id,
+                                          await self._personal_note_async(booking_details, "rejection"))
+        try:
+            return await self._generate_async(
+                self._rejection_prompt(booking_details, alternative_slots), "rejection",
+                model_name=self._rejection_model(booking_details, alternative_slots))
+        except Exception as e:
+            logger.error(f"Error generating booking rejection: {str(e)}")
+            return self._render_rejection(booking_details, alternative_slots, company_id)
+
+    # ------------------------------
+    # Invoices
+    # ------------------------------
+    def _prepare_invoice(self, booking_details: Dict[str, Any],
+                         pricing_info: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Compute the invoice number, dates and amounts for a booking."""
+        client_name = booking_details.get("client_name") or "Valued Client"
+        client_email = booking_details.get("client_email") or "client@example.com"
+        date = booking_details.get("requested_date") or ""
+        start_time = booking_details.get("start_time") or ""
+        end_time = booking_details.get("end_time") or ""
+        purpose = booking_details.get("purpose") or "Event"
+        attendees = booking_details.get("attendees") or 1
+
         # Default pricing if not provided
         if not pricing_info:
             pricing_info = {
@@ -272,7 +724,7 @@ class GeminiEmailProcessor:
                 "attendee_fee": 25,
                 "tax_rate": 0.08  # 8% tax
             }
-            
+
         # Calculate duration in hours
         duration = 1.0  # Default to 1 hour
         if start_time and end_time:
@@ -283,229 +735,172 @@ class GeminiEmailProcessor:
                 duration = max(0.5, duration)  # Minimum 30 minutes
             except:
                 logger.warning(f"Could not parse start/end times: {start_time}/{end_time}")
-        
+
         # Generate a unique invoice number
-        import datetime
-        import uuid
         today = datetime.datetime.now()
         invoice_number = f"INV-{today.strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
         invoice_date = today.strftime("%Y-%m-%d")
         due_date = (today + datetime.timedelta(days=30)).strftime("%Y-%m-%d")
-        
+
         # Calculate costs
         hourly_rate = pricing_info.get("hourly_rate", 150)
         attendee_fee = pricing_info.get("attendee_fee", 25)
         tax_rate = pricing_info.get("tax_rate", 0.08)
-        
+
         venue_cost = hourly_rate * duration
         attendee_cost = attendee_fee * attendees
         subtotal = venue_cost + attendee_cost
         tax = subtotal * tax_rate
         total = subtotal + tax
-        
-        prompt = f"""
+
+        return {
+            "client_name": client_name, "client_email": client_email, "date": date,
+            "start_time": start_time, "end_time": end_time, "purpose": purpose,
+            "attendees": attendees, "duration": duration,
+            "invoice_number": invoice_number, "invoice_date": invoice_date, "due_date": due_date,
+            "hourly_rate": hourly_rate, "attendee_fee": attendee_fee, "tax_rate": tax_rate,
+            "venue_cost": venue_cost, "attendee_cost": attendee_cost,
+            "subtotal": subtotal, "tax": tax, "total": total
+        }
+
+    @staticmethod
+    def _invoice_volatile(inv: Dict[str, Any]) -> Dict[str, str]:
+        """The fresh invoice number differs on every call, so it is kept out of the cache key."""
+        return {"{{invoice_number}}": inv['invoice_number']}
+
+    def _invoice_prompt(self, inv: Dict[str, Any]) -> str:
+        return f"""
         Generate a professional invoice for:
-        - Client: {client_name} ({client_email})
-        - Event: {purpose}
-        - Date: {date}
-        - Time: {start_time} to {end_time}
-        - Duration: {duration:.2f} hours
-        - Attendees: {attendees}
-        
+        - Client: {inv['client_name']} ({inv['client_email']})
+        - Event: {inv['purpose']}
+        - Date: {inv['date']}
+        - Time: {inv['start_time']} to {inv['end_time']}
+        - Duration: {inv['duration']:.2f} hours
+        - Attendees: {inv['attendees']}
+
         INVOICE DETAILS:
-        - Invoice #: {invoice_number}
-        - Date: {invoice_date}
-        - Due Date: {due_date}
-        
+        - Invoice #: {inv['invoice_number']}
+        - Date: {inv['invoice_date']}
+        - Due Date: {inv['due_date']}
+
         LINE ITEMS:
-        1. Venue Rental: ${venue_cost:.2f} ({duration:.2f} hours at ${hourly_rate}/hour)
-        2. Attendee Fee: ${attendee_cost:.2f} ({attendees} attendees at ${attendee_fee}/person)
-        
-        - Subtotal: ${subtotal:.2f}
-        - Tax ({tax_rate*100:.1f}%): ${tax:.2f}
-        - Total Due: ${total:.2f}
-        
+        1. Venue Rental: ${inv['venue_cost']:.2f} ({inv['duration']:.2f} hours at ${inv['hourly_rate']}/hour)
+        2. Attendee Fee: ${inv['attendee_cost']:.2f} ({inv['attendees']} attendees at ${inv['attendee_fee']}/person)
+
+        - Subtotal: ${inv['subtotal']:.2f}
+        - Tax ({inv['tax_rate']*100:.1f}%): ${inv['tax']:.2f}
+        - Total Due: ${inv['total']:.2f}
+
         Please generate a JSON response with the following:
         1. A complete, well-formatted HTML invoice that looks professional and can be displayed directly in a dashboard
         2. The structured invoice data
 
         The HTML should use modern design principles with a clean layout, proper spacing, and a professional color scheme.
         Include the ProfitPilot logo or name prominently.
-        
+
         Return the response as a JSON with two keys:
         - "html_content": The complete HTML for the invoice
         - "invoice_data": The structured invoice data including invoice_number, dates, line items, and totals
         """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            result_text = response.text
-            
-            # Extract the JSON
-            if "```json" in result_text:
-                json_str = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                json_str = result_text.split("```")[1].strip()
-            else:
-                json_str = result_text.strip()
-                
-            # Try to parse as JSON
-            try:
-                invoice_content = json.loads(json_str)
-            except json.JSONDecodeError:
-                # Fallback approach
-                logger.warning("Failed to parse JSON response from Gemini, using fallback")
-                invoice_content = {
-                    "html_content": self._generate_fallback_invoice_html(
-                        client_name, client_email, purpose, date, 
-                        start_time, end_time, invoice_number, 
-                        invoice_date, due_date, venue_cost, 
-                        attendee_cost, subtotal, tax, total
-                    ),
-                    "invoice_data": {
-                        "invoice_number": invoice_number,
-                        "invoice_date": invoice_date,
-                        "due_date": due_date,
-                        "client": {
-                            "name": client_name,
-                            "email": client_email
-                        },
-                        "booking": {
-                            "purpose": purpose,
-                            "date": date,
-                            "start_time": start_time,
-                            "end_time": end_time,
-                            "duration": duration,
-                            "attendees": attendees
-                        },
-                        "items": [
-                            {
-                                "description": f"Venue Rental ({duration:.2f} hours at ${hourly_rate}/hour)",
-                                "amount": venue_cost
-                            },
-                            {
-                                "description": f"Attendee Fee ({attendees} attendees at ${attendee_fee}/person)",
-                                "amount": attendee_cost
-                            }
-                        ],
-                        "subtotal": subtotal,
-                        "tax_rate": tax_rate,
-                        "tax": tax,
-                        "total": total
+
+    def _render_invoice(self, inv: Dict[str, Any], company_id: Optional[str] = None,
+                        error: Exception = None) -> Dict[str, Any]:
+        """Build the invoice from the HTML template and the computed amounts (also the fallback if AI generation fails)."""
+        invoice_content = {
+            "html_content": self.templates.render("invoice.html", inv, company_id),
+            "invoice_data": {
+                "invoice_number": inv['invoice_number'],
+                "invoice_date": inv['invoice_date'],
+                "due_date": inv['due_date'],
+                "client": {
+                    "name": inv['client_name'],
+                    "email": inv['client_email']
+                },
+                "booking": {
+                    "purpose": inv['purpose'],
+                    "date": inv['date'],
+                    "start_time": inv['start_time'],
+                    "end_time": inv['end_time'],
+                    "duration": inv['duration'],
+                    "attendees": inv['attendees']
+                },
+                "items": [
+                    {
+                        "description": f"Venue Rental ({inv['duration']:.2f} hours at ${inv['hourly_rate']}/hour)",
+                        "amount": inv['venue_cost']
+                    },
+                    {
+                        "description": f"Attendee Fee ({inv['attendees']} attendees at ${inv['attendee_fee']}/person)",
+                        "amount": inv['attendee_cost']
                     }
-                }
-            
-            logger.info(f"Successfully generated invoice #{invoice_number}")
-            return invoice_content
-            
+                ],
+                "subtotal": inv['subtotal'],
+                "tax_rate": inv['tax_rate'],
+                "tax": inv['tax'],
+                "total": inv['total']
+            }
+        }
+        if error is not None:
+            invoice_content["invoice_data"]["error"] = str(error)
+        return invoice_content
+
+    def _parse_invoice(self, result_text: str, inv: Dict[str, Any],
+                       company_id: Optional[str] = None) -> Dict[str, Any]:
+        # Try to parse as JSON
+        try:
+            invoice_content = repair_json(result_text)
+        except ValueError:
+            # Fallback approach
+            logger.warning("Failed to parse JSON response from Gemini, using fallback")
+            self._forget(self._invoice_prompt(inv), "invoice", self._invoice_volatile(inv))
+            invoice_content = self._render_invoice(inv, company_id)
+
+        logger.info(f"Successfully generated invoice #{inv['invoice_number']}")
+        return invoice_content
+
+    def generate_invoice(self, booking_details: Dict[str, Any],
+                         pricing_info: Dict[str, Any] = None,
+                         company_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Generates an invoice for a booking using Gemini AI
+
+        Args:
+            booking_details: Dictionary containing booking details
+            pricing_info: Optional dictionary with pricing information
+            company_id: Optional company whose invoice template is used
+
+        Returns:
+            dict: Invoice details including:
+                - invoice_number: Unique invoice identifier
+                - invoice_date: Date of invoice generation
+                - due_date: Payment due date
+                - items: List of billable items
+                - subtotal: Sum before tax
+                - tax: Tax amount
+                - total: Total amount due
+                - html_content: Formatted HTML invoice that can be displayed
+        """
+        inv = self._prepare_invoice(booking_details, pricing_info)
+        if self.document_mode == "template":
+            return self._render_invoice(inv, company_id)
+        try:
+            result_text = self._generate(self._invoice_prompt(inv), "invoice", self._invoice_volatile(inv))
+            return self._parse_invoice(result_text, inv, company_id)
         except Exception as e:
             logger.error(f"Error generating invoice: {str(e)}")
             # Return fallback invoice in case of error
-            return {
-                "html_content": self._generate_fallback_invoice_html(
-                    client_name, client_email, purpose, date, 
-                    start_time, end_time, invoice_number, 
-                    invoice_date, due_date, venue_cost, 
-                    attendee_cost, subtotal, tax, total
-                ),
-                "invoice_data": {
-                    "invoice_number": invoice_number,
-                    "invoice_date": invoice_date,
-                    "due_date": due_date,
-                    "client": {
-                        "name": client_name,
-                        "email": client_email
-                    },
-                    "booking": {
-                        "purpose": purpose,
-                        "date": date,
-                        "start_time": start_time,
-                        "end_time": end_time,
-                        "duration": duration,
-                        "attendees": attendees
-                    },
-                    "items": [
-                        {
-                            "description": f"Venue Rental ({duration:.2f} hours at ${hourly_rate}/hour)",
-                            "amount": venue_cost
-                        },
-                        {
-                            "description": f"Attendee Fee ({attendees} attendees at ${attendee_fee}/person)",
-                            "amount": attendee_cost
-                        }
-                    ],
-                    "subtotal": subtotal,
-                    "tax_rate": tax_rate,
-                    "tax": tax,
-                    "total": total,
-                    "error": str(e)
-                }
-            }
-            
-    def _generate_fallback_invoice_html(self, client_name, client_email, purpose, date, 
-                                       start_time, end_time, invoice_number, 
-                                       invoice_date, due_date, venue_cost, 
-                                       attendee_cost, subtotal, tax, total):
-        """Generate a fallback HTML invoice template if AI generation fails"""
-        return f"""
-        <div style="font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; border: 1px solid #ddd;">
-            <div style="display: flex; justify-content: space-between; margin-bottom: 20px;">
-                <div>
-                    <h1 style="color: #2c3e50; margin: 0;">INVOICE</h1>
-                    <p style="color: #7f8c8d; margin: 5px 0 0 0;">ProfitPilot</p>
-                </div>
-                <div style="text-align: right;">
-                    <h2 style="color: #2c3e50; margin: 0;">#{invoice_number}</h2>
-                    <p style="margin: 5px 0 0 0;">Date: {invoice_date}</p>
-                    <p style="margin: 5px 0 0 0;">Due: {due_date}</p>
-                </div>
-            </div>
-            
-            <div style="background-color: #f9f9f9; padding: 15px; margin-bottom: 20px;">
-                <h3 style="margin-top: 0; color: #2c3e50;">Bill To:</h3>
-                <p style="margin: 5px 0;">{client_name}</p>
-                <p style="margin: 5px 0;">{client_email}</p>
-            </div>
-            
-            <table style="width: 100%; border-collapse: collapse; margin-bottom: 20px;">
-                <thead>
-                    <tr style="background-color: #2c3e50; color: white;">
-                        <th style="padding: 10px; text-align: left;">Description</th>
-                        <th style="padding: 10px; text-align: right;">Amount</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    <tr style="border-bottom: 1px solid #ddd;">
-                        <td style="padding: 10px;">{purpose} - Venue Rental</td>
-                        <td style="padding: 10px; text-align: right;">${venue_cost:.2f}</td>
-                    </tr>
-                    <tr style="border-bottom: 1px solid #ddd;">
-                        <td style="padding: 10px;">Attendee Fee</td>
-                        <td style="padding: 10px; text-align: right;">${attendee_cost:.2f}</td>
-                    </tr>
-                </tbody>
-            </table>
-            
-            <div style="display: flex; justify-content: flex-end;">
-                <div style="width: 250px;">
-                    <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                        <span>Subtotal:</span>
-                        <span>${subtotal:.2f}</span>
-                    </div>
-                    <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                        <span>Tax:</span>
-                        <span>${tax:.2f}</span>
-                    </div>
-                    <div style="display: flex; justify-content: space-between; font-weight: bold; font-size: 1.2em; margin-top: 10px; border-top: 2px solid #2c3e50; padding-top: 10px;">
-                        <span>Total:</span>
-                        <span>${total:.2f}</span>
-                    </div>
-                </div>
-            </div>
-            
-            <div style="margin-top: 40px; text-align: center; color: #7f8c8d; border-top: 1px solid #ddd; padding-top: 20px;">
-                <p>Thank you for your business!</p>
-                <p>Payment due within 30 days. Please make checks payable to ProfitPilot.</p>
-            </div>
-        </div>
-        """ 
\ No newline at end of file
+            return self._render_invoice(inv, company_id, e)
+
+    async def generate_invoice_async(self, booking_details: Dict[str, Any],
+                                     pricing_info: Dict[str, Any] = None,
+                                     company_id: Optional[str] = None) -> Dict[str, Any]:
+        """Async version of generate_invoice."""
+        inv = self._prepare_invoice(booking_details, pricing_info)
+        if self.document_mode == "template":
+            return self._render_invoice(inv, company_id)
+        try:
+            result_text = await self._generate_async(self._invoice_prompt(inv), "invoice", self._invoice_volatile(inv))
+            return self._parse_invoice(result_text, inv, company_id)
+        except Exception as e:
+            logger.error(f"Error generating invoice: {str(e)}")
+            return self._render_invoice(inv, company_id, e)
@@ -0,0 +1,474 @@
+"""
+Incremental IMAP fetching for the booking inbox.
+
+Instead of searching UNSEEN and downloading every message whole with one FETCH
+round-trip each, new mail is found by UID and fetched in batches: one FETCH per
+batch for the headers and BODYSTRUCTURE, then one per batch for just the text
+parts (BODY.PEEK, so attachments are never downloaded). The last UID seen is
+checkpointed per mailbox together with its UIDVALIDITY, so each poll only asks
+for mail that arrived since the previous one.
+
+MailboxWatcher keeps one connection open and waits in IMAP IDLE, so new mail is
+fetched as soon as the server announces it instead of on the next poll.
+
+Only the standard imaplib.IMAP4 methods are used (select, response, status, uid;
+IDLE goes through imaplib's line helpers), so any IMAP server works, including a
+local stand-in on a plain-text port.
+"""
+import os
+import re
+import json
+import email
+import imaplib
+import logging
+import quopri
+import base64
+import random
+import select
+import ssl
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Headers kept for each message (the rest of the header block is never downloaded)
+HEADER_FIELDS = ('FROM', 'TO', 'SUBJECT', 'DATE')
+
+# Untagged responses during IDLE that mean new mail arrived
+_NEW_MAIL = re.compile(rb'\* \d+ (?:EXISTS|RECENT)\b', re.IGNORECASE)
+
+# One token of a FETCH response: parentheses, a quoted string, a literal marker
+# closing a line, or an atom (section specs like BODY[HEADER.FIELDS (FROM)] included)
+_TOKEN = re.compile(
+    rb'\s*(?:(?P<open>\()|(?P<close>\))|"(?P<quoted>(?:[^"\\]|\\.)*)"'
+    rb'|\{(?P<literal>\d+)\}\s*$|(?P<atom>[^\s()"\[]+(?:\[[^\]]*\])?(?:<\d+>)?))')
+
+
+def connect(email_address: str, password: str, imap_server: str = "imap.gmail.com",
+            port: Optional[int] = None, use_ssl: bool = True) -> imaplib.IMAP4:
+    """Log in to an IMAP server. use_ssl=False connects in plain text (local test servers)."""
+    if use_ssl:
+        mail = imaplib.IMAP4_SSL(imap_server, port or imaplib.IMAP4_SSL_PORT)
+    else:
+        mail = imaplib.IMAP4(imap_server, port or imaplib.IMAP4_PORT)
+    mail.login(email_address, password)
+    return mail
+
+
+def uid_set(uids: List[int]) -> str:
+    """Compress sorted UIDs into an IMAP sequence set, e.g. [1, 2, 3, 7] -> "1:3,7"."""
+    ranges = []
+    for uid in uids:
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def _tokens(data: List[Any]):
+    """Flatten an imaplib response (lines and (line, literal) tuples) into tokens."""
+    for item in data:
+        if item is None:
+            continue
+        line, literal = item if isinstance(item, tuple) else (item, None)
+        for match in _TOKEN.finditer(line):
+            if match.group('open'):
+                yield '('
+            elif match.group('close'):
+                yield ')'
+            elif match.group('quoted') is not None:
+                yield re.sub(rb'\\(.)', rb'\1', match.group('quoted'))
+            elif match.group('literal') is not None:
+                yield literal if literal is not None else b''
+            elif match.group('atom'):
+                atom = match.group('atom')
+                yield None if atom.upper() == b'NIL' else atom
+        if literal is None:
+            # End of a response line, which lets the parser tell messages apart
+            # (a literal is always followed by the rest of its line)
+            yield '\n'
+
+
+def parse_fetch_response(data: List[Any]) -> Dict[int, Dict[str, Any]]:
+    """
+    Parse a UID FETCH response into {uid: {item name: value}}. Parenthesized values
+    become nested lists, strings stay bytes and NIL becomes None.
+    """
+    messages = {}
+    stack = [[]]
+    for token in _tokens(data):
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) > 1:
+                closed = stack.pop()
+                stack[-1].append(closed)
+        elif token == '\n':
+            if len(stack) == 1:
+                # "<seq> (<name> <value> ...)": pair up the item names and values
+                for value in stack[0]:
+                    if isinstance(value, list):
+                        items = {name.decode('ascii', 'replace').upper(): item
+                                 for name, item in zip(value[::2], value[1::2])
+                                 if isinstance(name, bytes)}
+                        if 'UID' in items:
+                            messages[int(items['UID'])] = items
+                stack = [[]]
+        else:
+            stack[-1].append(token)
+    return messages
+
+
+def _text(value: Any) -> str:
+    return value.decode('utf-8', 'replace').lower() if isinstance(value, bytes) else ''
+
+
+def text_parts(structure: List[Any], section: str = '') -> List[Dict[str, str]]:
+    """
+    Find the text/plain and text/html parts in a BODYSTRUCTURE, skipping attachments
+    and attached messages. Returns [{'section', 'subtype', 'encoding', 'charset'}].
+    """
+    if not structure:
+        return []
+    if isinstance(structure[0], list):
+        # Multipart: the child parts come first, then the subtype and extensions
+        parts = []
+        for number, child in enumerate(structure, 1):
+            if not isinstance(child, list):
+                break
+            parts.extend(text_parts(child, f"{section}.{number}" if section else str(number)))
+        return parts
+
+    if _text(structure[0]) != 'text' or _text(structure[1]) not in ('plain', 'html'):
+        return []
+    # Text parts: type, subtype, params, id, description, encoding, size, lines, md5, disposition
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and disposition and _text(disposition[0]) == 'attachment':
+        return []
+    params = structure[2] if isinstance(structure[2], list) else []
+    charset = next((_text(value) for name, value in zip(params[::2], params[1::2])
+                    if _text(name) == 'charset'), 'utf-8')
+    return [{
+        'section': section or '1',
+        'subtype': _text(structure[1]),
+        'encoding': _text(structure[5]) or '7bit',
+        'charset': charset or 'utf-8',
+    }]
+
+
+def decode_part(payload: bytes, encoding: str, charset: str) -> str:
+    if encoding == 'base64':
+        try:
+            payload = base64.b64decode(payload)
+        except ValueError:
+            pass
+    elif encoding == 'quoted-printable':
+        payload = quopri.decodestring(payload)
+    try:
+        return payload.decode(charset, 'replace')
+    except LookupError:
+        return payload.decode('utf-8', 'replace')
+
+
+class ImapCheckpoint:
+    """
+    Last UID processed per mailbox, with the mailbox UIDVALIDITY, in a JSON file.
+    A UIDVALIDITY change means the server renumbered the mailbox, so the old UID is discarded.
+    """
+    def __init__(self, path: str = "imap_checkpoint.json"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Dict[str, int]]:
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, mailbox: str, uidvalidity: int) -> Optional[int]:
+        """Return the last UID processed in this mailbox, or None if unknown or invalidated."""
+        with self._lock:
+            entry = self._read().get(mailbox)
+        if not entry or entry.get('uidvalidity') != uidvalidity:
+            return None
+        return entry.get('last_uid')
+
+    def save(self, mailbox: str, uidvalidity: int, last_uid: int) -> None:
+        with self._lock:
+            checkpoints = self._read()
+            checkpoints[mailbox] = {'uidvalidity': uidvalidity, 'last_uid': last_uid}
+            # Write and rename so a crash never leaves a half-written checkpoint
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(checkpoints, f)
+            os.replace(tmp_path, self.path)
+
+
+class ImapFetcher:
+    """
+    Fetches new messages from a mailbox in UID batches, reading only headers and text parts.
+    """
+    def __init__(self, checkpoint: Optional[ImapCheckpoint] = None, batch_size: int = 50,
+                 mark_seen: bool = True):
+        self.checkpoint = checkpoint or ImapCheckpoint()
+        self.batch_size = batch_size
+        # BODY.PEEK leaves \Seen alone, so set it explicitly (one STORE per batch) to keep
+        # handled mail marked read in the inbox, as the old RFC822 fetch did implicitly
+        self.mark_seen = mark_seen
+
+    def _select(self, conn: imaplib.IMAP4, mailbox: str) -> int:
+        """Select the mailbox and return its UIDVALIDITY."""
+        status, data = conn.select(mailbox)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"Cannot select {mailbox}: {data}")
+        _, values = conn.response('UIDVALIDITY')
+        if not values or values[0] is None:
+            # Not announced on SELECT: ask for it
+            _, values = conn.status(mailbox, '(UIDVALIDITY)')
+            match = re.search(rb'UIDVALIDITY (\d+)', values[0] or b'')
+            values = [match.group(1)] if match else [b'0']
+        return int(values[-1])
+
+    def _new_uids(self, conn: imaplib.IMAP4, last_uid: Optional[int]) -> List[int]:
+        if last_uid is None:
+            # No checkpoint yet: start from the unread mail, as before
+            status, data = conn.uid('SEARCH', None, 'UNSEEN')
+        else:
+            status, data = conn.uid('SEARCH', None, f'UID {last_uid + 1}:*')
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"UID SEARCH failed: {data}")
+        uids = sorted(int(uid) for uid in b' '.join(d for d in data if d).split())
+        # "n:*" always matches the newest message, even when its UID is below n
+        return [uid for uid in uids if last_uid is None or uid > last_uid]
+
+    def _fetch_batch(self, conn: imaplib.IMAP4, uids: List[int]) -> List[Dict[str, Any]]:
+        header_item = f"BODY.PEEK[HEADER.FIELDS ({' '.join(HEADER_FIELDS)})]"
+        status, data = conn.uid('FETCH', uid_set(uids), f"(UID BODYSTRUCTURE {header_item})")
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+        headers = parse_fetch_response(data)
+
+        # Plain text is enough for extraction; HTML is only read when there's no plain part
+        parts_by_uid = {}
+        for uid, items in list(headers.items()):
+            try:
+                parts = text_parts(items.get('BODYSTRUCTURE') or [])
+            except Exception as e:
+                # Skip it (left unread) rather than fail the batch on every retry
+                logger.error(f"Skipping UID {uid}, unreadable BODYSTRUCTURE: {e!r}")
+                del headers[uid]
+                continue
+            plain = [part for part in parts if part['subtype'] == 'plain']
+            parts_by_uid[uid] = plain or parts
+
+        # Messages with the same part layout share one FETCH
+        groups: Dict[Tuple[str, ...], List[int]] = {}
+        for uid, parts in parts_by_uid.items():
+            if parts:
+                groups.setdefault(tuple(part['section'] for part in parts), []).append(uid)
+        bodies = {}
+        for sections, group_uids in groups.items():
+            items = " ".join(f"BODY.PEEK[{section}]" for section in sections)
+            status, data = conn.uid('FETCH', uid_set(sorted(group_uids)), f"(UID {items})")
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+            bodies.update(parse_fetch_response(data))
+
+        emails = []
+        for uid in sorted(headers):
+            # Servers may echo the header field list back in another order, so match on the prefix
+            header = next((value for name, value in headers[uid].items() if name.startswith('BODY[HEADER')), None)
+            msg = email.message_from_bytes(header or b'')
+            fetched = bodies.get(uid, {})
+            body = "".join(
+                decode_part(fetched.get(f"BODY[{part['section']}]") or b'', part['encoding'], part['charset'])
+                for part in parts_by_uid[uid])
+            emails.append({
+                'id': str(uid).encode('ascii'),
+                'uid': uid,
+                'from': msg['from'],
+                'to': msg['to'],
+                'subject': msg['subject'],
+                'date': msg['date'],
+                'body': body
+            })
+        return emails
+
+    def fetch_new(self, conn: imaplib.IMAP4, mailbox: str = 'inbox') -> List[Dict[str, Any]]:
+        """
+        Fetch the messages that arrived since the last checkpoint (the unread ones on the
+        first run) and advance the checkpoint. Returns dicts with id, uid, from, to,
+        subject, date and body.
+        """
+        uidvalidity = self._select(conn, mailbox)
+        last_uid = self.checkpoint.get(mailbox, uidvalidity)
+        uids = self._new_uids(conn, last_uid)
+
+        emails = []
+        for start in range(0, len(uids), self.batch_size):
+            batch = uids[start:start + self.batch_size]
+            try:
+                fetched = self._fetch_batch(conn, batch)
+            except Exception:
+                logger.error(f"Fetching UIDs {uid_set(batch)} from {mailbox} failed")
+                raise
+            emails.extend(fetched)
+            if self.mark_seen and fetched:
+                conn.uid('STORE', uid_set([message['uid'] for message in fetched]), '+FLAGS.SILENT', '(\\Seen)')
+            self.checkpoint.save(mailbox, uidvalidity, batch[-1])
+        if uids:
+            logger.info(f"Fetched {len(emails)} new messages from {mailbox} "
+                        f"(UIDs {uids[0]}-{uids[-1]}, {-(-len(uids) // self.batch_size)} batches)")
+        return emails
+
+
+def supports_idle(conn: imaplib.IMAP4) -> bool:
+    # imaplib keeps the pre-login capabilities; servers often add IDLE only after login
+    status, data = conn.capability()
+    capabilities = b' '.join(d for d in data if d).upper().split() if status == 'OK' else []
+    return b'IDLE' in capabilities or 'IDLE' in conn.capabilities
+
+
+def _has_buffered_input(conn: imaplib.IMAP4) -> bool:
+    """True if a response line is already waiting in imaplib's read buffer (select can't see those)."""
+    timeout = conn.sock.gettimeout()
+    conn.sock.setblocking(False)
+    try:
+        return bool(conn.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        conn.sock.settimeout(timeout)
+
+
+def idle(conn: imaplib.IMAP4, timeout: float, stop: Optional[threading.Event] = None) -> bool:
+    """
+    Wait in IMAP IDLE (RFC 2177) on the selected mailbox for up to `timeout` seconds.
+    Returns True as soon as the server announces new mail, False on timeout or `stop`.
+    imaplib has no IDLE before Python 3.14, so this drives the protocol with its
+    low-level tag and line helpers.
+    """
+    tag = conn._new_tag()
+    conn.send(tag + b' IDLE\r\n')
+    line = conn._get_line()
+    while line.startswith(b'* '):
+        # Untagged responses queued before the server accepted IDLE
+        if _NEW_MAIL.match(line):
+            timeout = 0
+        line = conn._get_line()
+    if not line.startswith(b'+'):
+        conn.tagged_commands.pop(tag, None)
+        raise imaplib.IMAP4.error(f"IDLE refused: {line!r}")
+
+    new_mail = False
+    deadline = time.monotonic() + timeout
+    while not new_mail and not (stop is not None and stop.is_set()):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # Short waits so `stop` is noticed within a second
+        if _has_buffered_input(conn) or select.select([conn.sock], [], [], min(remaining, 1.0))[0]:
+            line = conn._get_line()
+            if _NEW_MAIL.match(line):
+                new_mail = True
+            elif line.startswith(b'* BYE'):
+                raise imaplib.IMAP4.abort(f"Server closed the connection: {line!r}")
+
+    conn.send(b'DONE\r\n')
+    while True:
+        line = conn._get_line()
+        if line.startswith(tag):
+            break
+        if _NEW_MAIL.match(line):
+            new_mail = True
+    conn.tagged_commands.pop(tag, None)
+    if not line[len(tag):].lstrip().upper().startswith(b'OK'):
+        raise imaplib.IMAP4.error(f"IDLE failed: {line!r}")
+    return new_mail
+
+
+class MailboxWatcher:
+    """
+    Keeps one IMAP connection open and hands new mail to `handle` as soon as it arrives.
+
+    The watcher logs in once, catches up on anything that arrived while it was away, then
+    waits in IDLE and fetches as soon as the server announces new mail. IDLE is re-issued
+    every `idle_timeout` seconds (servers drop idle clients after 30 minutes). Servers
+    without IDLE are polled every `poll_interval` seconds on the same connection. A lost
+    connection is re-opened with exponential backoff, capped at `max_backoff` seconds.
+    """
+    def __init__(self, connect: Callable[[], imaplib.IMAP4],
+                 fetch: Callable[[imaplib.IMAP4], List[Dict[str, Any]]],
+                 handle: Callable[[List[Dict[str, Any]]], None],
+                 poll_interval: float = 300, idle_timeout: float = 29 * 60,
+                 max_backoff: float = 300, use_idle: bool = True):
+        self.connect = connect
+        self.fetch = fetch
+        self.handle = handle
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.max_backoff = max_backoff
+        self.use_idle = use_idle
+        self.stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def _fetch_and_handle(self, conn: imaplib.IMAP4) -> None:
+        emails = self.fetch(conn)
+        if emails:
+            try:
+                self.handle(emails)
+            except Exception:
+                logger.error(f"Handling new mail failed (UIDs {', '.join(str(m.get('uid')) for m in emails)})")
+                raise
+
+    def _watch(self, conn: imaplib.IMAP4) -> None:
+        """Serve one connection until it fails or the watcher is stopped."""
+        use_idle = self.use_idle and supports_idle(conn)
+        logger.info("Waiting for new mail with IMAP IDLE" if use_idle
+                    else f"Server has no IDLE, polling every {self.poll_interval} seconds")
+        while not self.stop_event.is_set():
+            if use_idle:
+                # A timeout also fetches, in case a notification was missed
+                idle(conn, self.idle_timeout, self.stop_event)
+            else:
+                if self.stop_event.wait(self.poll_interval):
+                    break
+                conn.noop()
+            if not self.stop_event.is_set():
+                self._fetch_and_handle(conn)
+
+    def _wait_to_reconnect(self, backoff: float, reason: str) -> float:
+        """Sleep a jittered `backoff` seconds (or until stopped) and return the next backoff."""
+        delay = backoff * random.uniform(0.5, 1.0)
+        logger.warning(f"{reason}, reconnecting in {delay:.1f} seconds")
+        self.stop_event.wait(delay)
+        return min(backoff * 2, self.max_backoff)
+
+    def run(self) -> None:
+        """Watch the mailbox until stop() is called."""
+        backoff = 1.0
+        while not self.stop_event.is_set():
+            conn = None
+            try:
+                conn = self.connect()
+                self._fetch_and_handle(conn)
+                backoff = 1.0
+                self._watch(conn)
+            except (imaplib.IMAP4.error, OSError) as e:
+                # imaplib.IMAP4.abort (dropped connection) is a subclass of IMAP4.error
+                backoff = self._wait_to_reconnect(backoff, f"IMAP connection failed ({str(e)})")
+            except Exception as e:
+                # Anything else (an odd message, a failing handler) mustn't stop the watcher
+                logger.error(f"Error while watching the mailbox: {str(e)}", exc_info=True)
+                backoff = self._wait_to_reconnect(backoff, "Mailbox watcher failed")
+            finally:
+                if conn is not None:
+                    try:
+                        conn.logout()
+                    except Exception:
+                        pass
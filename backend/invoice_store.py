@@ -0,0 +1,187 @@
+import base64
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Columns an invoice listing can be filtered on, with the SQL condition for each
+LIST_FILTERS = {
+    'client': "client_name LIKE ? ESCAPE '\\'",
+    'date_from': "invoice_date >= ?",
+    'date_to': "invoice_date <= ?",
+    'min_total': "total >= ?",
+    'max_total': "total <= ?",
+}
+
+# Fields a listing can be projected to, and the column each one reads.
+# invoice_id is always included; without a projection listings return DEFAULT_LIST_FIELDS.
+LIST_FIELDS = {
+    'invoice_number': 'invoice_number',
+    'client': 'client_name',
+    'client_email': 'client_email',
+    'invoice_date': 'invoice_date',
+    'total': 'total',
+    'invoice_data': 'invoice_data',
+}
+DEFAULT_LIST_FIELDS = ('invoice_data',)
+
+
+def _like_prefix(value: str) -> str:
+    """Escape LIKE wildcards so a client filter matches names starting with the literal text."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def parse_amount(value: Any) -> Optional[float]:
+    """
+    A money amount as a float, for the REAL total column. Model-written invoices often
+    hold text like "$1,234.00"; anything that isn't a recognizable number is None.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    digits = re.sub(r'[^0-9.\-]', '', value)
+    try:
+        return float(digits)
+    except ValueError:
+        return None
+
+
+def encode_cursor(invoice_date: str, invoice_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([invoice_date, invoice_id]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Raises ValueError for a cursor this store didn't produce."""
+    try:
+        invoice_date, invoice_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return str(invoice_date), str(invoice_id)
+
+
+class InvoiceStore:
+    """
+    Invoices in a local SQLite file (WAL mode, so several worker processes can share it).
+    The searchable fields are indexed columns and the structured invoice data is kept
+    as JSON next to them; the HTML lives in its own table and is only read when a
+    single invoice is fetched. Listings are newest first, paged with a keyset cursor.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS invoices (
+                invoice_id TEXT PRIMARY KEY,
+                invoice_number TEXT,
+                client_name TEXT,
+                client_email TEXT,
+                invoice_date TEXT NOT NULL,
+                total REAL,
+                invoice_data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS invoice_html (
+                invoice_id TEXT PRIMARY KEY REFERENCES invoices (invoice_id) ON DELETE CASCADE,
+                html_content TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (invoice_date, invoice_id);
+            CREATE INDEX IF NOT EXISTS idx_invoices_number ON invoices (invoice_number);
+            CREATE INDEX IF NOT EXISTS idx_invoices_client ON invoices (client_name, invoice_date);
+            CREATE INDEX IF NOT EXISTS idx_invoices_total ON invoices (total);
+        """)
+        # Totals stored as text by older versions never match the min/max_total filters
+        for invoice_id, total in self._conn.execute(
+                "SELECT invoice_id, total FROM invoices WHERE typeof(total) = 'text'").fetchall():
+            self._conn.execute("UPDATE invoices SET total = ? WHERE invoice_id = ?", (parse_amount(total), invoice_id))
+        self._conn.commit()
+
+    def save(self, invoice_id: str, invoice: Dict[str, Any]) -> None:
+        """Insert or replace an invoice as returned by GeminiEmailProcessor.generate_invoice."""
+        invoice_data = invoice.get('invoice_data') or {}
+        client = invoice_data.get('client') or {}
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO invoices
+                    (invoice_id, invoice_number, client_name, client_email, invoice_date, total, invoice_data, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                invoice_id,
+                invoice_data.get('invoice_number'),
+                client.get('name'),
+                client.get('email'),
+                invoice_data.get('invoice_date') or time.strftime('%Y-%m-%d'),
+                parse_amount(invoice_data.get('total')),
+                json.dumps(invoice_data, default=str),
+                time.time(),
+            ))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO invoice_html (invoice_id, html_content) VALUES (?, ?)",
+                (invoice_id, invoice.get('html_content')))
+
+    def get(self, invoice_id: str) -> Optional[Dict[str, Any]]:
+        """Return the full invoice, HTML included, or None."""
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT i.invoice_data, h.html_content
+                FROM invoices i LEFT JOIN invoice_html h ON h.invoice_id = i.invoice_id
+                WHERE i.invoice_id = ?
+            """, (invoice_id,)).fetchone()
+        if row is None:
+            return None
+        return {'invoice_data': json.loads(row[0]), 'html_content': row[1]}
+
+    def list_invoices(self, limit: int = 50, cursor: Optional[str] = None,
+                      fields: Optional[List[str]] = None,
+                      **filters: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Return (invoices, next_cursor) for up to `limit` invoices, newest first, without
+        their HTML. Each invoice has its invoice_id plus the LIST_FIELDS in `fields`
+        (only those columns are read). `filters` are the LIST_FILTERS keys (client is
+        a name prefix). Pass next_cursor back to get the following page; it is None
+        on the last page.
+        """
+        fields = list(fields or DEFAULT_LIST_FIELDS)
+        unknown = [field for field in fields if field not in LIST_FIELDS]
+        if unknown:
+            raise ValueError(f"Unsupported fields: {', '.join(unknown)}")
+        columns = ", ".join(LIST_FIELDS[field] for field in fields)
+
+        conditions, params = [], []
+        for name, value in filters.items():
+            if value is None:
+                continue
+            if name not in LIST_FILTERS:
+                raise ValueError(f"Unsupported filter: {name}")
+            conditions.append(LIST_FILTERS[name])
+            params.append(_like_prefix(value) if name == 'client' else value)
+        if cursor:
+            # Keyset: strictly after the last row of the previous page in (date, id) order
+            last_date, last_id = decode_cursor(cursor)
+            conditions.append("(invoice_date, invoice_id) < (?, ?)")
+            params.extend([last_date, last_id])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT invoice_id, invoice_date, {columns} FROM invoices
+                {where}
+                ORDER BY invoice_date DESC, invoice_id DESC
+                LIMIT ?
+            """, params + [limit + 1]).fetchall()
+
+        next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+        invoices = []
+        for row in rows[:limit]:
+            invoice = {'invoice_id': row[0]}
+            for field, value in zip(fields, row[2:]):
+                invoice[field] = json.loads(value) if field == 'invoice_data' else value
+            invoices.append(invoice)
+        return invoices, next_cursor
@@ -1,8 +1,14 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+from invoice_store import InvoiceStore
+from response_compression import init_compression
 import os
+import json
 import uuid
+import queue
+import asyncio
 import logging
+import threading
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -20,24 +26,37 @@ except Exception as e:
 try:
     from gemini_integration import GeminiEmailProcessor
     # Initialize Gemini Email Processor
-    gemini_processor = GeminiEmailProcessor()
+    # DOCUMENT_MODE=template renders emails and invoices locally; PERSONALIZE_DOCUMENTS=1
+    # adds one short model-written paragraph to templated emails
+    gemini_processor = GeminiEmailProcessor(
+        max_concurrency=int(os.getenv('GEMINI_MAX_CONCURRENCY', '8')),
+        document_mode=os.getenv('DOCUMENT_MODE', 'llm'),
+        personalize=os.getenv('PERSONALIZE_DOCUMENTS', '0') == '1')
     logger.info("Successfully initialized GeminiEmailProcessor")
+    from booking_extractor import TieredBookingExtractor
+    # Rule-based extraction first, Gemini only for emails the rules can't handle confidently
+    booking_extractor = TieredBookingExtractor(
+        gemini_processor,
+        confidence_threshold=float(os.getenv('LOCAL_EXTRACTION_CONFIDENCE', '1.0')))
 except Exception as e:
     logger.error(f"Error initializing GeminiEmailProcessor: {str(e)}")
     raise
 
+# CORS policy for the /api routes (also applied to the async routes in asgi.py)
+API_CORS_SETTINGS = {
+    "origins": ["http://localhost:5173"],
+    "methods": ["GET", "POST", "DELETE", "PUT", "OPTIONS"],
+    "allow_headers": ["Content-Type", "Authorization"],
+    "supports_credentials": True
+}
+
 app = Flask(__name__)
-CORS(app, resources={
-    r"/api/*": {
-        "origins": ["http://localhost:5173"],
-        "methods": ["GET", "POST", "DELETE", "PUT", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
-        "supports_credentials": True
-    }
-})
+CORS(app, resources={r"/api/*": API_CORS_SETTINGS})
+# gzip/brotli for JSON responses, which matters most for invoice listings
+init_compression(app)
 
-# Store for generated invoices
-invoices_db = {}
+# Store for generated invoices, shared by all workers through a local SQLite file
+invoice_store = InvoiceStore(os.getenv('INVOICE_DB_PATH', 'invoices.db'))
 
 @app.route('/api/reverse', methods=['POST'])
 def reverse_text():
@@ -59,26 +78,148 @@ def analyze_email():
         return jsonify({'error': 'Email body is required'}), 400
     
     try:
-        booking_details = gemini_processor.analyze_booking_request(email_body)
+        booking_details = booking_extractor.extract(email_body)
         return jsonify({'booking_details': booking_details})
     except Exception as e:
         logger.error(f"Error analyzing email: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Upper bound on emails per /api/analyze-emails request
+MAX_BULK_EMAILS = int(os.getenv('MAX_BULK_EMAILS', '10000'))
+
+# Event loop for the async fan-out of bulk analysis, started on first use and kept
+# for the life of the process: google.generativeai caches its async client bound to
+# the first loop that uses it, so a fresh loop per request would break it from the
+# second request on
+_analysis_loop = None
+_analysis_loop_lock = threading.Lock()
+
+def get_analysis_loop() -> asyncio.AbstractEventLoop:
+    global _analysis_loop
+    with _analysis_loop_lock:
+        if _analysis_loop is None:
+            _analysis_loop = asyncio.new_event_loop()
+            threading.Thread(target=_analysis_loop.run_forever, name='bulk-analysis-loop', daemon=True).start()
+        return _analysis_loop
+
+def parse_bulk_emails(body: str):
+    """
+    Parse a JSON array or NDJSON upload into [(id, email_body)]. Each item is either
+    an email body string or an object with "email_body" and an optional "id"
+    (the position in the upload is used when there is no id).
+    """
+    stripped = body.strip()
+    if stripped.startswith('['):
+        items = json.loads(stripped)
+    else:
+        items = [json.loads(line) for line in stripped.splitlines() if line.strip()]
+    emails = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            email_id, email_body = index, item
+        elif isinstance(item, dict):
+            email_id, email_body = item.get('id', index), item.get('email_body')
+        else:
+            raise ValueError(f"Item {index} is neither a string nor an object")
+        if not isinstance(email_body, str) or not email_body:
+            raise ValueError(f"Item {index} has no email_body")
+        emails.append((email_id, email_body))
+    return emails
+
+def bulk_result_line(emails, index, booking_details) -> str:
+    """One NDJSON line of /api/analyze-emails output."""
+    return json.dumps({
+        'index': index,
+        'id': emails[index][0],
+        'booking_details': booking_details
+    }, default=str) + '\n'
+
+def bulk_summary_line(total, completed, failed) -> str:
+    return json.dumps({'summary': {'total': total, 'completed': completed, 'errors': failed}}) + '\n'
+
+@app.route('/api/analyze-emails', methods=['POST'])
+def analyze_emails():
+    """
+    Analyzes many emails in one request.
+    Accepts a JSON array or NDJSON (one email per line); items are email body strings
+    or {"id": ..., "email_body": "..."} objects. Streams back NDJSON, one
+    {"index", "id", "booking_details"} line per email in completion order, then a
+    {"summary": {...}} line.
+    """
+    try:
+        emails = parse_bulk_emails(request.get_data(as_text=True))
+    except ValueError as e:
+        # json.JSONDecodeError is a ValueError too
+        return jsonify({'error': f"Invalid upload: {str(e)}"}), 400
+    if not emails:
+        return jsonify({'error': 'At least one email is required'}), 400
+    if len(emails) > MAX_BULK_EMAILS:
+        return jsonify({'error': f"At most {MAX_BULK_EMAILS} emails per request"}), 400
+
+    # Sized to the fan-out, so the producer waits for the reader instead of piling up results
+    results = queue.Queue(maxsize=gemini_processor.max_concurrency)
+    stop = threading.Event()
+
+    async def hand_over(item):
+        # Wait for room without blocking the shared loop; give up once the reader has gone
+        while not stop.is_set():
+            try:
+                results.put_nowait(item)
+                return True
+            except queue.Full:
+                await asyncio.sleep(0.05)
+        return False
+
+    async def produce():
+        try:
+            async for index, booking_details in booking_extractor.extract_many(
+                    [email_body for _, email_body in emails], should_stop=stop.is_set):
+                if not await hand_over((index, booking_details)):
+                    break
+        finally:
+            await hand_over(None)
+
+    def finished(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Bulk email analysis failed: {str(future.exception())}", exc_info=future.exception())
+
+    def lines():
+        # The fan-out runs on the shared analysis loop; results cross back over a thread-safe queue
+        future = asyncio.run_coroutine_threadsafe(produce(), get_analysis_loop())
+        future.add_done_callback(finished)
+        completed = failed = 0
+        try:
+            while True:
+                item = results.get()
+                if item is None:
+                    break
+                index, booking_details = item
+                completed += 1
+                if 'error' in booking_details:
+                    failed += 1
+                yield bulk_result_line(emails, index, booking_details)
+            yield bulk_summary_line(len(emails), completed, failed)
+        finally:
+            # Client went away (or we're done): stop picking up new emails
+            stop.set()
+
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
 @app.route('/api/generate-confirmation', methods=['POST'])
 def generate_confirmation():
     """
     Generates a confirmation email response
-    Expected JSON format: {"booking_details": {...booking details object...}}
+    Expected JSON format: {"booking_details": {...booking details object...}, "company_id": optional}
     """
     data = request.json
     booking_details = data.get('booking_details', {})
+    company_id = data.get('company_id')
     
     if not booking_details:
         return jsonify({'error': 'Booking details are required'}), 400
     
     try:
-        email_body = gemini_processor.generate_booking_confirmation(booking_details)
+        email_body = gemini_processor.generate_booking_confirmation(booking_details, company_id)
         return jsonify({'email_body': email_body})
     except Exception as e:
         logger.error(f"Error generating confirmation: {str(e)}")
@@ -90,30 +231,39 @@ def generate_rejection():
     Generates a rejection email response with alternative time slots
     Expected JSON format: {
         "booking_details": {...booking details object...},
-        "alternative_slots": [{...slot1...}, {...slot2...}, ...]
+        "alternative_slots": [{...slot1...}, {...slot2...}, ...],
+        "company_id": optional
     }
     """
     data = request.json
     booking_details = data.get('booking_details', {})
     alternative_slots = data.get('alternative_slots', [])
+    company_id = data.get('company_id')
     
     if not booking_details:
         return jsonify({'error': 'Booking details are required'}), 400
     
     try:
-        email_body = gemini_processor.generate_booking_rejection(booking_details, alternative_slots)
+        email_body = gemini_processor.generate_booking_rejection(booking_details, alternative_slots, company_id)
         return jsonify({'email_body': email_body})
     except Exception as e:
         logger.error(f"Error generating rejection: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Booking fields an invoice can't be generated without
+INVOICE_REQUIRED_FIELDS = ['client_name', 'requested_date']
+
+def missing_invoice_fields(booking_details):
+    return [field for field in INVOICE_REQUIRED_FIELDS if not booking_details.get(field)]
+
 @app.route('/api/generate-invoice', methods=['POST'])
 def generate_invoice():
     """
     Generates an invoice for a booking
     Expected JSON format: {
         "booking_details": {...booking details object...},
-        "pricing_info": {optional pricing info}
+        "pricing_info": {optional pricing info},
+        "company_id": optional
     }
     """
     data = request.json
@@ -121,14 +271,14 @@ def generate_invoice():
     
     booking_details = data.get('booking_details', {})
     pricing_info = data.get('pricing_info', None)
+    company_id = data.get('company_id')
     
     if not booking_details:
         logger.warning("Invoice generation failed: No booking details provided")
         return jsonify({'error': 'Booking details are required'}), 400
     
     # Validate booking details has required fields
-    required_fields = ['client_name', 'requested_date']
-    missing_fields = [field for field in required_fields if not booking_details.get(field)]
+    missing_fields = missing_invoice_fields(booking_details)
     
     if missing_fields:
         error_msg = f"Missing required fields in booking details: {', '.join(missing_fields)}"
@@ -137,11 +287,11 @@ def generate_invoice():
     
     try:
         logger.info(f"Generating invoice for booking: {booking_details}")
-        invoice = gemini_processor.generate_invoice(booking_details, pricing_info)
+        invoice = gemini_processor.generate_invoice(booking_details, pricing_info, company_id)
         
         # Store the invoice for retrieval later
         invoice_id = invoice.get('invoice_data', {}).get('invoice_number', str(uuid.uuid4()))
-        invoices_db[invoice_id] = invoice
+        invoice_store.save(invoice_id, invoice)
         
         logger.info(f"Invoice generated successfully with ID: {invoice_id}")
         return jsonify({
@@ -152,13 +302,55 @@ def generate_invoice():
         logger.error(f"Error generating invoice: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """
+    Gemini response cache hit/miss counters per task
+    """
+    return jsonify({'gemini_cache': gemini_processor.get_cache_stats()})
+
+@app.route('/api/route-stats', methods=['GET'])
+def get_route_stats():
+    """
+    Calls, escalations, latency and estimated token cost per task and model
+    """
+    return jsonify({'gemini_routes': gemini_processor.get_route_stats()})
+
+@app.route('/api/extraction-stats', methods=['GET'])
+def get_extraction_stats():
+    """
+    How many analyzed emails were served by the local extractor vs escalated to Gemini
+    """
+    return jsonify({'booking_extraction': booking_extractor.get_stats()})
+
 @app.route('/api/invoices', methods=['GET'])
 def get_invoices():
     """
-    Get all stored invoices
+    List stored invoices, newest first, without their HTML
+    Query parameters (all optional):
+        limit: page size (1-500, default 50)
+        cursor: next_cursor from the previous page
+        fields: comma-separated projection, e.g. invoice_number,client,total
+                (see invoice_store.LIST_FIELDS; default invoice_data)
+        client: client name prefix
+        date_from, date_to: invoice date range (YYYY-MM-DD, inclusive)
+        min_total, max_total: invoice total range
     """
     try:
-        return jsonify({'invoices': list(invoices_db.values())})
+        limit = min(max(request.args.get('limit', default=50, type=int), 1), 500)
+        invoices, next_cursor = invoice_store.list_invoices(
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            fields=[f.strip() for f in request.args['fields'].split(',') if f.strip()] if request.args.get('fields') else None,
+            client=request.args.get('client'),
+            date_from=request.args.get('date_from'),
+            date_to=request.args.get('date_to'),
+            min_total=request.args.get('min_total', type=float),
+            max_total=request.args.get('max_total', type=float)
+        )
+        return jsonify({'invoices': invoices, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error retrieving invoices: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -169,7 +361,7 @@ def get_invoice(invoice_id):
     Get a specific invoice by ID
     """
     try:
-        invoice = invoices_db.get(invoice_id)
+        invoice = invoice_store.get(invoice_id)
         if not invoice:
             return jsonify({'error': 'Invoice not found'}), 404
         return jsonify({'invoice': invoice})
@@ -0,0 +1,95 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import Response, request
+
+# Mimetypes for the image formats the plot endpoints can render
+PLOT_MIMETYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+class PlotCache:
+    """
+    Bounded in-memory LRU cache of rendered plot images.
+    Keys describe everything that affects the image, e.g.
+    ('forecast', forecast_version, figsize, dpi, fmt); values are the encoded
+    bytes together with a strong ETag derived from them.
+    """
+    def __init__(self, max_entries=32, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        # Bumped by invalidate() so renders started before it aren't stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached (data, etag) for a key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, data, generation=None):
+        """
+        Cache rendered bytes under a key and return the (data, etag).
+        When a generation from before the render is given and invalidate()
+        has run since, the stale bytes are returned but not stored.
+        """
+        entry = (data, hashlib.sha256(data).hexdigest())
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return entry
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= len(old[0])
+            self._entries[key] = entry
+            self._total_bytes += len(data)
+            # Evict least recently used images until both bounds hold again
+            while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+        return entry
+
+    def get_or_render(self, key, render):
+        """Return the cached (data, etag) for a key, calling render() to produce the bytes on a miss."""
+        entry = self.get(key)
+        if entry is None:
+            with self._lock:
+                generation = self._generation
+            entry = self.put(key, render(), generation)
+        return entry
+
+    def invalidate(self):
+        """Drop every cached image, e.g. after new purchases or a new forecast."""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self._generation += 1
+
+
+# Shared cache for every plot endpoint
+plot_cache = PlotCache()
+
+
+def cached_plot_response(key, render, fmt='png'):
+    """
+    Serve a plot from the cache with a strong ETag.
+    Answers 304 Not Modified when the request's If-None-Match already matches,
+    and only renders the image when it isn't cached.
+    """
+    data, etag = plot_cache.get_or_render(key, render)
+    response = Response(data, mimetype=PLOT_MIMETYPES.get(fmt, 'application/octet-stream'))
+    response.set_etag(etag)
+    # Let browsers keep the image but revalidate it on every use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
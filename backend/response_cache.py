@@ -0,0 +1,157 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+
+def make_cache_key(*parts: Any) -> str:
+    """Hash the given parts (anything JSON-serializable) into a stable cache key."""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryLRUCache:
+    """
+    In-process LRU cache with a per-entry expiry time.
+    """
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for a key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        """Store a value that expires after `ttl` seconds, evicting the least recently used entries."""
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """
+    Persistent cache in a local SQLite file, so entries survive restarts and are
+    shared between worker processes. Entries expire after their TTL, and the least
+    recently used ones are evicted once more than `max_entries` are stored.
+    """
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_used ON cache (last_used)")
+        self._conn.commit()
+
+    def get_entry(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return (value, expires_at) for a key, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0], row[1]
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for a key, or None if it is missing or expired."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        """Store a value that expires after `ttl` seconds, then enforce the size bound."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now))
+            self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            self._conn.execute("""
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+
+class TieredCache:
+    """
+    An in-process LRU in front of an optional persistent SQLite tier.
+    Hits in the SQLite tier are copied into memory, so repeated lookups stay in-process.
+    """
+    def __init__(self, memory: Optional[MemoryLRUCache] = None, disk: Optional[SQLiteCache] = None):
+        self.memory = memory if memory is not None else MemoryLRUCache()
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for a key from the first tier that has it."""
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            entry = self.disk.get_entry(key)
+            if entry is not None:
+                value, expires_at = entry
+                self.memory.set(key, value, expires_at - time.time())
+        return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
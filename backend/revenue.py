@@ -5,6 +5,9 @@ import io
 from flask import jsonify, send_file
 from datetime import datetime, timedelta
 from openai import OpenAI
+from sqlalchemy import text
+from revenue_index import DEFAULT_AS_OF_DATE
+from response_cache import MemoryLRUCache, SQLiteCache, TieredCache, make_cache_key
 from dotenv import load_dotenv
 import os
 import matplotlib
@@ -16,49 +19,92 @@ client = OpenAI(
     api_key=os.getenv('OPENAI_API_KEY')
 )
 
-def calculate_weekly_revenue(engine=None):
+# Insights model and prompt. Bump INSIGHTS_PROMPT_VERSION whenever the prompt
+# changes so cached insights written for the old prompt are no longer used.
+INSIGHTS_MODEL = "gpt-4o-mini"
+INSIGHTS_PROMPT_VERSION = 1
+INSIGHTS_PROMPT = """You are a financial analyst AI.
+                        Analyze the weekly revenue data and provide insights about:
+                        1. Revenue trends and growth
+                        2. Any anomalies or concerning patterns
+                        3. Actionable recommendations
+                        Keep the analysis concise but informative (about a paragraph)."""
+
+# Generated insights, keyed by a hash of the revenue table, model and prompt version
+INSIGHTS_CACHE_TTL = float(os.getenv('INSIGHTS_CACHE_TTL', 6 * 60 * 60))
+insights_cache = TieredCache(
+    MemoryLRUCache(max_entries=64),
+    SQLiteCache(os.getenv('INSIGHTS_CACHE_PATH', 'insights_cache.db'), max_entries=500)
+)
+
+# Revenue window: the same as-of date as in forecast.py for consistency, and the month before it
+REVENUE_END_DATE = DEFAULT_AS_OF_DATE
+REVENUE_WINDOW_DAYS = 30
+
+
+def revenue_window():
+    """Return the (start_date, end_date) of the weekly revenue window."""
+    return REVENUE_END_DATE - pd.Timedelta(days=REVENUE_WINDOW_DAYS), REVENUE_END_DATE
+
+
+def query_weekly_revenue(engine=None):
     """
-    Calculate weekly revenue for the most recent month from the database.
-    Returns both the revenue data and a matplotlib figure.
+    Query the purchases in the revenue window and total them per ISO week,
+    with the week-over-week change in revenue_change. Raises ValueError when the window holds no data.
     """
-    try:
-        # Get the current date (or use the same end date as in forecast.py for consistency)
-        end_date = pd.Timestamp('2023-12-31')  # Match the date used in forecast.py
-        start_date = end_date - pd.Timedelta(days=30)
-        
-        print(f"Calculating revenue from {start_date} to {end_date}")
-        
-        # Check if engine was provided
-        if engine is None:
-            from sqlalchemy import create_engine
-            engine = create_engine('sqlite:///:memory:', echo=False)
-            print("WARNING: Using new in-memory database - likely empty!")
-            
-        # Query the data with explicit date filtering
-        query = f"""
-        SELECT timestamp, cost
-        FROM purchases
-        WHERE timestamp >= '{start_date}'
-        AND timestamp <= '{end_date}'
-        """
-        df = pd.read_sql(query, engine)
-        
-        print(f"Found {len(df)} records for revenue calculation")
-        
-        if df.empty:
-            print("No data found in the query result - returning empty plot")
-            raise ValueError("No data found in the specified date range")
-            
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    start_date, end_date = revenue_window()
+    
+    print(f"Calculating revenue from {start_date} to {end_date}")
+    
+    # Check if engine was provided
+    if engine is None:
+        from sqlalchemy import create_engine
+        engine = create_engine('sqlite:///:memory:', echo=False)
+        print("WARNING: Using new in-memory database - likely empty!")
         
-        # Group by week number and calculate total revenue
-        df['week'] = df['timestamp'].dt.isocalendar().week
-        weekly_revenue = df.groupby('week')['cost'].sum().reset_index()
+    # Total revenue per ISO week in SQL, so only one row per week reaches pandas.
+    # The ISO week is the day-of-year of that week's Thursday, divided into weeks,
+    # which matches pandas' isocalendar().week. The bound (timestamp, cost) index
+    # turns the date filter into a range scan.
+    query = text("""
+    SELECT (CAST(strftime('%j', date(timestamp, '-3 days', 'weekday 4')) AS INTEGER) - 1) / 7 + 1 AS week,
+           SUM(cost) AS cost,
+           COUNT(*) AS purchases
+    FROM purchases
+    WHERE timestamp >= :start_date
+    AND timestamp <= :end_date
+    GROUP BY week
+    ORDER BY MIN(timestamp)
+    """)
+    weekly = pd.read_sql(query, engine, params={
+        'start_date': start_date.strftime('%Y-%m-%d %H:%M:%S'),
+        'end_date': end_date.strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    
+    print(f"Found {int(weekly['purchases'].sum())} records for revenue calculation")
+    
+    if weekly.empty:
+        print("No data found in the query result - returning empty plot")
+        raise ValueError("No data found in the specified date range")
         
-        print(f"Calculated revenue for {len(weekly_revenue)} weeks")
+    weekly_revenue = weekly[['week', 'cost']].copy()
+    
+    # Week-over-week changes, part of the table on every path (API payloads and the insights cache key)
+    weekly_revenue['revenue_change'] = weekly_revenue['cost'].pct_change()
+    
+    print(f"Calculated revenue for {len(weekly_revenue)} weeks")
+    return weekly_revenue
+
+def calculate_weekly_revenue(engine=None, figsize=(10, 6), dpi=300, fmt='png'):
+    """
+    Calculate weekly revenue for the most recent month from the database.
+    Returns both the revenue data and a buffer holding the rendered plot.
+    """
+    try:
+        weekly_revenue = query_weekly_revenue(engine)
         
         # Create the revenue plot
-        fig, ax = plt.subplots(figsize=(10, 6))
+        fig, ax = plt.subplots(figsize=figsize)
         
         # Use a bar chart with a more distinctive style
         bars = ax.bar(weekly_revenue['week'], weekly_revenue['cost'], 
@@ -81,7 +127,7 @@ def calculate_weekly_revenue(engine=None):
         
         # Save plot to bytes buffer
         buf = io.BytesIO()
-        fig.savefig(buf, format='png', bbox_inches='tight', dpi=300)
+        fig.savefig(buf, format=fmt, bbox_inches='tight', dpi=dpi)
         plt.close(fig)
         buf.seek(0)
         
@@ -90,29 +136,44 @@ def calculate_weekly_revenue(engine=None):
     except Exception as e:
         print(f"Error in calculate_weekly_revenue: {str(e)}")
         # Return empty data and a simple plot for error cases
-        empty_revenue = pd.DataFrame({'week': [1, 2, 3, 4], 'cost': [0, 0, 0, 0]})
-        fig, ax = plt.subplots(figsize=(10, 6))
+        empty_revenue = pd.DataFrame({'week': [1, 2, 3, 4], 'cost': [0, 0, 0, 0], 'revenue_change': [np.nan] * 4})
+        fig, ax = plt.subplots(figsize=figsize)
         ax.text(0.5, 0.5, f'No revenue data available: {str(e)}', 
                 horizontalalignment='center', verticalalignment='center',
                 fontsize=12, color='red')
         plt.tight_layout()
         buf = io.BytesIO()
-        fig.savefig(buf, format='png', bbox_inches='tight', dpi=300)
+        fig.savefig(buf, format=fmt, bbox_inches='tight', dpi=dpi)
         plt.close(fig)
         buf.seek(0)
         return empty_revenue, buf
 
-def generate_revenue_insights(weekly_revenue):
+def stream_revenue_insights(weekly_revenue):
     """
-    Generate AI insights about the weekly revenue trends.
+    Generate AI insights about the weekly revenue trends, yielding the text
+    in chunks as the model produces them. Insights for a revenue table that
+    was analyzed before are served from insights_cache in a single chunk.
     """
     try:
+        cache_key = make_cache_key(
+            'revenue_insights', INSIGHTS_MODEL, INSIGHTS_PROMPT_VERSION,
+            weekly_revenue.to_json(orient='split', double_precision=10))
+        
+        # Serve previously generated insights for the same data
+        cached = insights_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
         # Handle case where there's not enough data
         if len(weekly_revenue) < 2:
-            return "Insufficient data to generate meaningful insights. More revenue data is needed."
+            yield "Insufficient data to generate meaningful insights. More revenue data is needed."
+            return
         
-        # Calculate week-over-week changes
-        weekly_revenue['revenue_change'] = weekly_revenue['cost'].pct_change()
+        # Work on a copy so the caller's table is left as it was
+        weekly_revenue = weekly_revenue.copy()
+        if 'revenue_change' not in weekly_revenue:
+            weekly_revenue['revenue_change'] = weekly_revenue['cost'].pct_change()
         
         # Get latest week data
         latest_week = weekly_revenue.iloc[-1]
@@ -148,24 +209,25 @@ def generate_revenue_insights(weekly_revenue):
             else:
                 trend = "Not enough data to determine a clear trend."
                 
-            return f"Total revenue for the period: ${total_revenue:.2f}. Average weekly revenue: ${avg_revenue:.2f}. {trend}"
+            yield f"Total revenue for the period: ${total_revenue:.2f}. Average weekly revenue: ${avg_revenue:.2f}. {trend}"
+            return
         
         # Generate AI analysis using OpenAI
         try:
             analysis = ""
             stream = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": """You are a financial analyst AI.
-                        Analyze the weekly revenue data and provide insights about:
-                        1. Revenue trends and growth
-                        2. Any anomalies or concerning patterns
-                        3. Actionable recommendations
-                        Keep the analysis concise but informative (about a paragraph)."""}, {"role": "user","content": revenue_summary}],
+                model=INSIGHTS_MODEL,
+                messages=[{"role": "user", "content": INSIGHTS_PROMPT}, {"role": "user","content": revenue_summary}],
                 stream=True,
             )
             for chunk in stream:
                 if chunk.choices[0].delta.content is not None:
                     analysis += chunk.choices[0].delta.content
+                    yield chunk.choices[0].delta.content
+            
+            # Only complete answers are cached
+            if analysis:
+                insights_cache.set(cache_key, analysis, INSIGHTS_CACHE_TTL)
 
 
             # response = openai.ChatCompletion.create(
@@ -189,9 +251,13 @@ def generate_revenue_insights(weekly_revenue):
             # analysis = response.choices[0].message.content
         except Exception as e:
             print(f"Error with OpenAI API: {str(e)}")
-            analysis = f"Unable to generate AI insights at this time: {str(e)}"
-        
-        return analysis
+            yield f"Unable to generate AI insights at this time: {str(e)}"
     except Exception as e:
-        print(f"Error in generate_revenue_insights: {str(e)}")
-        return f"Unable to analyze revenue data: {str(e)}"
\ No newline at end of file
+        print(f"Error in stream_revenue_insights: {str(e)}")
+        yield f"Unable to analyze revenue data: {str(e)}"
+
+def generate_revenue_insights(weekly_revenue):
+    """
+    Generate AI insights about the weekly revenue trends as a single string.
+    """
+    return "".join(stream_revenue_insights(weekly_revenue))
\ No newline at end of file
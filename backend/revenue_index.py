@@ -0,0 +1,95 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# The "today" the dashboards report on. The sample data ends on 2023-12-31;
+# set AS_OF_DATE (or pass an explicit as-of date) to report on another day.
+DEFAULT_AS_OF_DATE = pd.Timestamp(os.getenv('AS_OF_DATE', '2023-12-31')).normalize()
+
+# Supported period granularities and their pandas period frequencies
+# (weeks run Monday to Sunday, like ISO weeks)
+GRANULARITIES = {
+    'day': 'D',
+    'week': 'W-SUN',
+    'month': 'M',
+    'quarter': 'Q',
+}
+
+
+class CumulativeRevenueIndex:
+    """
+    Prefix sums of daily revenue and purchase counts, built from the daily rollups.
+    The total over any date range is the difference of two prefix sums, so every
+    window and period is an O(1) lookup instead of a rescan of the purchases.
+    Call invalidate() whenever purchases change; the sums are rebuilt lazily.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._state = None
+
+    def invalidate(self):
+        """Drop the prefix sums so the next lookup rebuilds them."""
+        self._state = None
+
+    def _load(self):
+        """Return (first_day, cum_revenue, cum_purchases), building them if needed."""
+        state = self._state
+        if state is not None:
+            return state
+        with self._lock:
+            if self._state is None:
+                daily = pd.read_sql(text("""
+                    SELECT r.date, r.revenue, c.purchase_count
+                    FROM daily_revenue r JOIN daily_purchase_counts c ON c.date = r.date
+                    ORDER BY r.date
+                """), self.engine)
+                if daily.empty:
+                    self._state = (DEFAULT_AS_OF_DATE, np.zeros(1), np.zeros(1, dtype=np.int64))
+                else:
+                    # Spread the rollup over a dense day-by-day range, with 0 for days without purchases
+                    daily.index = pd.to_datetime(daily['date'])
+                    days = pd.date_range(daily.index.min(), daily.index.max(), freq='D')
+                    daily = daily.reindex(days, fill_value=0)
+                    # cum[i] is the total of all days before day i
+                    cum_revenue = np.concatenate(([0.0], np.cumsum(daily['revenue'].to_numpy(dtype=float))))
+                    cum_purchases = np.concatenate(([0], np.cumsum(daily['purchase_count'].to_numpy(dtype=np.int64))))
+                    self._state = (days[0], cum_revenue, cum_purchases)
+            return self._state
+
+    def total(self, start_date, end_date):
+        """Return (revenue, purchases) for the days from start_date to end_date, both inclusive."""
+        first_day, cum_revenue, cum_purchases = self._load()
+        n_days = len(cum_revenue) - 1
+        i = min(max((pd.Timestamp(start_date).normalize() - first_day).days, 0), n_days)
+        j = min(max((pd.Timestamp(end_date).normalize() - first_day).days + 1, 0), n_days)
+        if j <= i:
+            return 0.0, 0
+        return float(cum_revenue[j] - cum_revenue[i]), int(cum_purchases[j] - cum_purchases[i])
+
+    def aggregate(self, as_of=None, window_days=30, granularity='week'):
+        """
+        Split the `window_days` days ending on `as_of` (inclusive) into day, week,
+        month or quarter periods and return the revenue and purchases of each.
+        Periods at the edges are clipped to the window.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+        end_date = pd.Timestamp(as_of if as_of is not None else DEFAULT_AS_OF_DATE).normalize()
+        start_date = end_date - pd.Timedelta(days=window_days - 1)
+
+        periods = []
+        for period in pd.period_range(start_date, end_date, freq=GRANULARITIES[granularity]):
+            period_start = max(period.start_time.normalize(), start_date)
+            period_end = min(period.end_time.normalize(), end_date)
+            revenue, purchases = self.total(period_start, period_end)
+            periods.append({
+                'period': str(period),
+                'start_date': period_start.strftime('%Y-%m-%d'),
+                'end_date': period_end.strftime('%Y-%m-%d'),
+                'revenue': round(revenue, 2),
+                'purchases': purchases
+            })
+        return periods
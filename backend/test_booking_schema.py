@@ -0,0 +1,47 @@
+"""
+Repair of malformed model responses into booking JSON:
+    cd backend && python -m pytest test_booking_schema.py
+"""
+import unittest
+
+from booking_schema import repair_json
+
+
+class RepairJsonTest(unittest.TestCase):
+    def test_valid_json_is_unchanged(self):
+        self.assertEqual(repair_json('{"client_name": "Ann Lee", "attendees": 40}'),
+                         {"client_name": "Ann Lee", "attendees": 40})
+
+    def test_fences_prose_and_trailing_commas(self):
+        text = 'Here you go:\n```json\n{"purpose": "workshop", "attendees": [1, 2,],}\n```'
+        self.assertEqual(repair_json(text), {"purpose": "workshop", "attendees": [1, 2]})
+
+    def test_python_literals_outside_strings(self):
+        text = "{'client_name': 'Ann', 'special_requests': None, 'catering': True, 'parking': False,}"
+        self.assertEqual(repair_json(text), {"client_name": "Ann", "special_requests": None,
+                                             "catering": True, "parking": False})
+
+    def test_literal_words_inside_strings_are_kept(self):
+        text = '{"client_name": "None Such", "purpose": "True Crime Night", "special_requests": None}'
+        self.assertEqual(repair_json(text), {"client_name": "None Such", "purpose": "True Crime Night",
+                                             "special_requests": None})
+
+    def test_apostrophes_inside_double_quoted_strings(self):
+        text = '''{"client_name": "O'Brien's Bar", "purpose": "Pat's 'surprise' party", "attendees": None}'''
+        self.assertEqual(repair_json(text), {"client_name": "O'Brien's Bar",
+                                             "purpose": "Pat's 'surprise' party", "attendees": None})
+
+    def test_single_quoted_strings_with_quotes_inside(self):
+        text = r"""{'client_name': 'O\'Brien', 'purpose': 'a "None" theme, False start', 'attendees': 12}"""
+        self.assertEqual(repair_json(text), {"client_name": "O'Brien",
+                                             "purpose": 'a "None" theme, False start', "attendees": 12})
+
+    def test_unrecoverable_text(self):
+        with self.assertRaises(ValueError):
+            repair_json("no object here")
+        with self.assertRaises(ValueError):
+            repair_json("{'client_name': }")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Escalation of booking extractions along the model chain. The model calls are
+stubbed, so these run without network access:
+    cd backend && python -m pytest test_gemini_integration.py
+"""
+import asyncio
+import json
+import unittest
+
+from gemini_integration import GeminiEmailProcessor
+
+FLASH, PRO = "gemini-1.5-flash", "gemini-1.5-pro"
+
+VALID_BOOKING = {
+    "client_name": "Ann Lee",
+    "client_email": "ann@example.com",
+    "requested_date": "2031-05-04",
+    "start_time": "14:00",
+    "end_time": "17:00",
+    "purpose": "workshop",
+    "attendees": 40,
+    "special_requests": None,
+}
+
+
+class RecordingCache:
+    """A dict cache that records which keys were deleted."""
+    def __init__(self):
+        self.entries = {}
+        self.deleted = []
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, ttl):
+        self.entries[key] = value
+
+    def delete(self, key):
+        self.deleted.append(key)
+        self.entries.pop(key, None)
+
+
+class BookingEscalationTest(unittest.TestCase):
+    def make_processor(self, responses):
+        """A processor whose models answer with responses[model_name]."""
+        processor = GeminiEmailProcessor(model_name=PRO, cache=RecordingCache())
+        calls = []
+
+        def call_model(prompt, task, model_name):
+            calls.append(model_name)
+            return responses[model_name]
+
+        async def call_model_async(prompt, task, model_name):
+            return call_model(prompt, task, model_name)
+
+        processor._call_model = call_model
+        processor._call_model_async = call_model_async
+        return processor, calls
+
+    def analyze_both(self, processor):
+        """Run the sync and async paths, clearing the cache in between."""
+        result = processor.analyze_booking_request("email body")
+        processor.cache.entries.clear()
+        async_result = asyncio.run(processor.analyze_booking_request_async("email body"))
+        return result, async_result
+
+    def forgotten(self, processor, model_name):
+        prompt = processor._booking_analysis_prompt("email body")
+        return processor._cache_key(prompt, "analysis", model_name=model_name) in processor.cache.deleted
+
+    def test_every_model_partially_invalid(self):
+        booking = json.dumps({**VALID_BOOKING, "client_email": "not-an-email", "attendees": "lots"})
+        processor, calls = self.make_processor({FLASH: booking, PRO: booking})
+        for result in self.analyze_both(processor):
+            self.assertEqual(result["client_name"], "Ann Lee")
+            self.assertIsNone(result["attendees"])
+            self.assertEqual(set(result["field_errors"]), {"client_email", "attendees"})
+            self.assertNotIn("error", result)
+        self.assertEqual(calls, [FLASH, PRO, FLASH, PRO])
+        self.assertEqual(processor.cache.deleted, [])
+
+    def test_optional_field_failure_does_not_escalate(self):
+        booking = json.dumps({**VALID_BOOKING, "client_email": "not-an-email"})
+        processor, calls = self.make_processor({FLASH: booking, PRO: json.dumps(VALID_BOOKING)})
+        for result in self.analyze_both(processor):
+            self.assertEqual(set(result["field_errors"]), {"client_email"})
+            self.assertEqual(result["start_time"], "14:00")
+        self.assertEqual(calls, [FLASH, FLASH])
+        self.assertEqual(processor.cache.deleted, [])
+
+    def test_required_field_failure_escalates(self):
+        booking = json.dumps({**VALID_BOOKING, "requested_date": "someday"})
+        processor, calls = self.make_processor({FLASH: booking, PRO: json.dumps(VALID_BOOKING)})
+        for result in self.analyze_both(processor):
+            self.assertEqual(result["requested_date"], "2031-05-04")
+            self.assertNotIn("field_errors", result)
+        self.assertEqual(calls, [FLASH, PRO, FLASH, PRO])
+        self.assertEqual(processor.cache.deleted, [])
+
+    def test_repeated_escalation_is_served_from_the_cache(self):
+        booking = json.dumps({**VALID_BOOKING, "requested_date": "someday"})
+        processor, calls = self.make_processor({FLASH: booking, PRO: json.dumps(VALID_BOOKING)})
+        first = processor.analyze_booking_request("email body")
+        repeated = [processor.analyze_booking_request("email body"),
+                    asyncio.run(processor.analyze_booking_request_async("email body"))]
+        for result in repeated:
+            self.assertEqual(result, first)
+        self.assertEqual(calls, [FLASH, PRO])
+
+    def test_unparseable_everywhere(self):
+        processor, calls = self.make_processor({FLASH: "not json", PRO: "still not json"})
+        for result in self.analyze_both(processor):
+            self.assertIn("error", result)
+            self.assertIsNone(result["client_name"])
+        self.assertFalse(self.forgotten(processor, FLASH))
+        self.assertTrue(self.forgotten(processor, PRO))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+"""
+Incremental IMAP fetching against an in-memory stand-in for imaplib.IMAP4, so
+these run without a mail server:
+    cd backend && python -m pytest test_imap_fetch.py
+"""
+import base64
+import os
+import re
+import tempfile
+import unittest
+
+from imap_fetch import ImapCheckpoint, ImapFetcher, parse_fetch_response, text_parts, uid_set
+
+PLAIN_STRUCTURE = b'("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "QUOTED-PRINTABLE" 40 1 NIL NIL NIL NIL)'
+
+# multipart/mixed: an alternative (plain + html), a PDF and a text attachment
+MIXED_STRUCTURE = (
+    b'((("TEXT" "PLAIN" ("CHARSET" "iso-8859-1") NIL NIL "BASE64" 20 1 NIL NIL NIL NIL)'
+    b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "7BIT" 30 1 NIL NIL NIL NIL) "ALTERNATIVE" ("BOUNDARY" "b2") NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "quote.pdf") NIL NIL "BASE64" 1000 NIL ("ATTACHMENT" ("FILENAME" "quote.pdf")) NIL NIL)'
+    b'("TEXT" "PLAIN" ("NAME" "notes.txt") NIL NIL "7BIT" 10 1 NIL ("ATTACHMENT" ("FILENAME" "notes.txt")) NIL NIL)'
+    b' "MIXED" ("BOUNDARY" "b1") NIL NIL NIL)'
+)
+
+
+class FakeMessage:
+    def __init__(self, subject, structure, parts, seen=False):
+        self.header = f"From: Ann Lee <ann@example.com>\r\nSubject: {subject}\r\n\r\n".encode('ascii')
+        self.structure = structure
+        self.parts = parts
+        self.seen = seen
+
+
+def plain_message(subject, body, seen=False):
+    return FakeMessage(subject, PLAIN_STRUCTURE, {'1': body.encode('ascii')}, seen)
+
+
+class FakeIMAP:
+    """
+    Just enough of imaplib.IMAP4 for ImapFetcher, answering in imaplib's response
+    shapes. Like a real server, a BODY[...] fetch sets \\Seen and BODY.PEEK[...] doesn't.
+    """
+    def __init__(self, messages, uidvalidity=1):
+        self.messages = messages
+        self.uidvalidity = uidvalidity
+        self.commands = []
+        self.fail_fetches_after = None
+
+    def select(self, mailbox):
+        return 'OK', [str(len(self.messages)).encode('ascii')]
+
+    def response(self, code):
+        return code, [str(self.uidvalidity).encode('ascii')]
+
+    def uid(self, command, *args):
+        self.commands.append((command,) + args)
+        return getattr(self, f"_{command.lower()}")(*args)
+
+    def _expand(self, uids):
+        expanded = []
+        for piece in uids.split(','):
+            first, _, last = piece.partition(':')
+            expanded.extend(range(int(first), int(last or first) + 1))
+        return [uid for uid in expanded if uid in self.messages]
+
+    def _search(self, charset, criteria):
+        if criteria == 'UNSEEN':
+            uids = [uid for uid, message in self.messages.items() if not message.seen]
+        else:
+            start = int(re.match(r'UID (\d+):\*', criteria).group(1))
+            # "n:*" always includes the newest message
+            uids = {uid for uid in self.messages if uid >= start} | {max(self.messages)}
+        return 'OK', [' '.join(str(uid) for uid in sorted(uids)).encode('ascii')]
+
+    def _fetch(self, uids, items):
+        fetches = sum(1 for command in self.commands if command[0] == 'FETCH')
+        if self.fail_fetches_after is not None and fetches > self.fail_fetches_after:
+            return 'NO', [b'fetch failed']
+        data = []
+        order = sorted(self.messages)
+        for uid in self._expand(uids):
+            message = self.messages[uid]
+            prefix = f"{order.index(uid) + 1} (UID {uid}".encode('ascii')
+            if 'BODYSTRUCTURE' in items:
+                data.append((prefix + b' BODYSTRUCTURE ' + message.structure
+                             + f" BODY[HEADER.FIELDS (FROM TO SUBJECT DATE)] {{{len(message.header)}}}".encode('ascii'),
+                             message.header))
+            else:
+                for peek, section in re.findall(r'BODY(\.PEEK)?\[([^\]]*)\]', items):
+                    if not peek:
+                        message.seen = True
+                    payload = message.parts[section]
+                    data.append((prefix + f" BODY[{section}] {{{len(payload)}}}".encode('ascii'), payload))
+                    prefix = b''
+            data.append(b')')
+        return 'OK', data
+
+    def _store(self, uids, command, flags):
+        for uid in self._expand(uids):
+            self.messages[uid].seen = True
+        return 'OK', []
+
+
+class ParseFetchResponseTest(unittest.TestCase):
+    def test_literals_nested_lists_and_nil(self):
+        data = [
+            (b'1 (UID 101 FLAGS (\\Seen) BODY[HEADER.FIELDS (SUBJECT)] {14}', b'Subject: Hi\r\n'),
+            b' INTERNALDATE "01-Jan-2031 10:00:00 +0000" X-NOTE NIL)',
+            (b'2 (UID 102 BODY[1] {5}', b'hello'),
+            (b' BODY[2] {3}', b'abc'),
+            b')',
+        ]
+        messages = parse_fetch_response(data)
+        self.assertEqual(set(messages), {101, 102})
+        self.assertEqual(messages[101]['FLAGS'], [b'\\Seen'])
+        self.assertEqual(messages[101]['BODY[HEADER.FIELDS (SUBJECT)]'], b'Subject: Hi\r\n')
+        self.assertEqual(messages[101]['INTERNALDATE'], b'01-Jan-2031 10:00:00 +0000')
+        self.assertIsNone(messages[101]['X-NOTE'])
+        self.assertEqual(messages[102]['BODY[1]'], b'hello')
+        self.assertEqual(messages[102]['BODY[2]'], b'abc')
+
+    def test_ignores_none_and_lines_without_uid(self):
+        self.assertEqual(parse_fetch_response([None, b'3 (FLAGS (\\Seen))']), {})
+
+    def test_uid_set(self):
+        self.assertEqual(uid_set([1, 2, 3, 7, 9, 10]), "1:3,7,9:10")
+
+
+class TextPartsTest(unittest.TestCase):
+    def structure(self, raw):
+        return parse_fetch_response([b'1 (UID 7 BODYSTRUCTURE ' + raw + b')'])[7]['BODYSTRUCTURE']
+
+    def test_single_part(self):
+        self.assertEqual(text_parts(self.structure(PLAIN_STRUCTURE)), [
+            {'section': '1', 'subtype': 'plain', 'encoding': 'quoted-printable', 'charset': 'utf-8'}])
+
+    def test_multipart_skips_attachments(self):
+        self.assertEqual(text_parts(self.structure(MIXED_STRUCTURE)), [
+            {'section': '1.1', 'subtype': 'plain', 'encoding': 'base64', 'charset': 'iso-8859-1'},
+            {'section': '1.2', 'subtype': 'html', 'encoding': '7bit', 'charset': 'utf-8'},
+        ])
+
+    def test_attached_message_is_skipped(self):
+        raw = (b'(' + PLAIN_STRUCTURE + b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 500 NIL NIL NIL NIL)'
+               b' "MIXED" ("BOUNDARY" "b1") NIL NIL NIL)')
+        self.assertEqual([part['section'] for part in text_parts(self.structure(raw))], ['1'])
+
+
+class ImapFetcherTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.checkpoint_path = os.path.join(tmp.name, 'checkpoint.json')
+        self.conn = FakeIMAP({
+            101: plain_message("Already read", "old", seen=True),
+            102: plain_message("Booking", "Room for 40 =3D ok"),
+            103: FakeMessage("Quote", MIXED_STRUCTURE, {
+                '1.1': base64.b64encode("Café booking".encode('iso-8859-1')),
+                '1.2': b'<p>Cafe booking</p>',
+                '2': b'%PDF', '3': b'notes'}),
+            104: plain_message("Workshop", "Need a projector"),
+        })
+
+    def fetcher(self, **kwargs):
+        return ImapFetcher(ImapCheckpoint(self.checkpoint_path), batch_size=2, **kwargs)
+
+    def fetches(self):
+        return [command for command in self.conn.commands if command[0] == 'FETCH']
+
+    def test_first_run_fetches_unread_mail_in_uid_batches(self):
+        emails = self.fetcher().fetch_new(self.conn)
+        self.assertEqual([message['uid'] for message in emails], [102, 103, 104])
+        self.assertEqual(emails[0]['body'], "Room for 40 = ok")
+        # Only the plain part of the multipart message is downloaded
+        self.assertEqual(emails[1]['body'], "Café booking")
+        self.assertEqual(emails[1]['subject'], "Quote")
+        self.assertEqual(emails[1]['from'], "Ann Lee <ann@example.com>")
+        self.assertEqual([command[1] for command in self.fetches()], ['102:103', '102', '103', '104', '104'])
+        self.assertEqual(ImapCheckpoint(self.checkpoint_path).get('inbox', 1), 104)
+
+    def test_resumes_from_the_checkpoint(self):
+        self.fetcher().fetch_new(self.conn)
+        self.conn.commands.clear()
+        # Nothing new: "105:*" still matches 104, which must not be fetched again
+        self.assertEqual(self.fetcher().fetch_new(self.conn), [])
+        self.assertEqual(self.fetches(), [])
+
+        self.conn.messages[105] = plain_message("Late", "One more", seen=True)
+        emails = self.fetcher().fetch_new(self.conn)
+        self.assertEqual([message['uid'] for message in emails], [105])
+        self.assertIn(('SEARCH', None, 'UID 105:*'), self.conn.commands)
+
+    def test_uidvalidity_change_discards_the_checkpoint(self):
+        self.fetcher().fetch_new(self.conn)
+        renumbered = FakeIMAP({1: plain_message("Renumbered", "again")}, uidvalidity=2)
+        self.assertEqual([message['uid'] for message in self.fetcher().fetch_new(renumbered)], [1])
+        self.assertIn(('SEARCH', None, 'UNSEEN'), renumbered.commands)
+
+    def test_failed_batch_keeps_earlier_batches_and_resumes(self):
+        # The first batch needs three FETCHes (headers, then one per part layout)
+        self.conn.fail_fetches_after = 3
+        with self.assertRaises(Exception):
+            self.fetcher().fetch_new(self.conn)
+        self.assertEqual(ImapCheckpoint(self.checkpoint_path).get('inbox', 1), 103)
+        self.assertFalse(self.conn.messages[104].seen)
+
+        self.conn.fail_fetches_after = None
+        self.assertEqual([message['uid'] for message in self.fetcher().fetch_new(self.conn)], [104])
+
+    def test_fetching_does_not_mark_mail_seen(self):
+        self.fetcher(mark_seen=False).fetch_new(self.conn)
+        self.assertEqual([uid for uid, message in self.conn.messages.items() if message.seen], [101])
+        for command in self.fetches():
+            self.assertNotRegex(command[2], r'BODY\[')
+
+    def test_seen_is_stored_once_per_batch_after_fetching(self):
+        self.fetcher().fetch_new(self.conn)
+        self.assertTrue(all(message.seen for message in self.conn.messages.values()))
+        commands = [command[:2] for command in self.conn.commands if command[0] in ('FETCH', 'STORE')]
+        self.assertEqual(commands, [
+            ('FETCH', '102:103'), ('FETCH', '102'), ('FETCH', '103'), ('STORE', '102:103'),
+            ('FETCH', '104'), ('FETCH', '104'), ('STORE', '104'),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
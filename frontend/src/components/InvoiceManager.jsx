@@ -1,39 +1,53 @@
 import React, { useState, useEffect } from 'react';
 import { FaDownload, FaEye, FaTrash, FaSearch, FaSpinner } from 'react-icons/fa';
 
+// Invoices fetched per request; more pages load on demand
+const INVOICE_PAGE_SIZE = 50;
+
 const InvoiceManager = () => {
   const [invoices, setInvoices] = useState([]);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
   const [selectedInvoice, setSelectedInvoice] = useState(null);
   const [showInvoiceModal, setShowInvoiceModal] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   
   useEffect(() => {
     fetchInvoices();
   }, []);
   
-  const fetchInvoices = async () => {
-    setLoading(true);
+  // Fetches one page of invoices: the first page replaces the list, later pages (cursor given) are appended
+  const fetchInvoices = async (cursor = null) => {
+    if (cursor) {
+      setLoadingMore(true);
+    } else {
+      setLoading(true);
+    }
     try {
-      // Fetch invoices from the backend API
-      const response = await fetch('http://localhost:8080/api/invoices');
+      const params = new URLSearchParams({ limit: String(INVOICE_PAGE_SIZE), fields: 'invoice_data,total' });
+      if (cursor) params.set('cursor', cursor);
+      const response = await fetch(`http://localhost:8080/api/invoices?${params}`);
       
       if (!response.ok) {
         throw new Error('Failed to fetch invoices');
       }
       
       const data = await response.json();
+      const fetchedInvoices = data.invoices;
+      setNextCursor(data.next_cursor);
       
-      // Transform the invoice data to match our component's expected format
-      const formattedInvoices = data.invoices.map(invoice => {
+      // Transform the invoice data to match our component's expected format.
+      // The list has no HTML; it is loaded from the detail endpoint when an invoice is opened.
+      const formattedInvoices = fetchedInvoices.map(invoice => {
         const invoiceData = invoice.invoice_data || {};
         const clientData = invoiceData.client || {};
         const bookingData = invoiceData.booking || {};
         
-        // Calculate the total from the data for consistency
-        const subtotal = invoiceData.subtotal || 0;
-        const tax = invoiceData.tax || 0; 
-        const total = invoiceData.total || (subtotal + tax);
+        // The store keeps the total as a number; model-written invoice data may hold text like "$1,234.00"
+        const subtotal = Number(invoiceData.subtotal) || 0;
+        const tax = Number(invoiceData.tax) || 0; 
+        const total = invoice.total ?? (subtotal + tax);
         
         return {
           id: invoiceData.invoice_number || 'Unknown',
@@ -53,13 +67,15 @@ const InvoiceManager = () => {
           createdAt: invoiceData.invoice_date || new Date().toISOString().split('T')[0],
           dueDate: invoiceData.due_date || '',
           paidAt: null,
-          html_content: invoice.html_content || '',
+          html_content: null,
           raw_data: invoice
         };
       });
       
-      // If we don't have any real invoices yet, add some mock data
-      if (formattedInvoices.length === 0) {
+      if (cursor) {
+        setInvoices(current => [...current, ...formattedInvoices]);
+      } else if (formattedInvoices.length === 0) {
+        // If we don't have any real invoices yet, add some mock data
         const mockInvoices = [
           {
             id: 'INV1001',
@@ -107,10 +123,12 @@ const InvoiceManager = () => {
       } else {
         setInvoices(formattedInvoices);
       }
-      
-        setLoading(false);
     } catch (error) {
       console.error('Error fetching invoices:', error);
+      if (cursor) {
+        // Keep the invoices already shown; the next click retries this page
+        return;
+      }
       
       // Fallback to mock data if the API fails
       const mockInvoices = [
@@ -157,13 +175,38 @@ const InvoiceManager = () => {
       ];
       
       setInvoices(mockInvoices);
+      setNextCursor(null);
+    } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
   
-  const handleViewInvoice = (invoice) => {
+  // Load an invoice's HTML from the detail endpoint (the list doesn't include it)
+  const fetchInvoiceHtml = async (invoiceId) => {
+    const response = await fetch(`http://localhost:8080/api/invoices/${encodeURIComponent(invoiceId)}`);
+    
+    if (!response.ok) {
+      throw new Error(`Failed to fetch invoice ${invoiceId}`);
+    }
+    
+    const data = await response.json();
+    return data.invoice.html_content || '';
+  };
+  
+  const handleViewInvoice = async (invoice) => {
     setSelectedInvoice(invoice);
     setShowInvoiceModal(true);
+    
+    // Mock invoices carry their HTML; real ones fetch it once and keep it
+    if (invoice.html_content !== null) return;
+    try {
+      const html_content = await fetchInvoiceHtml(invoice.id);
+      setInvoices(current => current.map(inv => inv.id === invoice.id ? {...inv, html_content} : inv));
+      setSelectedInvoice(current => current && current.id === invoice.id ? {...current, html_content} : current);
+    } catch (error) {
+      console.error('Error fetching invoice HTML:', error);
+    }
   };
   
   const handleCloseModal = () => {
@@ -510,6 +553,25 @@ const InvoiceManager = () => {
               </tbody>
             </table>
           )}
+          {!loading && nextCursor && (
+            <div style={{ padding: '15px', textAlign: 'center' }}>
+              <button
+                className="btn"
+                onClick={() => fetchInvoices(nextCursor)}
+                disabled={loadingMore}
+                style={{ 
+                  backgroundColor: '#0f3b64', 
+                  color: 'white', 
+                  border: 'none', 
+                  borderRadius: '4px', 
+                  padding: '8px 16px', 
+                  cursor: loadingMore ? 'default' : 'pointer' 
+                }}
+              >
+                {loadingMore ? <><FaSpinner style={{ animation: 'spin 2s linear infinite' }} /> Loading...</> : 'Load more'}
+              </button>
+            </div>
+          )}
         </div>
         
         <div className="invoice-stats card" style={{ border: '1px solid #e0e0e0', borderRadius: '8px', boxShadow: '0 2px 10px rgba(0,0,0,0.1)', overflow: 'hidden', marginTop: '20px' }}>
@@ -64,42 +64,25 @@ const WeeklyFinancialDigest = () => {
   };
 
   useEffect(() => {
+    let insightsSource = null;
+
     const fetchData = async () => {
       try {
         setLoading(true);
         setError(null);
         
-        // Add timestamp to URL to prevent caching
-        const timestamp = new Date().getTime();
-        
-        // Try to fetch revenue data
+        // Try to fetch revenue data; the insights are streamed separately below
         try {
-          const revenueRes = await fetchWithRetry(`http://localhost:5001/api/weekly-revenue?t=${timestamp}`);
-          if (revenueRes.ok) {
-            const revenueData = await revenueRes.json();
-            setRevenueData(revenueData.revenue_data);
-            setInsights(revenueData.insights || 'No insights available.');
-          } else {
-            console.warn('Could not fetch revenue data:', revenueRes.status);
-            setInsights('Unable to load revenue insights at this time.');
-          }
+          const revenueRes = await fetchWithRetry('http://localhost:5001/api/revenue-data');
+          const revenueData = await revenueRes.json();
+          setRevenueData(revenueData.revenue_data);
         } catch (err) {
           console.error('Revenue data fetch error:', err);
         }
         
-        // Try to fetch forecast plot
-        try {
-          setForecastPlot(`http://localhost:5001/api/forecast-plot?t=${timestamp}`);
-        } catch (err) {
-          console.error('Forecast plot fetch error:', err);
-        }
-        
-        // Try to fetch revenue plot
-        try {
-          setRevenuePlot(`http://localhost:5001/api/revenue-plot?t=${timestamp}`);
-        } catch (err) {
-          console.error('Revenue plot fetch error:', err);
-        }
+        // The plots carry ETags, so the browser revalidates them instead of re-downloading
+        setForecastPlot('http://localhost:5001/api/forecast-plot');
+        setRevenuePlot('http://localhost:5001/api/revenue-plot');
       } catch (error) {
         console.error('Error in overall fetch process:', error);
         setError('Failed to load financial data. Please try again later.');
@@ -108,7 +91,31 @@ const WeeklyFinancialDigest = () => {
       }
     };
 
+    // Show the AI insights as the model writes them
+    const streamInsights = () => {
+      let text = '';
+      insightsSource = new EventSource('http://localhost:5001/api/revenue-insights/stream');
+      insightsSource.onmessage = (event) => {
+        text += JSON.parse(event.data);
+        setInsights(text);
+      };
+      insightsSource.addEventListener('done', () => {
+        insightsSource.close();
+        if (!text) setInsights('No insights available.');
+      });
+      // Close on errors too, otherwise EventSource reconnects and asks the model again
+      insightsSource.onerror = () => {
+        insightsSource.close();
+        if (!text) setInsights('Unable to load revenue insights at this time.');
+      };
+    };
+
     fetchData();
+    streamInsights();
+
+    return () => {
+      if (insightsSource) insightsSource.close();
+    };
   }, []);
 
   if (loading) {